@@ -337,4 +337,174 @@ allowed additionals:
 - planNameCSAndDFO      : N/A
 - planNameCSAndDFOAndEUD: N/A
 - planNameFinalTouches  : prothese, dfo, dmax, dose, ring>PTV_DL2
-"""
\ No newline at end of file
+"""
+######################################################################
+# COHORT KEYS
+######################################################################
+
+KEYNAME_MODALITY        = 'modality'
+KEYNAME_MODALITY_PHOTON = 'photon'
+KEYNAME_MODALITY_PROTON = 'proton'
+MODULE_MODALITY = {
+    KEYNAME_MODALITY_PHOTON  : 'hnDosePhotons'
+    , KEYNAME_MODALITY_PROTON: 'hnDoseProtons'
+}
+
+KEYNAME_STATUS   = 'status'
+KEYNAME_ATTEMPTS = 'attempts'
+KEYNAME_ERROR    = 'error'
+KEYNAME_PATIENTS = 'patients'
+KEYNAME_SUMMARY  = 'summary'
+
+FILENAME_COHORT_SUMMARY = 'cohortSummary-{}.json'
+
+KEYNAME_RS_INSTANCES = 'rsInstances'    # (optional) process ids of the RayStation instances for the cohort workers (one worker per instance)
+KEYNAME_RS_INSTANCE  = 'rsInstance'     # RayStation instance a patient ran on
+ENV_RS_INSTANCE      = 'RAYSTATION_PID' # read by connect to pick the RayStation instance to attach to
+
+FILENAME_COHORT_PREFLIGHT = 'cohortPreflight-{}.json'
+KEYNAME_GO       = 'go'       # preflight verdict of a patient
+KEYNAME_ERRORS   = 'errors'   # preflight issues that would make the patient fail (no-go)
+KEYNAME_WARNINGS = 'warnings' # preflight issues that may affect the results
+
+######################################################################
+# STAGE LEDGER KEYS
+######################################################################
+
+FILENAME_STAGE_LEDGER = 'stageLedger.json'
+
+KEYNAME_INPUTS_HASH   = 'inputsHash'
+KEYNAME_TIMESTAMP     = 'timestamp'
+KEYNAME_RUN_ID        = 'runId' # changes with every (re-)run of a stage, see helpers.getStageInputsHash()
+KEYNAME_STAGE_RUNNING = 'running'
+KEYNAME_STAGE_DONE    = 'done'
+KEYNAME_STAGE_FAILED  = 'failed'
+
+######################################################################
+# STAGE DAG KEYS
+######################################################################
+
+KEYNAME_STAGE_UPLOAD        = 'upload'
+KEYNAME_STAGE_AUTOCONTOUR   = 'autoContouring'
+KEYNAME_STAGE_EVAL_CLINICAL = 'evalClinical'
+KEYNAME_STAGE_EVAL_AUTO     = 'evalAuto'
+KEYNAME_STAGE_EVAL_ALL      = 'evalAll'
+KEYNAME_STAGE_NTCP          = 'ntcp'
+KEYNAME_STAGE_ROBUST        = 'robust-{}'
+KEYNAME_STAGE_REPORT        = '{}-report' # offline (usesRS=False) part of a stage, e.g. saving/printing the results of evalClinical or robust-<planName>
+
+KEYNAME_DEBUG_STAGES = 'debugStages' # (optional) for config.KEYNAME_CONTOUR_DEBUG, list of stage names to run
+KEYNAME_MAX_WORKERS  = 'maxWorkers'  # (optional) number of worker threads for the offline (usesRS=False) stages, see helpers.runStageDAG()
+
+######################################################################
+# SCENARIO DOSE STORE KEYS
+######################################################################
+
+FILENAME_SCENARIO_DOSES         = 'scenarioDoses-{}.npy'         # memmap of (scenario, z, y, x) float32 doses
+FILENAME_SCENARIO_DOSES_META    = 'scenarioDoses-{}.json'        # grid geometry and perturbation of each scenario
+FILENAME_SCENARIO_DOSES_NOMINAL = 'scenarioDoses-{}-nominal.npy' # nominal (total) dose, on the same grid
+FILENAME_SCENARIO_DOSES_MASKS   = 'scenarioDoses-{}-masks.npz'   # sparse ROI masks (voxel indices and relative volumes) on the same grid
+KEYNAME_SAVE_SCENARIO_DOSES     = 'saveScenarioDoses'
+KEYNAME_NUMBER_OF_FRACTIONS     = 'NumberOfFractions'            # scenario doses are fraction doses
+
+# prescribed dose (cGy) for the relative goals (e.g. 'CTV_DL2 [D2%<107%]') of the robust template (others use ROBUST_GOAL_PRESCRIPTION_DEFAULT)
+ROBUST_GOAL_PRESCRIPTIONS        = {'CTV_DL1': CTV_DL1_MAX, 'CTV_DL2': CTV_DL2_MAX}
+ROBUST_GOAL_PRESCRIPTION_DEFAULT = CTV_DL2_MAX
+
+KEYNAME_GRID_CORNER       = 'Corner'
+KEYNAME_GRID_VOXELSIZE    = 'VoxelSize'
+KEYNAME_GRID_NRVOXELS     = 'NrVoxels'
+KEYNAME_ISOCENTER_SHIFT   = 'IsoCenterShift'
+KEYNAME_DENSITY_SHIFT     = 'RelativeDensityShift'
+
+######################################################################
+# OBJECTIVE DIFF KEYS
+######################################################################
+
+FILENAME_OBJECTIVE_DIFF = 'objectiveDiff-{}.json' # per plan, the reconciliation of RS objectives with the template objectives
+
+KEYNAME_OBJECTIVE_UPDATE = 'update' # existing RS objective, weight/dose level(s) set from template
+KEYNAME_OBJECTIVE_ADD    = 'add'    # template objective not in RS, added
+KEYNAME_OBJECTIVE_IGNORE = 'ignore' # ROI ignored for this plan (see checkIfRoiIgnore())
+KEYNAME_OBJECTIVE_SKIP   = 'skip'   # function type not updated in this plan, zero weight etc
+
+######################################################################
+# OPTIMIZATION CONVERGENCE KEYS
+######################################################################
+
+# config.KEYNAME_OPT_STEPS_RE can be an int (fixed number of RunOptimization() calls) or a dict with the keys below (adaptive)
+KEYNAME_OPT_MIN_STEPS     = 'minSteps'     # always do at least these many runs
+KEYNAME_OPT_MAX_STEPS     = 'maxSteps'     # never do more than these many runs
+KEYNAME_OPT_CONVERGE_RUNS = 'convergeRuns' # k, compare the objective with the one k runs ago
+KEYNAME_OPT_CONVERGE_TOL  = 'convergeTol'  # stop when the relative objective improvement over the last k runs is below this
+OPT_CONVERGE_RUNS = 1
+OPT_CONVERGE_TOL  = 0.01
+
+KEYNAME_OBJ_TRAJECTORY = 'objTrajectory' # (in config.FILENAME_STAGE_LEDGER) objective values of all iterations, per optimization run
+
+######################################################################
+# WARM START KEYS
+######################################################################
+
+FILENAME_WARM_START   = 'warmStart.json' # per stage, the plan it started from and why
+KEYNAME_WARM_START    = 'warmStart'      # (optional) if True, the auto-contour chain may start from the clinical class-solution plan
+KEYNAME_BASE_PLAN     = 'basePlanName'
+KEYNAME_DICE          = 'dice'
+WARM_START_MIN_DICE   = 0.9 # all (renamed) auto-contours should overlap at least this much with their clinical contours
+
+######################################################################
+# DICOM PREP KEYS
+######################################################################
+
+DICOM_MAX_WORKERS = 8 # threads to read/patch DICOM files with (I/O bound)
+
+FILENAME_DICOM_MANIFEST = 'dicomManifest.json' # per patient folder, {relative file path: header info}, see helpers.getDicomManifest()
+DICOM_MANIFEST_TAGS     = ['Modality', 'PatientID', 'StudyInstanceUID', 'SeriesInstanceUID', 'SOPInstanceUID']
+KEYNAME_FOLDER = 'folder'
+KEYNAME_SIZE   = 'size'
+KEYNAME_MTIME  = 'mtime'
+
+######################################################################
+# NTCP UNCERTAINTY KEYS
+######################################################################
+
+# The KNO models are published without coefficient uncertainties, so coefficient draws use a relative SD (assumption, tune per model)
+NTCP_MC_DRAWS              = 10000
+NTCP_MC_COEFFICIENT_REL_SD = 0.1          # SD of each model coefficient as a fraction of its value
+NTCP_MC_DOSE_SD_GY         = 1.0          # SD of each ROI mean dose, used when no (robust) dose scenarios are given
+NTCP_MC_CREDIBLE_INTERVAL  = (2.5, 97.5)  # percentiles
+
+KEYNAME_NTCP_MEAN   = 'mean'
+KEYNAME_NTCP_MEDIAN = 'median'
+KEYNAME_NTCP_LOWER  = 'lower'
+KEYNAME_NTCP_UPPER  = 'upper'
+
+######################################################################
+# PATIENT REGISTRY KEYS
+######################################################################
+
+# One row per patient (see patientRegistry.py), enum columns hold the member names of the helpers.TreatmentType/NtcpKno* enums
+FILENAME_PATIENT_REGISTRY      = 'patient-registry.csv'
+KEYNAME_PATH_PATIENT_REGISTRY  = 'pathPatientRegistry'
+KEYNAME_TUMOR_LOCATION         = 'tumorLocation'       # NtcpKnoDysphagia.TumorLocationType, empty = no NTCP
+KEYNAME_TREATMENT_TYPE         = 'treatmentType'       # (optional) TreatmentType
+KEYNAME_BASELINE_XEROSTOMIA    = 'baselineXerostomia'  # (optional) NtcpKnoXerostomia.BaselineType
+KEYNAME_BASELINE_DYSPHAGIA     = 'baselineDysphagia'   # (optional) NtcpKnoDysphagia.BaselineType
+KEYNAME_IS_TOTAL_LARYNGECTOMY  = 'isTotalLaryngectomy' # (optional) true/false
+KEYNAME_PAROTIDS_REMOVED       = 'parotidsRemoved'     # (optional) true/false
+
+PATIENT_REGISTRY_ENUMS = {
+    KEYNAME_TUMOR_LOCATION        : ['ORAL_CAVITY', 'PHARYNX', 'LARYNX']
+    , KEYNAME_TREATMENT_TYPE      : ['PRIMARY', 'POSTOPERATIVE']
+    , KEYNAME_BASELINE_XEROSTOMIA : ['NONE', 'LITTLE', 'SEVERE']
+    , KEYNAME_BASELINE_DYSPHAGIA  : ['GRADE_0_1', 'GRADE_2', 'GRADE_3_4']
+}
+PATIENT_REGISTRY_BOOLS = [KEYNAME_IS_TOTAL_LARYNGECTOMY, KEYNAME_PAROTIDS_REMOVED]
+PATIENT_REGISTRY_DEFAULTS = {
+    KEYNAME_TUMOR_LOCATION          : None
+    , KEYNAME_TREATMENT_TYPE        : 'PRIMARY'
+    , KEYNAME_BASELINE_XEROSTOMIA   : 'NONE'
+    , KEYNAME_BASELINE_DYSPHAGIA    : 'GRADE_0_1'
+    , KEYNAME_IS_TOTAL_LARYNGECTOMY : False
+    , KEYNAME_PAROTIDS_REMOVED      : False
+}
@@ -0,0 +1,140 @@
+"""
+Offline (pydicom only) DICOM helpers, i.e. these do not need RStation (connect) and can be used outside of a scripting session
+    - getDicomManifest: cached index of all DICOM files in a patient folder (used by helpers.uploadRTAppsDataToRStation())
+    - getRTStructRoiNames: ROI names of an RTSTRUCT (used by hnDoseCohort.preflightPatient())
+"""
+
+# Import private modules
+import hnDoseConfig as config
+
+# Import public modules
+import os
+import json
+import logging
+import threading
+import traceback
+import concurrent.futures
+import pydicom
+from pathlib import Path
+
+def print(*args, **kwargs):
+    logging.info(" ".join(map(str, args)), **kwargs)
+
+##########################################################################################
+#                                     DICOM MANIFEST                                     #
+##########################################################################################
+
+LOCK_DICOM_MANIFEST  = threading.Lock() # only guards LOCKS_DICOM_MANIFEST
+LOCKS_DICOM_MANIFEST = {} # {resolved pathPatient: threading.Lock()}, so that different patients can be scanned at the same time
+
+def getDicomManifestLock(pathPatient):
+    """
+    Returns the lock of a patient folder (one manifest file per folder)
+    """
+    with LOCK_DICOM_MANIFEST:
+        return LOCKS_DICOM_MANIFEST.setdefault(str(Path(pathPatient).resolve()), threading.Lock())
+
+def getDicomManifestEntry(pathDicom, stat):
+    """
+    Returns header info (config.DICOM_MANIFEST_TAGS, size and mtime) of a file, or None if it is not a DICOM file
+    """
+
+    try:
+        ds = pydicom.dcmread(str(pathDicom), force=True, stop_before_pixels=True, specific_tags=config.DICOM_MANIFEST_TAGS)
+        if ds.get('SOPInstanceUID', None) is None and ds.get('Modality', None) is None:
+            return None
+        
+        entry = {tag: str(ds.get(tag, '')) for tag in config.DICOM_MANIFEST_TAGS}
+        entry[config.KEYNAME_SIZE]   = stat.st_size
+        entry[config.KEYNAME_MTIME]  = stat.st_mtime
+        return entry
+    
+    except:
+        return None
+
+def getDicomManifest(pathPatient, maxWorkers=config.DICOM_MAX_WORKERS, verbose=False):
+    """
+    Index of all DICOM files in the patient folder (and its subfolders), cached in config.FILENAME_DICOM_MANIFEST
+     - only new/changed files (as per size and mtime) are read again, in parallel
+
+    Returns
+    -------
+    manifest: Dict, {relative file path (posix): {config.DICOM_MANIFEST_TAGS, config.KEYNAME_FOLDER, config.KEYNAME_SIZE, config.KEYNAME_MTIME}}
+    """
+
+    manifest = {}
+    try:
+        with getDicomManifestLock(pathPatient):
+
+            # Step 1 - Read cached manifest
+            pathManifest = Path(pathPatient).joinpath(config.FILENAME_DICOM_MANIFEST)
+            manifestOld  = {}
+            if pathManifest.exists():
+                try:
+                    with open(str(pathManifest), 'r') as fp:
+                        manifestOld = json.load(fp)
+                except:
+                    traceback.print_exc()
+            
+            # Step 2 - Scan folder (only stat() calls)
+            pathsToRead = []
+            for root, _, fileNames in os.walk(str(pathPatient)):
+                for fileName in fileNames:
+                    if fileName == config.FILENAME_DICOM_MANIFEST or fileName.endswith('.tmp'):
+                        continue
+                    pathFile = Path(root).joinpath(fileName)
+                    relPath  = pathFile.relative_to(pathPatient).as_posix()
+                    stat     = pathFile.stat()
+                    entry    = manifestOld.get(relPath, None)
+                    if entry is not None and entry[config.KEYNAME_SIZE] == stat.st_size and entry[config.KEYNAME_MTIME] == stat.st_mtime:
+                        manifest[relPath] = entry
+                    else:
+                        pathsToRead.append([relPath, pathFile, stat])
+            
+            # Step 3 - Read headers of new/changed files
+            if len(pathsToRead):
+                with concurrent.futures.ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+                    entries = list(executor.map(lambda each: getDicomManifestEntry(each[1], each[2]), pathsToRead))
+                for (relPath, _, _), entry in zip(pathsToRead, entries):
+                    if entry is not None:
+                        entry[config.KEYNAME_FOLDER] = relPath.split('/')[0] if '/' in relPath else '' # sub-folder of pathPatient (e.g. CT_{})
+                        manifest[relPath] = entry
+            
+            # Step 4 - Save (if changed)
+            if len(pathsToRead) or len(manifest) != len(manifestOld):
+                pathManifestTmp = Path(pathPatient).joinpath(config.FILENAME_DICOM_MANIFEST + '.tmp')
+                with open(str(pathManifestTmp), 'w') as fp:
+                    json.dump(manifest, fp, indent=4)
+                os.replace(str(pathManifestTmp), str(pathManifest))
+            
+            if verbose:
+                print (f' - [getDicomManifest()] {len(manifest)} DICOM files in {pathPatient} ({len(pathsToRead)} (re-)read)')
+
+    except:
+        traceback.print_exc()
+    
+    return manifest
+
+def getManifestFolders(manifest, pathPatient, folderPrefix):
+    """
+    Returns a sorted list of folders (in pathPatient) starting with folderPrefix that contain DICOM files
+    """
+    folderNames = set(entry[config.KEYNAME_FOLDER] for entry in manifest.values() if len(entry[config.KEYNAME_FOLDER]) and entry[config.KEYNAME_FOLDER].startswith(folderPrefix))
+    return [Path(pathPatient).joinpath(folderName) for folderName in sorted(folderNames)]
+
+def getManifestSeries(manifest, pathFolder):
+    """
+    Returns [(PatientID, StudyInstanceUID, SeriesInstanceUID)] of all series in the folder
+    """
+    series = set()
+    for entry in manifest.values():
+        if entry[config.KEYNAME_FOLDER] == Path(pathFolder).name:
+            series.add((entry['PatientID'], entry['StudyInstanceUID'], entry['SeriesInstanceUID']))
+    return sorted(series)
+
+def getRTStructRoiNames(pathRTStruct):
+    """
+    Returns the ROI names (StructureSetROISequence) of an RTSTRUCT file, without reading its contours
+    """
+    ds = pydicom.dcmread(str(pathRTStruct), force=True, specific_tags=['StructureSetROISequence'])
+    return [str(structureSet.ROIName) for structureSet in ds.get('StructureSetROISequence', [])]
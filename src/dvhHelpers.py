@@ -0,0 +1,405 @@
+"""
+Offline (pure NumPy) DVH helpers, i.e. these do not need RStation (connect) and can be used with exported dose grids and ROI masks
+    - DVHEngine: cumulative DVH per ROI from a dose array and fractional ROI masks, answering the labels of assets/eval-template-photon.csv
+    - untangle_dvhparam_string: parser for those labels
+    - parseDVHLabel/getDVHQueryPlan: compiled and memoized version of that parser (used by helpers.evaluatePlans())
+    - parseRobustGoalKey: parser for the keys of assets/eval-template-proton-robust.json (used by helpers.evaluateRobustTemplateFromStore())
+"""
+
+# Import public modules
+import re
+import types
+import logging
+import functools
+import traceback
+import collections
+import numpy as np
+
+def print(*args, **kwargs):
+    logging.info(" ".join(map(str, args)), **kwargs)
+
+ROI_EXTERNAL_OPTIONS = ['External', 'Body'] # same as in helpers.calc_dvhparam()
+
+##########################################################################################
+#                                     FRANKS CODE                                        #
+##########################################################################################
+
+def untangle_dvhparam_string(dvhparam_label, verbose=False):
+    output_quantity = ''
+    output_unit = ''
+    input_value = ''
+    input_unit = ''
+    untangle_status = ''
+
+    # untangle the dvh parameter string using regexp
+    if verbose: print(f"\t\t{dvhparam_label}")
+    if dvhparam_label == 'Volume':
+        output_quantity = 'V'
+        output_unit = 'cc'
+        untangle_status = 1
+    elif 'Dmin' in dvhparam_label or 'Dmax' in dvhparam_label or 'Dmean' in dvhparam_label:
+        output_quantity = 'D'
+        output_unit = re.search('\((.*)\)', dvhparam_label).group(1)            # string between brackets ()
+        untangle_status = 1
+    elif dvhparam_label[0:1] in ['V', 'D', 'C','H']:
+        output_quantity = re.findall('([a-zA-Z]*)\d*.*', dvhparam_label)[0]     # string till numeric
+        input_value = re.findall(r"[-+]?\d*\.?\d+", dvhparam_label)[0]              # old: r'\d+'     does not work for decimals
+        if output_quantity == 'HI':
+            input_unit = re.search(input_value + '(.*)', dvhparam_label).group(1)  # string after input_value (no space at end)
+        else:
+            input_unit = re.search(input_value + '(.*) ', dvhparam_label).group(1)      # string after input_value and before space
+            output_unit = re.search('\((.*)\)', dvhparam_label).group(1)            # string between brackets ()
+        input_value = float(input_value)
+        untangle_status = 1
+
+    # print
+    if verbose:
+        if untangle_status:
+            print(f"\t\t\toutput_quantity: {output_quantity}   input_value: {input_value}   input_unit: {input_unit}   output_unit: {output_unit}")
+        else:
+            print(f"\t\t\tUnknown format for dvhparam_label")
+
+
+    return(output_quantity, output_unit, input_value, input_unit, untangle_status)
+
+##########################################################################################
+#                                        MY CODE                                         #
+##########################################################################################
+
+########## DVH LABEL PARSER ##########
+
+RE_DVH_OUTPUT_UNIT = re.compile(r'\((.*)\)')          # string between brackets ()
+RE_DVH_QUANTITY    = re.compile(r'([a-zA-Z]*)\d*.*')   # string till numeric
+RE_DVH_INPUT_VALUE = re.compile(r'[-+]?\d*\.?\d+')
+
+DVH_QUANTITIES         = ['V', 'D', 'CI', 'HI']
+DVH_INPUT_UNITS_DOSE   = ['Gy', 'cGy', '%DL1', '%DL2', '%DL3', '%DL4', '%DL5', '%DL6'] # for V, CI
+DVH_INPUT_UNITS_VOLUME = ['cc', '%']                                                # for D
+DVH_OUTPUT_UNITS       = {
+    'V'   : ['%', 'cc']
+    , 'D' : ['Gy', 'cGy', '%DL1', '%DL2', '%DL3', '%DL4', '%DL5', '%DL6']
+    , 'CI': ['RTOG', 'Riet', 'RS']
+    , 'HI': ['']
+}
+
+# immutable, parsed version of a dvh parameter label (doselevelIdx = index of the %DLx doselevel the label refers to, -1 if none)
+DVHQuery = collections.namedtuple('DVHQuery', ['label', 'quantity', 'unit', 'inputValue', 'inputUnit', 'status', 'doselevelIdx'])
+
+@functools.lru_cache(maxsize=None)
+def parseDVHLabel(dvhparam_label):
+    """
+    Same output as untangle_dvhparam_string(), but with precompiled regexps and memoized (i.e. a label is parsed once per process)
+    Labels that cannot be parsed return status=''
+    """
+
+    quantity, unit, inputValue, inputUnit, status = '', '', '', '', ''
+
+    try:
+        if dvhparam_label == 'Volume':
+            quantity, unit, status = 'V', 'cc', 1
+        elif 'Dmin' in dvhparam_label or 'Dmax' in dvhparam_label or 'Dmean' in dvhparam_label:
+            quantity, unit, status = 'D', RE_DVH_OUTPUT_UNIT.search(dvhparam_label).group(1), 1
+        elif dvhparam_label[0:1] in ['V', 'D', 'C','H']:
+            quantity        = RE_DVH_QUANTITY.match(dvhparam_label).group(1)
+            inputValueMatch = RE_DVH_INPUT_VALUE.search(dvhparam_label)
+            labelRemainder  = dvhparam_label[inputValueMatch.end():]
+            if quantity == 'HI':
+                inputUnit = labelRemainder                                       # string after input_value (no space at end)
+            else:
+                inputUnit = labelRemainder[:labelRemainder.rindex(' ')]          # string after input_value and before space
+                unit      = RE_DVH_OUTPUT_UNIT.search(dvhparam_label).group(1)
+            inputValue = float(inputValueMatch.group(0))
+            status     = 1
+    except:
+        quantity, unit, inputValue, inputUnit, status = '', '', '', '', ''
+
+    doselevelIdx = -1
+    for eachUnit in [inputUnit, unit]:
+        if '%DL' in eachUnit:
+            doselevelIdx = int(eachUnit[-1]) - 1
+
+    return DVHQuery(dvhparam_label, quantity, unit, inputValue, inputUnit, status, doselevelIdx)
+
+def getDVHQueryPlan(rois_and_dvhparams):
+    """
+    Params
+    ------
+    rois_and_dvhparams: Dict, output of helpers.read_dvhparamlist_csv_or_txt() i.e. {roi (or 'roi1,roi2' synonyms): [dvhparam_label, ...]}
+
+    Returns
+    -------
+    queryPlan: read-only Dict, {roi_input: (DVHQuery, ...)} (same order as the file)
+    """
+    queryPlan = collections.OrderedDict()
+    for roi_input, dvhparams_labels in rois_and_dvhparams.items():
+        queryPlan[roi_input] = tuple(parseDVHLabel(dvhparam_label) for dvhparam_label in dvhparams_labels)
+
+    return types.MappingProxyType(queryPlan)
+
+def validateDVHQueryPlan(queryPlan):
+    """
+    Returns [(roi_input, dvhparam_label, reason), ...] for labels that helpers.calc_dvhparam() will not be able to process
+    """
+
+    invalid = []
+    for roi_input, dvhQueries in queryPlan.items():
+        for query in dvhQueries:
+            reason = ''
+            if not query.status:
+                reason = 'unknown format'
+            elif query.quantity not in DVH_QUANTITIES:
+                reason = 'unknown quantity ({})'.format(query.quantity)
+            elif query.unit not in DVH_OUTPUT_UNITS[query.quantity]:
+                reason = 'unknown output unit ({})'.format(query.unit)
+            elif query.quantity in ['V', 'CI'] and query.label != 'Volume' and query.inputUnit not in DVH_INPUT_UNITS_DOSE:
+                reason = 'unknown input unit ({})'.format(query.inputUnit)
+            elif query.quantity == 'D' and query.inputValue != '' and query.inputUnit not in DVH_INPUT_UNITS_VOLUME:
+                reason = 'unknown input unit ({})'.format(query.inputUnit)
+            if reason:
+                invalid.append((roi_input, query.label, reason))
+
+    return invalid
+
+########## ROBUST GOAL PARSER ##########
+
+RE_ROBUST_GOAL = re.compile(r'^(?P<roi>\S+) \[(?P<label>D.*?)\s*(?:(?P<op>[<>])\s*(?P<value>[-+]?\d*\.?\d+)(?P<percent>%?))?\]$')
+
+# parsed version of a key of assets/eval-template-proton-robust.json (criteria='' and acceptanceValue=None for goals without a threshold)
+RobustGoal = collections.namedtuple('RobustGoal', ['key', 'roiName', 'dvhLabel', 'criteria', 'acceptanceValue', 'isRelative'])
+
+@functools.lru_cache(maxsize=None)
+def parseRobustGoalKey(templateKey):
+    """
+    e.g. 'CTV_DL1 [D98%>95%]'                     -> RobustGoal(roiName='CTV_DL1', dvhLabel='D98% (cGy)', criteria='>', acceptanceValue=95.0, isRelative=True)
+         'SpinalCord_Core [D0.03cc (cGy) < 5000]' -> RobustGoal(roiName='SpinalCord_Core', dvhLabel='D0.03cc (cGy)', criteria='<', acceptanceValue=5000.0, isRelative=False)
+         'Parotid_L [Dmean (cGy)]'                -> RobustGoal(roiName='Parotid_L', dvhLabel='Dmean (cGy)', criteria='', acceptanceValue=None, isRelative=False)
+    isRelative=True means that acceptanceValue is a % of the prescribed dose. Returns None for keys that cannot be parsed
+    """
+
+    match = RE_ROBUST_GOAL.match(templateKey)
+    if match is None:
+        return None
+
+    dvhLabel = match.group('label')
+    if not RE_DVH_OUTPUT_UNIT.search(dvhLabel):
+        dvhLabel += ' (cGy)'
+    if not parseDVHLabel(dvhLabel).status:
+        return None
+
+    acceptanceValue = float(match.group('value')) if match.group('value') is not None else None
+    return RobustGoal(templateKey, match.group('roi'), dvhLabel, match.group('op') or '', acceptanceValue, match.group('percent') == '%')
+
+########## DVH ENGINE ##########
+
+class RoiVolumeDistribution:
+    # mimics dose.GetDoseGridRoi(RoiName=roi).RoiVolumeDistribution in RStation
+    def __init__(self, totalVolume):
+        self.TotalVolume = totalVolume
+
+class DoseGridRoi:
+    def __init__(self, totalVolume):
+        self.RoiVolumeDistribution = RoiVolumeDistribution(totalVolume)
+
+class DVHEngine:
+    """
+    Cumulative DVHs (computed once per ROI) from a dose grid and fractional ROI masks
+
+    Params
+    ------
+    dose: np.ndarray, dose grid (in cGy), e.g. of shape (z, y, x)
+    voxelVolume: float, volume of a single voxel (in cc)
+    doselevels: List, dose levels (in cGy) for labels in %DL1, %DL2, ... e.g. [5425, 7000]
+
+    Usage
+    -----
+    engine = DVHEngine(dose, voxelVolume, doselevels=[5425, 7000])
+    engine.addRoi('Parotid_L', maskParotidL) # mask: same shape as dose, values in [0,1] (i.e. fraction of voxel inside ROI)
+    engine.addRoiFromIndices('Parotid_R', voxelIndices, relativeVolumes) # sparse mask (e.g. from helpers.ScenarioDoseStore.getRoiMasks())
+    engine.getDVHParam('Parotid_L', 'Dmean (Gy)')
+    engine.evaluate(read_dvhparamlist_csv_or_txt(pathDVHParams, ';'))
+
+    NOTE: The RStation-like methods (GetDoseAtRelativeVolumes, GetRelativeVolumeAtDoseValues, GetDoseStatistic, GetDoseGridRoi) let this object stand in for plan.TreatmentCourse.TotalDose
+    """
+
+    def __init__(self, dose, voxelVolume, doselevels=[]):
+        self.dose        = np.asarray(dose, dtype=np.float32)
+        self.voxelVolume = float(voxelVolume)
+        self.doselevels  = list(doselevels)
+        self.rois        = {} # {roiName: {'doses': ascending doses, 'volumesAbove': volume receiving >= each dose, 'totalVolume', 'mean'}}
+
+    def addRoi(self, roiName, mask):
+
+        # Step 1 - Get voxels (and their volume) inside the ROI
+        maskFlat = np.asarray(mask, dtype=np.float32).ravel()
+        if maskFlat.shape[0] != self.dose.size:
+            raise ValueError(' - [DVHEngine.addRoi()] Mask of {} has {} voxels, dose has {}'.format(roiName, maskFlat.shape[0], self.dose.size))
+        idxs = np.flatnonzero(maskFlat)
+        self.addRoiFromIndices(roiName, idxs, maskFlat[idxs])
+
+    def addRoiFromIndices(self, roiName, voxelIndices, relativeVolumes):
+        """
+        Same as addRoi(), but with a sparse mask, i.e. the flat (C-order) voxel indices of the ROI and the fraction of each voxel inside the ROI
+        (as in RStation dose.GetDoseGridRoi(RoiName=roi).RoiVolumeDistribution.VoxelIndices/.RelativeVolumes)
+        """
+
+        # Step 1 - Get voxels (and their volume) inside the ROI
+        idxs    = np.asarray(voxelIndices, dtype=np.int64)
+        volumes = np.asarray(relativeVolumes, dtype=np.float64) * self.voxelVolume
+        doses   = self.dose.ravel()[idxs].astype(np.float64)
+
+        # Step 2 - Cumulative DVH (sorted once)
+        order        = np.argsort(doses, kind='mergesort')
+        doses        = doses[order]
+        volumes      = volumes[order]
+        volumesAbove = np.cumsum(volumes[::-1])[::-1] # volume receiving >= doses[i]
+        totalVolume  = float(volumesAbove[0]) if len(volumesAbove) else 0.0
+
+        self.rois[roiName] = {
+            'doses'         : doses
+            , 'volumesAbove': volumesAbove
+            , 'totalVolume' : totalVolume
+            , 'mean'        : float(np.sum(doses * volumes) / totalVolume) if totalVolume > 0 else 0.0
+        }
+
+    def hasRoi(self, roiName):
+        return roiName in self.rois and self.rois[roiName]['totalVolume'] > 0
+
+    ########## RStation-like API ##########
+
+    def GetDoseAtRelativeVolumes(self, RoiName, RelativeVolumes):
+        # dose received by at least the given fraction(s) of the ROI volume
+        roi = self.rois[RoiName]
+        volumes = np.asarray(RelativeVolumes, dtype=np.float64) * roi['totalVolume']
+        return np.interp(volumes, roi['volumesAbove'][::-1], roi['doses'][::-1])
+
+    def GetRelativeVolumeAtDoseValues(self, RoiName, DoseValues):
+        # fraction of the ROI volume receiving at least the given dose(s)
+        roi = self.rois[RoiName]
+        idxs = np.searchsorted(roi['doses'], np.asarray(DoseValues, dtype=np.float64), side='left')
+        volumesAbove = np.append(roi['volumesAbove'], 0.0)[idxs]
+        return volumesAbove / roi['totalVolume']
+
+    def GetDoseStatistic(self, RoiName, DoseType):
+        roi = self.rois[RoiName]
+        if DoseType == 'Min':
+            return float(roi['doses'][0])
+        elif DoseType == 'Max':
+            return float(roi['doses'][-1])
+        elif DoseType == 'Average':
+            return roi['mean']
+        raise ValueError(' - [DVHEngine.GetDoseStatistic()] Unknown DoseType: {}'.format(DoseType))
+
+    def GetDoseGridRoi(self, RoiName):
+        return DoseGridRoi(self.rois[RoiName]['totalVolume'])
+
+    ########## DVH parameters ##########
+
+    def getIsodoseVolume(self, doseValue):
+        # volume of the reference isodose (inside the external, if available)
+        for roiExternal in ROI_EXTERNAL_OPTIONS:
+            if self.hasRoi(roiExternal):
+                return float(self.GetRelativeVolumeAtDoseValues(roiExternal, [doseValue])[0]) * self.rois[roiExternal]['totalVolume']
+        return float(np.count_nonzero(self.dose >= doseValue)) * self.voxelVolume
+
+    def getDoseInCGy(self, inputValue, inputUnit):
+        if inputUnit == 'Gy':
+            return inputValue * 100
+        elif inputUnit == 'cGy':
+            return inputValue
+        elif '%DL' in inputUnit:
+            return inputValue / 100 * self.doselevels[int(inputUnit[-1]) - 1]
+        raise ValueError(' - [DVHEngine.getDoseInCGy()] Unknown input unit: {}'.format(inputUnit))
+
+    def getDoseInUnit(self, doseValue, unit):
+        if '%DL' in unit:
+            return doseValue / self.doselevels[int(unit[-1]) - 1] * 100
+        elif unit == 'Gy':
+            return doseValue / 100
+        elif unit == 'cGy':
+            return doseValue
+        raise ValueError(' - [DVHEngine.getDoseInUnit()] Unknown output unit: {}'.format(unit))
+
+    def getDVHParam(self, roiName, dvhparam_label):
+        """
+        Same vocabulary (and units) as helpers.calc_dvhparam(), e.g. 'Volume', 'Dmean (Gy)', 'D0.03cc (%DL1)', 'D98% (cGy)', 'V95%DL1 (%)', 'V20Gy (cc)', 'CI95%DL1 (RTOG)', 'HI5%'
+        Returns '' for labels that cannot be processed
+        """
+
+        dvhparam_value = ''
+        try:
+            quantity, unit, inputValue, inputUnit, status = parseDVHLabel(dvhparam_label)[1:6]
+            if not status:
+                return dvhparam_value
+            totalVolume = self.rois[roiName]['totalVolume']
+
+            if quantity == 'V':
+                if dvhparam_label == 'Volume':
+                    dvhparam_value = totalVolume
+                else:
+                    relVolume = float(self.GetRelativeVolumeAtDoseValues(roiName, [self.getDoseInCGy(inputValue, inputUnit)])[0])
+                    if unit == '%':
+                        dvhparam_value = relVolume * 100
+                    elif unit == 'cc':
+                        dvhparam_value = relVolume * totalVolume
+
+            elif quantity == 'D':
+                if 'Dmin' in dvhparam_label:
+                    doseValue = self.GetDoseStatistic(roiName, 'Min')
+                elif 'Dmax' in dvhparam_label:
+                    doseValue = self.GetDoseStatistic(roiName, 'Max')
+                elif 'Dmean' in dvhparam_label:
+                    doseValue = self.GetDoseStatistic(roiName, 'Average')
+                elif inputUnit == 'cc':
+                    doseValue = float(self.GetDoseAtRelativeVolumes(roiName, [inputValue / totalVolume])[0])
+                elif inputUnit == '%':
+                    doseValue = float(self.GetDoseAtRelativeVolumes(roiName, [inputValue / 100])[0])
+                else:
+                    return dvhparam_value
+                dvhparam_value = self.getDoseInUnit(doseValue, unit)
+
+            elif quantity == 'CI':
+                doseValue        = self.getDoseInCGy(inputValue, inputUnit)
+                volumeRefIsodose = self.getIsodoseVolume(doseValue)
+                volumeCovered    = float(self.GetRelativeVolumeAtDoseValues(roiName, [doseValue])[0]) * totalVolume
+                if volumeRefIsodose and totalVolume:
+                    if unit == 'RTOG':
+                        dvhparam_value = volumeRefIsodose / totalVolume
+                    elif unit == 'Riet':
+                        dvhparam_value = (volumeCovered ** 2) / (totalVolume * volumeRefIsodose)
+                    elif unit == 'RS':
+                        dvhparam_value = volumeCovered / volumeRefIsodose
+
+            elif quantity == 'HI':
+                doseValues = self.GetDoseAtRelativeVolumes(roiName, [inputValue / 100, 1.0 - inputValue / 100])
+                dvhparam_value = float(doseValues[0] / doseValues[1])
+
+        except:
+            print (f' - [DVHEngine.getDVHParam()] Cant process {dvhparam_label} for {roiName}')
+            traceback.print_exc()
+
+        return dvhparam_value
+
+    def evaluate(self, rois_and_dvhparams):
+        """
+        Params
+        ------
+        rois_and_dvhparams: Dict, output of helpers.read_dvhparamlist_csv_or_txt() i.e. {roi (or 'roi1,roi2' synonyms): [dvhparam_label, ...]}
+
+        Returns
+        -------
+        res: Dict, {roi_input: {dvhparam_label: value}}, same layout as a plan in helpers.evaluatePlans()
+        """
+
+        res = {}
+        for roi_input, dvhparams_labels in rois_and_dvhparams.items():
+            if roi_input in ['prescribeddose#', 'doselevels#']:
+                continue
+            res[roi_input] = {}
+            roiSynonymHits = [roi for roi in roi_input.replace(', ', ',').split(',') if self.hasRoi(roi)]
+            for dvhparam_label in dvhparams_labels:
+                if len(roiSynonymHits):
+                    res[roi_input][dvhparam_label] = self.getDVHParam(roiSynonymHits[0], dvhparam_label)
+                else:
+                    res[roi_input][dvhparam_label] = 'inexistent'
+
+        return res
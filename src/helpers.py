@@ -3,16 +3,25 @@ import connect
 
 # Import private modules
 import hnDoseConfig as config
+from dvhHelpers import untangle_dvhparam_string, parseDVHLabel, getDVHQueryPlan, validateDVHQueryPlan, parseRobustGoalKey, DVHEngine
+from dicomHelpers import getDicomManifest, getManifestFolders, getManifestSeries
 
 # Import public modules
 import re
 import os
 import pdb
 import copy
+import json
 import time
+import uuid
 import math
+import mmap
 import shutil
+import hashlib
 import logging
+import datetime
+import threading
+import concurrent.futures
 import pydicom
 import traceback
 import numpy as np
@@ -35,18 +44,64 @@ def getPatientIdentifier(patientObj):
     """
     return '/'.join([patientObj.PatientID, patientObj.Name])
 
-def rayStationSave():
+LOCK_RS_SAVE  = threading.RLock()
+RS_SAVE_STATE = {'depth': 0, 'dirty': False, 'saves': 0, 'savesAvoided': 0} # depth = number of open RayStationSaveSession's
+
+def rayStationSave(commit=False, dirty=True):
+    """
+    Saves (and returns) the current patient. Inside a RayStationSaveSession the save is deferred to the end of the session
+
+    Params
+    ------
+    commit: bool, save now (if there are unsaved changes), for operations that need a saved state (e.g. imports, segmentation, optimization)
+    dirty: bool, False if the caller only needs the patient object (i.e. it has not modified the patient)
+    """
 
     patientObj = None
 
     try:
         patientObj = connect.get_current(config.KEYNAME_PATIENT)
-        patientObj.Save() # need to do this so to avoid "PreConditionViolationException: State must be saved."
+        with LOCK_RS_SAVE:
+            if RS_SAVE_STATE['depth'] > 0:
+                RS_SAVE_STATE['dirty'] = RS_SAVE_STATE['dirty'] or dirty
+                if not commit or not RS_SAVE_STATE['dirty']:
+                    RS_SAVE_STATE['savesAvoided'] += 1
+                    return patientObj
+            patientObj.Save() # need to do this so to avoid "PreConditionViolationException: State must be saved."
+            RS_SAVE_STATE['dirty'] = False
+            RS_SAVE_STATE['saves'] += 1
     except:
         pass # if there is no patient open
     
     return patientObj
 
+class RayStationSaveSession:
+    """
+    Coalesces all rayStationSave() calls within it into one save at the end of the (outermost) session, e.g. the end of a stage
+
+    Usage
+    -----
+    with RayStationSaveSession('CS'):
+        copyPlanAndOptimize(...)
+    """
+
+    def __init__(self, name=''):
+        self.name = name
+
+    def __enter__(self):
+        with LOCK_RS_SAVE:
+            RS_SAVE_STATE['depth'] += 1
+            self.saves, self.savesAvoided = RS_SAVE_STATE['saves'], RS_SAVE_STATE['savesAvoided']
+        return self
+
+    def __exit__(self, excType, excValue, excTraceback):
+        with LOCK_RS_SAVE:
+            RS_SAVE_STATE['depth'] -= 1
+            if RS_SAVE_STATE['depth'] == 0 and RS_SAVE_STATE['dirty']:
+                rayStationSave(commit=True)
+            print (' - [RayStationSaveSession][{}] Patient saves: {}, saves avoided: {}'.format(self.name, RS_SAVE_STATE['saves'] - self.saves, RS_SAVE_STATE['savesAvoided'] - self.savesAvoided))
+        return False
+
 def getPatientById(patientID, lastFind=True):
 
     patient = None
@@ -107,18 +162,19 @@ def uploadRTAppsDataToRStation(pathPatient, planName, forceUpload=False, forceCu
     
     # Step 0 - Init
     assert forceUpload + forceCurrentPatient < 2, ' - [uploadRTAppsDataToRStation] forceUpload and forceCurrentPatient cannot be both True!'
-    rayStationSave()
+    rayStationSave(commit=True, dirty=False)
     db = connect.get_current(config.KEYNAME_RS_PATIENTDB)
     patientCTBool, patientRTStructBool, patientRTPlanBool, patientRTDoseBool = False, False, False, False
     
     # Step 1 - Create patient
     if pathPatient.exists():
 
-        # Step 2 - Get patient paths
-        pathPatientCTFolders       = [path for path in pathPatient.iterdir() if path.is_dir() and path.name.startswith(config.KEYNAME_CT)]
-        pathPatientRTDoseFolders   = [path for path in pathPatient.iterdir() if path.is_dir() and path.name.startswith(config.KEYNAME_RTDOSE)]
-        pathPatientRTPlanFolders   = [path for path in pathPatient.iterdir() if path.is_dir() and path.name.startswith(config.KEYNAME_RTPLAN)]
-        pathPatientRTStructFolders = [path for path in pathPatient.iterdir() if path.is_dir() and path.name.startswith(config.KEYNAME_RTSTRUCT)]
+        # Step 2 - Get patient paths (from a single scan of the patient folder)
+        manifest = getDicomManifest(pathPatient, verbose=True)
+        pathPatientCTFolders       = getManifestFolders(manifest, pathPatient, config.KEYNAME_CT)
+        pathPatientRTDoseFolders   = getManifestFolders(manifest, pathPatient, config.KEYNAME_RTDOSE)
+        pathPatientRTPlanFolders   = getManifestFolders(manifest, pathPatient, config.KEYNAME_RTPLAN)
+        pathPatientRTStructFolders = getManifestFolders(manifest, pathPatient, config.KEYNAME_RTSTRUCT)
 
         if len(pathPatientCTFolders) == 1 and len(pathPatientRTDoseFolders) == 1 and len(pathPatientRTPlanFolders) == 1 and len(pathPatientRTStructFolders) == 1:
             pathPatientCTFolder       = pathPatientCTFolders[0]
@@ -139,6 +195,7 @@ def uploadRTAppsDataToRStation(pathPatient, planName, forceUpload=False, forceCu
                             patientID, studyUID, seriesUID = updateCTDicoms(pathPatientCTFolder)
                             print ('\n - [uploadRTAppsDataToRStation()] --------------------- Step 1.1: Uploading CT data for {} ... \n\n'.format(patientID))
                             warnings = db.ImportPatientFromPath(Path=str(pathPatientCTFolder), SeriesOrInstances=[{'PatientID': patientID, 'StudyInstanceUID': str(studyUID), 'SeriesInstanceUID': str(seriesUID)}], ImportFilter='', BrachyPlanImportOverrides={})
+                            resetCaseNameIndex()
                             patient = rayStationSave()
                             # patient.Cases[0].SetCurrent()
                             print ('\n - [uploadRTAppsDataToRStation()] --------------------- Step 1.1: Uploaded CT data for {} \n\n'.format(getPatientIdentifier(patient)))
@@ -159,7 +216,7 @@ def uploadRTAppsDataToRStation(pathPatient, planName, forceUpload=False, forceCu
             print ('\n ---------------------------------------------------------- ')
 
             # Step 1.2 - Upload (existing) RTStruct/RTPLAN/RTDOSE
-            patient = rayStationSave()
+            patient = rayStationSave(commit=True, dirty=False)
             if patient is not None and patientCTBool:
                 case      = patient.Cases[0]
                 casename  = case.CaseName
@@ -174,6 +231,7 @@ def uploadRTAppsDataToRStation(pathPatient, planName, forceUpload=False, forceCu
                             studyUIDRTStruct, seriesUIDRTStruct = updateRTStructDicoms(pathPatientRTStructFile)
                             print ('\n\n [uploadRTAppsDataToRStation()][Patient={}] --------------------- Step 1.2: Uploading RTStruct data ... \n\n'.format(getPatientIdentifier(patient)))
                             warningsRTStruct  = patient.ImportDataFromPath(Path=str(pathPatientRTStructFolder), CaseName=casename, SeriesOrInstances=[{'PatientID': patientID, 'StudyInstanceUID': str(studyUIDRTStruct), 'SeriesInstanceUID': str(seriesUIDRTStruct)}], ImportFilter='', BrachyPlanImportOverrides={}, AllowMismatchingPatientID=True)
+                            resetCaseNameIndex(case)
                             print ('\n\n [uploadRTAppsDataToRStation()][Patient={}] --------------------- Step 1.2: Uploaded RTStruct data \n\n'.format(getPatientIdentifier(patient)))
                             patientRTStructBool = True
                             rayStationSave()
@@ -197,6 +255,9 @@ def uploadRTAppsDataToRStation(pathPatient, planName, forceUpload=False, forceCu
                         seriesUIDRTPlan = Path(pathPatientRTPlanFolder).parts[-1].split('_')[-1]
                         studyUIDRTDose  = Path(pathPatientRTDoseFolder).parts[-2]
                         seriesUIDRTDose = Path(pathPatientRTDoseFolder).parts[-1].split('_')[-1]
+                        seriesRTPlan, seriesRTDose = getManifestSeries(manifest, pathPatientRTPlanFolder), getManifestSeries(manifest, pathPatientRTDoseFolder)
+                        if len(seriesRTPlan) == 1: _, studyUIDRTPlan, seriesUIDRTPlan = seriesRTPlan[0] # UIDs from the files themselves (else from the folder names)
+                        if len(seriesRTDose) == 1: _, studyUIDRTDose, seriesUIDRTDose = seriesRTDose[0]
                         updateRTPlanDicoms(pathPatientRTPlanFolder)
                         pathTempRTDoseAndRTPlanFolder = getTempRTDoseAndRTPlanFolder(pathPatientRTPlanFolder, pathPatientRTDoseFolder)
                         print ('\n [uploadRTAppsDataToRStation()][Patient={}] --------------------- Step 1.3: Uploading RTPlan/RTDose data ... \n\n'.format(getPatientIdentifier(patient)))
@@ -204,6 +265,7 @@ def uploadRTAppsDataToRStation(pathPatient, planName, forceUpload=False, forceCu
                             {'PatientID': patientID, 'StudyInstanceUID': str(studyUIDRTPlan), 'SeriesInstanceUID': str(seriesUIDRTPlan)}    
                             , {'PatientID': patientID, 'StudyInstanceUID': str(studyUIDRTDose), 'SeriesInstanceUID': str(seriesUIDRTDose)}
                             ], ImportFilter='', BrachyPlanImportOverrides={}, AllowMismatchingPatientID=True)
+                        resetCaseNameIndex(case)
                         shutil.rmtree(pathTempRTDoseAndRTPlanFolder)
                         patientRTPlanBool = True
                         patientRTDoseBool = True
@@ -235,46 +297,185 @@ def uploadRTAppsDataToRStation(pathPatient, planName, forceUpload=False, forceCu
 
 ########## DICOM-RELATED ##########
 
-def updateRTStructDicoms(pathRTStruct):
+DICOM_PAD_BYTES = {'UI': b'\x00'} # trailing padding of a value (else a space)
+
+def getDicomPatchBytes(rawElement, value):
+    """
+    Bytes to overwrite the value of rawElement with (same length, padded), else None (e.g. longer value, binary VR or element not in the file)
+    """
+
+    try:
+        if rawElement is None or getattr(rawElement, 'value_tell', None) is None or getattr(rawElement, 'is_undefined_length', False):
+            return None
+        VR = rawElement.VR if rawElement.VR is not None else pydicom.datadict.dictionary_VR(rawElement.tag) # implicit VR files
+        if VR not in ['AE', 'CS', 'DA', 'DS', 'IS', 'LO', 'LT', 'PN', 'SH', 'ST', 'TM', 'UI', 'UT']:
+            return None
+        
+        valueBytes = str(value).encode('latin-1')
+        if len(valueBytes) > rawElement.length:
+            return None
+        return valueBytes + DICOM_PAD_BYTES.get(VR, b' ') * (rawElement.length - len(valueBytes))
     
-    # Step 1 - Get the study and series UID
-    dsRTStruct        = pydicom.dcmread(str(pathRTStruct))
-    studyUIDRTStruct = dsRTStruct.StudyInstanceUID
-    seriesUIDRTStruct = dsRTStruct.SeriesInstanceUID
-    dsRTStruct.ApprovalStatus = config.KEYNAME_UNAPPROVED # [UNAPPROVED, APPROVED, REJECTED]
+    except:
+        traceback.print_exc()
+        return None
+
+def getDicomItemOffsets(ds, offset=0, itemOffsets=None):
+    """
+    Values of elements in (defined length) sequence items are read from the bytes of the sequence, so their value_tell is relative to it
+
+    Returns
+    -------
+    itemOffsets: Dict, {id(item): byte offset of its element positions in the file}, for the (already accessed) sequences in ds
+    """
+
+    if itemOffsets is None:
+        itemOffsets = {}
+    
+    for tag in ds.keys():
+        elem = ds.get_item(tag)
+        if isinstance(elem, pydicom.dataelem.DataElement) and elem.VR == 'SQ' and elem.file_tell is not None:
+            itemOffset = offset if elem.is_undefined_length else offset + elem.file_tell # undefined length sequences are read in-line
+            for item in elem.value:
+                itemOffsets[id(item)] = itemOffset
+                getDicomItemOffsets(item, itemOffset, itemOffsets)
+    
+    return itemOffsets
+
+def updateDicomTags(pathDicom, getUpdates):
+    """
+    Updates tags of a DICOM file by overwriting only their bytes (memory-mapped) if the new values fit in the old ones, else re-writes the file (via a temp file)
+
+    Params
+    ------
+    pathDicom: Path
+    getUpdates: func(ds) -> List of [dataset, keyword, value], where dataset is ds or a sequence item in it. 
+     - NOTE: it should not access the values of the keywords it updates (so that their raw elements, with file offsets, are kept)
+
+    Returns
+    -------
+    ds: pydicom.Dataset, header of the file (large values are deferred)
+    patchType: String, 'unchanged', 'inplace' or 'rewrite'
+    """
+
+    # Step 1 - Read header (with file offsets of each value)
+    ds = pydicom.dcmread(str(pathDicom), force=True, stop_before_pixels=True, defer_size='1 KB')
+    updates = getUpdates(ds)
+    itemOffsets = getDicomItemOffsets(ds)
+
+    # Step 2 - Get bytes to patch
+    patches = []
+    for dataset, keyword, value in updates:
+        rawElement = dataset.get_item(pydicom.datadict.tag_for_keyword(keyword))
+        valueBytes = getDicomPatchBytes(rawElement, value)
+        offset     = 0 if dataset is ds else itemOffsets.get(id(dataset), None)
+        if valueBytes is None or offset is None or rawElement.value is None:
+            patches = None
+            break
+        if bytes(rawElement.value) == valueBytes:
+            continue
+        patches.append([offset + rawElement.value_tell, bytes(rawElement.value), valueBytes])
+
+    # Step 3.1 - Patch in place (only if the old values are where we expect them)
+    if patches is not None:
+        if len(patches):
+            with open(str(pathDicom), 'r+b') as fp:
+                with mmap.mmap(fp.fileno(), 0) as mm:
+                    if all(mm[valueTell:valueTell + len(valueBytesOld)] == valueBytesOld for valueTell, valueBytesOld, _ in patches):
+                        for valueTell, _, valueBytes in patches:
+                            mm[valueTell:valueTell + len(valueBytes)] = valueBytes
+                        mm.flush()
+                    else:
+                        patches = None
+        if patches is not None:
+            return ds, 'inplace' if len(patches) else 'unchanged'
     
-    # Step 2 - Update the RTROIObservationsSequence
-    for structureSet in dsRTStruct.StructureSetROISequence:
-        if structureSet.ROIName in [config.KEYNAME_PTV_DL1_DVH, config.KEYNAME_PTV_DL2_DVH]:
-            roiNumber = structureSet.ROINumber
-            print (roiNumber, structureSet.ROIName)
-            for roiObservation in dsRTStruct.RTROIObservationsSequence:
-                if roiObservation.ReferencedROINumber == roiNumber:
-                    roiObservation.RTROIInterpretedType = config.KEYNAME_PTV # [PTV, CTV, GTV, ORGAN, ]
-            # dsRTStruct.RTROIObservationsSequence[roiNumber-1].RTROIInterpretedType = config.KEYNAME_PTV # [PTV, CTV, GTV, ORGAN, ]
+    # Step 3.2 - Re-write (to a temp file first, so that a crash does not leave a half-written file)
+    dsFull = pydicom.dcmread(str(pathDicom), force=True)
+    for dataset, keyword, value in getUpdates(dsFull):
+        setattr(dataset, keyword, value)
+    pathDicomTmp = Path(pathDicom).parent.joinpath(Path(pathDicom).name + '.tmp')
+    dsFull.save_as(str(pathDicomTmp), write_like_original=True)
+    os.replace(str(pathDicomTmp), str(pathDicom))
+    
+    return ds, 'rewrite'
 
-    # Step 3 - Save the file
-    dsRTStruct.save_as(str(pathRTStruct), write_like_original=True)
+def updateRTStructDicoms(pathRTStruct):
+    
+    # Step 1 - Get updates
+    def getUpdates(dsRTStruct):
+        updates = [[dsRTStruct, 'ApprovalStatus', config.KEYNAME_UNAPPROVED]] # [UNAPPROVED, APPROVED, REJECTED]
+        
+        # Step 1.1 - Update the RTROIObservationsSequence
+        for structureSet in dsRTStruct.StructureSetROISequence:
+            if structureSet.ROIName in [config.KEYNAME_PTV_DL1_DVH, config.KEYNAME_PTV_DL2_DVH]:
+                roiNumber = structureSet.ROINumber
+                print (roiNumber, structureSet.ROIName)
+                for roiObservation in dsRTStruct.RTROIObservationsSequence:
+                    if roiObservation.ReferencedROINumber == roiNumber:
+                        updates.append([roiObservation, 'RTROIInterpretedType', config.KEYNAME_PTV]) # [PTV, CTV, GTV, ORGAN, ]
+        
+        return updates
+
+    # Step 2 - Update the file and get the study and series UID
+    dsRTStruct, patchType = updateDicomTags(pathRTStruct, getUpdates)
+    studyUIDRTStruct  = dsRTStruct.StudyInstanceUID
+    seriesUIDRTStruct = dsRTStruct.SeriesInstanceUID
+    print (' - [updateRTStructDicoms()] RTStruct update: ', patchType)
     
     return studyUIDRTStruct, seriesUIDRTStruct
 
-def updateCTDicoms(pathCT):
+def updateCTDicom(pathDicomCT):
+    """
+    Sets the ReferringPhysicianName of a CT slice (see updateDicomTags(), the pixel data is only re-written if the name does not fit)
 
-    patientID, studyUID, seriesUID = None, None, None
+    Returns
+    -------
+    patientID, studyUID, seriesUID: None if not a CT
+    updatedBool: Bool, True if the file was changed
+    timeTaken: Float, seconds
+    """
 
-    for pathDicomCT in pathCT.iterdir():
-        if pathDicomCT.suffix == config.EXT_DCM:
-            
-            ds = pydicom.dcmread(str(pathDicomCT), force=True)
+    t0 = time.time()
+    patientID, studyUID, seriesUID, updatedBool = None, None, None, False
+    try:
+        # Step 1 - Update header (only CTs)
+        def getUpdates(ds):
+            if ds.get('Modality', None) == 'CT':
+                return [[ds, 'ReferringPhysicianName', config.PHYSICIAN_NAME]] # NOTE: This is the update
+            return []
+        ds, patchType = updateDicomTags(pathDicomCT, getUpdates)
+
+        # Step 2 - Get UIDs
+        if ds.get('Modality', None) == 'CT':
+            patientID = ds.PatientID
+            studyUID = ds.StudyInstanceUID
+            seriesUID = ds.SeriesInstanceUID
+            updatedBool = patchType != 'unchanged'
+    except:
+        traceback.print_exc()
+    
+    return patientID, studyUID, seriesUID, updatedBool, time.time() - t0
 
-            if ds.Modality == 'CT':
-                patientID = ds.PatientID
-                studyUID = ds.StudyInstanceUID
-                seriesUID = ds.SeriesInstanceUID
+def updateCTDicoms(pathCT, maxWorkers=config.DICOM_MAX_WORKERS):
 
-                ds.ReferringPhysicianName = config.PHYSICIAN_NAME # NOTE: This is the update
+    patientID, studyUID, seriesUID = None, None, None
 
-                ds.save_as(str(pathDicomCT), write_like_original=True)
+    t0 = time.time()
+    pathDicomCTs = [pathDicomCT for pathDicomCT in pathCT.iterdir() if pathDicomCT.suffix == config.EXT_DCM]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+        results = list(executor.map(updateCTDicom, pathDicomCTs))
+    
+    sliceTimes, slicesUpdated = [], 0
+    for slicePatientID, sliceStudyUID, sliceSeriesUID, updatedBool, timeTaken in results:
+        sliceTimes.append(timeTaken)
+        if slicePatientID is not None:
+            patientID, studyUID, seriesUID = slicePatientID, sliceStudyUID, sliceSeriesUID
+            slicesUpdated += updatedBool
+    
+    if len(sliceTimes):
+        print (' - [updateCTDicoms()] Updated {}/{} slices in {:.2f}s (per slice: mean={:.3f}s, max={:.3f}s, workers={})'.format(
+            slicesUpdated, len(sliceTimes), time.time() - t0, np.mean(sliceTimes), np.max(sliceTimes), maxWorkers))
     
     return patientID, studyUID, seriesUID
 
@@ -284,17 +485,19 @@ def updateRTPlanDicoms(pathPatientRTPlanFolder):
 
     if Path(pathPatientRTPlanFolder).exists():
         pathPatientRTPlanFile = [each for each in pathPatientRTPlanFolder.iterdir()][0]
-        ds = pydicom.filereader.dcmread(str(pathPatientRTPlanFile))
 
-        ds.ApprovalStatus = config.KEYNAME_UNAPPROVED # [UNAPPROVED, APPROVED, REJECTED]
+        def getUpdates(ds):
+            updates = [[ds, 'ApprovalStatus', config.KEYNAME_UNAPPROVED]] # [UNAPPROVED, APPROVED, REJECTED]
+            for beam in ds.BeamSequence:
+                updates.append([beam, 'TreatmentMachineName', config.NAME_TREATMENT_MACHINE])
+            return updates
+        
         print (' - [updateRTPlanDicoms()] Updating beams to : ', config.NAME_TREATMENT_MACHINE)
-        for beam in ds.BeamSequence:
-            beam.TreatmentMachineName = config.NAME_TREATMENT_MACHINE
+        ds, patchType = updateDicomTags(pathPatientRTPlanFile, getUpdates)
+        print (' - [updateRTPlanDicoms()] RTPlan update: ', patchType)
         
         studyID = str(ds.StudyInstanceUID)
 
-        ds.save_as(str(pathPatientRTPlanFile), write_like_original=True)
-
     else:
         raise Exception(f" - [updateRTPlanDicoms] {pathPatientRTPlanFolder} does not exist!")
 
@@ -306,7 +509,7 @@ def setEquipmentName():
     rayStationSave()
 
 def checkForRTStruct(case):
-    exists = '_' + config.KEYNAME_PTV_DL1_DVH in dir(case.PatientModel.StructureSets[0].RoiGeometries)
+    exists = getCaseNameIndex(case).hasRoi(config.KEYNAME_PTV_DL1_DVH)
     return exists
 
 ########## RS PLAN RELATED ##########
@@ -316,7 +519,7 @@ def getPatientAndPlan(planName, debug=False):
     patient, case, plan, beamset = None, None, None, None
     
     # Step 1 - Get patient
-    patient = rayStationSave()
+    patient = rayStationSave(dirty=False)
     if patient is None:
         return patient, case, plan, beamset
     case = patient.Cases[0]
@@ -352,6 +555,7 @@ def copyPlan(basePlanName, newPlanName, createArcBeam=True, debug=False):
         
         print (' - [INFO][copyPlan()] Copying plan {0} to {1}'.format(basePlanName, newPlanName))
         case.CopyPlan(PlanName=basePlanName, NewPlanName=newPlanName, KeepBeamSetNames=False)
+        getCaseNameIndex(case).addPlan(newPlanName)
         rayStationSave()
         print (' - [INFO][copyPlan()] Copied plan: ', newPlanName)
 
@@ -399,9 +603,8 @@ def checkForRTPlan(case, planName):
     # Step 0 - Init
     exists = False
 
-    # Step 1 - Convert to RS naming standard
-    planNameRSStandard = config.RS_CHECK_PREFIX + str(planName).translate(config.RS_STR_TRANSLATE_OBJ)
-    if planNameRSStandard in dir(case.TreatmentPlans):
+    # Step 1 - Check (exact or RS naming standard) name in index
+    if getCaseNameIndex(case).hasPlan(planName):
         exists = True
     
     return exists
@@ -411,9 +614,9 @@ def getRTPlanIndex(case, planName):
     # Step 0 - Init
     index = -1
 
-    # Step 1 - Convert to RS naming standard
+    # Step 1 - Get index from case index
     try:
-        index     = [plan.Name for plan in case.TreatmentPlans].index(planName)
+        index     = getCaseNameIndex(case).getPlanIndex(planName)
     except:
         pass
 
@@ -541,13 +744,281 @@ def getObjectivesFromPlan(plan, beamset):
     
     return objectives
 
+LOCK_OBJECTIVE_TEMPLATES = threading.Lock()
+OBJECTIVE_TEMPLATE_TREES = {} # {xmlHash: ElementTree of the template}
+OBJECTIVE_TEMPLATE_CACHE = {} # {getObjectiveTemplateKey(): [Objective, ...]}, never .apply()'ed, only copies of these are handed out
+
+def getObjectiveTemplateKey(beamset, pathObjectives):
+    """
+    Returns everything that ObjectiveTemplateManager.parse_xml() depends on, i.e.
+     - (hash of) the XML content
+     - doselevels (beamset.Comment) and fraction dose
+     - ROI names (and the volumes of ROIs used in conditionalVolumeRoi)
+     - beam names (for restrictToBeams)
+    """
+
+    # Step 1 - XML (parsed once per content)
+    xmlHash = getFileHash(pathObjectives)
+    with LOCK_OBJECTIVE_TEMPLATES:
+        if xmlHash not in OBJECTIVE_TEMPLATE_TREES:
+            OBJECTIVE_TEMPLATE_TREES[xmlHash] = ElementTree.parse(str(pathObjectives))
+        objectiveTree = OBJECTIVE_TEMPLATE_TREES[xmlHash]
+
+    # Step 2 - Beamset
+    doselevels = tuple(sorted(re.findall("(DL[0-9]) ([0-9]+)", beamset.Comment)))
+    try:
+        fractionDose = round(beamset.Prescription.PrimaryDosePrescription.DoseValue / beamset.FractionationPattern.NumberOfFractions, ndigits=1)
+    except:
+        fractionDose = None
+    beamNames = tuple(beam.Name for beam in beamset.Beams)
+
+    # Step 3 - ROIs
+    structureSet = beamset.GetStructureSet()
+    roiNames     = tuple(sorted(roi.OfRoi.Name for roi in structureSet.RoiGeometries))
+    roiVolumes   = []
+    for roiName in sorted(set(element.get("conditionalVolumeRoi") for element in objectiveTree.iter() if element.get("conditionalVolumeRoi"))):
+        if roiName in roiNames:
+            roiVolumes.append((roiName, round(structureSet.RoiGeometries[roiName].GetRoiVolume(), ndigits=2)))
+
+    return (xmlHash, doselevels, fractionDose, beamset.Modality, beamNames, roiNames, tuple(roiVolumes))
+
+def bindObjectives(objectives, plan, beamset):
+    """
+    Returns (shallow) copies of objectives that apply to plan/beamset (.apply() modifies the objective, e.g. ObjectiveDose.doselevel)
+    """
+    conditionValidator = ConditionalElementValidator(beamset)
+    boundObjectives    = []
+    for objective in objectives:
+        boundObjective = copy.copy(objective)
+        boundObjective.plan, boundObjective.beamset, boundObjective.ConditionValidator = plan, beamset, conditionValidator
+        boundObjectives.append(boundObjective)
+    
+    return boundObjectives
+
 def getObjectivesFromPath(plan, beamset, pathObjectives):
     
-    templateManager = ObjectiveTemplateManager(plan, beamset)
-    templateManager.parse_xml(str(pathObjectives))
-    objectives = templateManager.objectives
+    # Step 1 - Check cache
+    try:
+        templateKey = getObjectiveTemplateKey(beamset, pathObjectives)
+    except:
+        traceback.print_exc()
+        templateKey = None
+    with LOCK_OBJECTIVE_TEMPLATES:
+        objectives = OBJECTIVE_TEMPLATE_CACHE.get(templateKey, None) if templateKey is not None else None
+    
+    # Step 2 - Parse and validate XML (only if not in cache)
+    if objectives is None:
+        templateManager = ObjectiveTemplateManager(plan, beamset)
+        templateManager.parse_xml(str(pathObjectives))
+        objectives = templateManager.objectives
+        if templateKey is not None:
+            with LOCK_OBJECTIVE_TEMPLATES:
+                OBJECTIVE_TEMPLATE_CACHE[templateKey] = list(objectives)
+    else:
+        print (' - [getObjectivesFromPath()] Using cached objectives ({}) for {}'.format(len(objectives), Path(pathObjectives).name))
 
-    return objectives
+    return bindObjectives(objectives, plan, beamset)
+
+def getObjectiveKey(roiName, functionType, isRobust=None):
+    """
+    Structured key to match RS objectives with template objectives (f'{roi}-{fType}' strings break for ROI names with a '-')
+    """
+    return (str(roiName), str(functionType), isRobust)
+
+def getRSObjectiveFunctionType(objectiveFromRS):
+    try:
+        return objectiveFromRS.DoseFunctionParameters.FunctionType
+    except:
+        return config.KEY_FTYPE_DOSEFALLOFF # DoseFallOff functions have no FunctionType
+
+def getObjectiveDiff(objectivesFromRS, objectivesFromPath, objectiveFType, roiIgnoreFunc
+                     , updateAllFunctions=False, updateDoseFallOffLevels=False, useRobust=False
+                     , skipPathFunc=None, skipRSFunc=None):
+    """
+    Reconciles the objectives in RS with the objectives from the template in one pass over each (instead of comparing every pair)
+
+    Params
+    ------
+    objectiveFType: str, function type that is updated/added in this plan (None = all, i.e. the final plan)
+    roiIgnoreFunc: func(roiName) -> bool, ROIs to leave as is
+    updateAllFunctions: bool, update existing objectives of every function type (not only objectiveFType)
+    updateDoseFallOffLevels: bool, also update the High/LowDoseLevel of DoseFallOff objectives
+    useRobust: bool, also match on robustness (e.g. for protons)
+    skipPathFunc: func(objectiveFromPath) -> bool, template objectives to leave out
+    skipRSFunc: func(rsIdx, roiName) -> bool, RS objectives to leave out (these do not count as existing)
+
+    Returns
+    -------
+    diff: List of Dicts, {'action': config.KEYNAME_OBJECTIVE_*, 'roi', 'functionType', 'isRobust', 'rsIdx', 'pathIdx', 'changes': {attribute: [old, new]}}
+    """
+
+    diff = []
+
+    # Step 1 - Index template objectives (last one wins for duplicate keys)
+    pathIndex = {}
+    for pathIdx, objectiveFromPath in enumerate(objectivesFromPath):
+        if skipPathFunc is not None and skipPathFunc(objectiveFromPath):
+            continue
+        pathIndex[getObjectiveKey(objectiveFromPath.roi_name, objectiveFromPath.function_type, objectiveFromPath.is_robust if useRobust else None)] = pathIdx
+
+    # Step 2 - Existing objectives
+    keysExisting = set()
+    for rsIdx, objectiveFromRS in enumerate(objectivesFromRS):
+        try:
+            roiName = objectiveFromRS.ForRegionOfInterest.Name
+            if skipRSFunc is not None and skipRSFunc(rsIdx, roiName):
+                continue
+            functionType = getRSObjectiveFunctionType(objectiveFromRS)
+            key = getObjectiveKey(roiName, functionType, objectiveFromRS.UseRobustness if useRobust else None)
+            if key not in pathIndex:
+                continue
+            keysExisting.add(key)
+
+            entry = {'action': config.KEYNAME_OBJECTIVE_UPDATE, 'roi': key[0], 'functionType': key[1], 'isRobust': key[2], 'rsIdx': rsIdx, 'pathIdx': pathIndex[key], 'changes': {}}
+            if not (updateAllFunctions or functionType == objectiveFType):
+                entry['action'] = config.KEYNAME_OBJECTIVE_SKIP
+            elif roiIgnoreFunc(roiName):
+                entry['action'] = config.KEYNAME_OBJECTIVE_IGNORE
+            else:
+                objectiveFromPath = objectivesFromPath[pathIndex[key]]
+                parameters = objectiveFromRS.DoseFunctionParameters
+                entry['changes']['Weight'] = [parameters.Weight, objectiveFromPath.weight]
+                if functionType == config.KEY_FTYPE_MAXEUD:
+                    entry['changes']['DoseLevel']     = [parameters.DoseLevel, objectiveFromPath.doselevel]
+                    entry['changes']['EudParameterA'] = [parameters.EudParameterA, objectiveFromPath.eud_parameter_a]
+                elif functionType == config.KEY_FTYPE_DOSEFALLOFF and updateDoseFallOffLevels:
+                    entry['changes']['HighDoseLevel'] = [parameters.HighDoseLevel, objectiveFromPath.high_doselevel]
+                    entry['changes']['LowDoseLevel']  = [parameters.LowDoseLevel, objectiveFromPath.low_doselevel]
+            diff.append(entry)
+        except:
+            traceback.print_exc()
+
+    # Step 3 - New objectives
+    for key, pathIdx in pathIndex.items():
+        if key in keysExisting:
+            continue
+        entry = {'action': config.KEYNAME_OBJECTIVE_ADD, 'roi': key[0], 'functionType': key[1], 'isRobust': key[2], 'rsIdx': None, 'pathIdx': pathIdx, 'changes': {}}
+        if not (objectiveFType is None or key[1] == objectiveFType):
+            entry['action'] = config.KEYNAME_OBJECTIVE_SKIP
+        elif roiIgnoreFunc(key[0]):
+            entry['action'] = config.KEYNAME_OBJECTIVE_IGNORE
+        elif not objectivesFromPath[pathIdx].weight > 0:
+            entry['action'] = config.KEYNAME_OBJECTIVE_SKIP
+        diff.append(entry)
+
+    return diff
+
+def applyObjectiveDiff(diff, objectivesFromRS, objectivesFromPath, verbose=True):
+    """
+    Applies the updates/additions of getObjectiveDiff()
+    """
+
+    applyStatus = True
+    for entry in diff:
+        try:
+            if entry['action'] == config.KEYNAME_OBJECTIVE_UPDATE:
+                parameters = objectivesFromRS[entry['rsIdx']].DoseFunctionParameters
+                for attribute, (valueOld, valueNew) in entry['changes'].items():
+                    setattr(parameters, attribute, valueNew)
+                if verbose: print ('  -- [applyObjectiveDiff()] roi: {}, \tfType: {}, \t{}'.format(entry['roi'], entry['functionType'], ', '.join(f'{attribute}: {valueOld} --> {valueNew}' for attribute, (valueOld, valueNew) in entry['changes'].items())))
+            elif entry['action'] == config.KEYNAME_OBJECTIVE_ADD:
+                objectivesFromPath[entry['pathIdx']].apply()
+                if verbose: print (' - [applyObjectiveDiff()] Adding new objective for {} of type {} with weight: {}'.format(entry['roi'], entry['functionType'], objectivesFromPath[entry['pathIdx']].weight))
+        except:
+            traceback.print_exc()
+            applyStatus = False
+
+    return applyStatus
+
+def saveObjectiveDiff(pathPatient, planName, diff):
+
+    try:
+        if pathPatient is None:
+            return
+        
+        diffJSON = []
+        for entry in diff:
+            entryJSON = dict(entry)
+            entryJSON['changes'] = {attribute: [float(valueOld), float(valueNew)] for attribute, (valueOld, valueNew) in entry['changes'].items()}
+            diffJSON.append(entryJSON)
+        
+        pathDiff = Path(pathPatient).joinpath(config.FILENAME_OBJECTIVE_DIFF.format(planName))
+        with open(str(pathDiff), 'w') as fp:
+            json.dump(diffJSON, fp, indent=4)
+    
+    except:
+        traceback.print_exc()
+
+class RoiIgnoreRules:
+    """
+    Compiled ROI-ignore rules of one (plan stage, function type): exact names are a set lookup and partial names are one combined regex
+    """
+
+    def __init__(self, roisNoIgnore=[], roisFullIgnore=[], roisPartialIgnore=[]):
+
+        self.roisNoIgnore   = frozenset(roisNoIgnore)
+        self.roisFullIgnore = frozenset(roisFullIgnore)
+        self.regexPartialIgnore = None
+        if len(roisPartialIgnore):
+            self.regexPartialIgnore = re.compile('|'.join('(?:{})'.format(roiPartialIgnore) for roiPartialIgnore in roisPartialIgnore))
+        self.roiIgnoreBools = {}
+
+    def isIgnored(self, roiName):
+
+        roiIgnoreBool = self.roiIgnoreBools.get(roiName, None)
+        if roiIgnoreBool is None:
+            if roiName in self.roisNoIgnore:
+                roiIgnoreBool = False
+            elif roiName in self.roisFullIgnore:
+                roiIgnoreBool = True
+            elif self.regexPartialIgnore is not None:
+                roiIgnoreBool = self.regexPartialIgnore.search(str(roiName).lower()) is not None
+            else:
+                roiIgnoreBool = False
+            self.roiIgnoreBools[roiName] = roiIgnoreBool
+
+        return roiIgnoreBool
+
+    def classify(self, roiNames):
+        return [self.isIgnored(roiName) for roiName in roiNames]
+
+class RoiIgnoreRuleEngine:
+    """
+    Ignore rules (while updating objectives) for each plan stage
+
+    Params
+    ------
+    roisNoIgnore: List, ROIs that are never ignored
+    stageRules: List of [planSuffixes, objectiveFType, roisFullIgnore, roisPartialIgnore], the first stage whose suffix is in the plan name (and whose objectiveFType matches) is used
+    """
+
+    def __init__(self, roisNoIgnore, stageRules):
+
+        self.roisNoIgnore = roisNoIgnore
+        self.stageRules   = [[tuple(planSuffixes), objectiveFType, RoiIgnoreRules(roisNoIgnore, roisFullIgnore, roisPartialIgnore)] 
+                                for planSuffixes, objectiveFType, roisFullIgnore, roisPartialIgnore in stageRules]
+        self.rulesDefault = RoiIgnoreRules(roisNoIgnore)
+        self.rulesForPlan = {}
+
+    def getRules(self, planName, objectiveFType):
+
+        key = (planName, objectiveFType)
+        rules = self.rulesForPlan.get(key, None)
+        if rules is None:
+            rules = self.rulesDefault
+            for planSuffixes, stageFType, stageRules in self.stageRules:
+                if stageFType == objectiveFType and any(planSuffix in planName for planSuffix in planSuffixes):
+                    rules = stageRules
+                    break
+            self.rulesForPlan[key] = rules
+
+        return rules
+
+    def isIgnored(self, planName, objectiveFType, roiName):
+        return self.getRules(planName, objectiveFType).isIgnored(roiName)
+
+    def classify(self, planName, objectiveFType, roiNames):
+        return self.getRules(planName, objectiveFType).classify(roiNames)
 
 def resetObjectives(plan, beamset):
 
@@ -606,13 +1077,53 @@ def getV95ForROI(case, beamset, roiName):
 
 ########## Optimization RELATED ##########
 
+OPTIMIZATION_TRAJECTORIES = {} # {planName: [[objective values of the iterations of that run] for each RunOptimization()]}
+
+def getOptimizationSteps(optSteps):
+    """
+    Params
+    ------
+    optSteps: int (fixed number of runs) or Dict with config.KEYNAME_OPT_MIN_STEPS, config.KEYNAME_OPT_MAX_STEPS and (optional) config.KEYNAME_OPT_CONVERGE_RUNS, config.KEYNAME_OPT_CONVERGE_TOL
+
+    Returns
+    -------
+    minCount, maxCount, convergeRuns, convergeTol (convergeRuns=None for a fixed number of runs)
+    """
+
+    if type(optSteps) == dict:
+        maxCount = int(optSteps[config.KEYNAME_OPT_MAX_STEPS])
+        minCount = int(optSteps.get(config.KEYNAME_OPT_MIN_STEPS, 1))
+        return min(minCount, maxCount), maxCount, int(optSteps.get(config.KEYNAME_OPT_CONVERGE_RUNS, config.OPT_CONVERGE_RUNS)), float(optSteps.get(config.KEYNAME_OPT_CONVERGE_TOL, config.OPT_CONVERGE_TOL))
+    
+    return int(optSteps), int(optSteps), None, None
+
+def checkOptimizationConverged(objectiveValues, convergeRuns, convergeTol):
+    """
+    True if the relative improvement of the objective over the last convergeRuns runs is below convergeTol
+    """
+
+    if convergeRuns is None or len(objectiveValues) <= convergeRuns:
+        return False
+    
+    objectiveValueOld, objectiveValueNew = objectiveValues[-1-convergeRuns], objectiveValues[-1]
+    if objectiveValueOld == 0:
+        return True
+    
+    return (objectiveValueOld - objectiveValueNew) / abs(objectiveValueOld) < convergeTol
+
+def getOptimizationTrajectory(planName):
+    return OPTIMIZATION_TRAJECTORIES.get(planName, [])
+
 def optimizePlan(planName, count=4, reset=True, pathIsoDoseXML=None):
+    """
+    count: int or Dict, see getOptimizationSteps() (a Dict stops early once the objective has converged)
+    """
 
     optimizeStatus = False
     objectiveValues = []
     try:
         # Step 1 - Get plan and beamset
-        patient = rayStationSave()
+        patient = rayStationSave(dirty=False)
         case    = patient.Cases[0]
         plan    = case.TreatmentPlans[planName]
         beamset = case.TreatmentPlans[planName].BeamSets[planName]
@@ -627,35 +1138,913 @@ def optimizePlan(planName, count=4, reset=True, pathIsoDoseXML=None):
             if plan.PlanOptimizations[beamSetIndex].ProgressOfOptimization is not None:
                 objectiveValue = plan.PlanOptimizations[beamSetIndex].ProgressOfOptimization.ObjectiveValues[-1] # [TODO: range = (0.36,?)]
                 print (' - [optimizePlan()][Patient={}][Plan={}] Previous objective {:.4f}'.format(getPatientIdentifier(patient), planName, objectiveValue))
-        _ = rayStationSave()
+        _ = rayStationSave(commit=True)
 
         # Step 3 - Run optimization
         times = []
-        for runID in range(count):
+        minCount, maxCount, convergeRuns, convergeTol = getOptimizationSteps(count)
+        OPTIMIZATION_TRAJECTORIES[planName] = []
+        for runID in range(maxCount):
             t0 = time.time()
-            print (' - [optimizePlan()][Patient={}][Plan={}] Running optimization step {}/{} ... '.format(getPatientIdentifier(patient), planName, runID+1, count))
+            print (' - [optimizePlan()][Patient={}][Plan={}] Running optimization step {}/{} ... '.format(getPatientIdentifier(patient), planName, runID+1, maxCount))
+            progressOfOptimization = plan.PlanOptimizations[beamSetIndex].ProgressOfOptimization
+            prevLen = len(progressOfOptimization.ObjectiveValues) if progressOfOptimization is not None else 0 # ObjectiveValues keeps growing across runs (until a reset)
             plan.PlanOptimizations[beamSetIndex].RunOptimization()   
+            invalidateDoseStatistics(planName)
             times.append(time.time() - t0)
             try:
-                objectiveValue = plan.PlanOptimizations[beamSetIndex].ProgressOfOptimization.ObjectiveValues[-1] # [TODO: range = (0.36,?)]
-                print (' --- [optimizePlan()] Optimization step {}/{} took {:.2f} seconds with mean objective: {:.4f}'.format(runID+1, count, times[-1], objectiveValue))
+                objectiveTrajectory = list(plan.PlanOptimizations[beamSetIndex].ProgressOfOptimization.ObjectiveValues)[prevLen:] # only the iterations of this run
+                objectiveValue = objectiveTrajectory[-1] # [TODO: range = (0.36,?)]
+                print (' --- [optimizePlan()] Optimization step {}/{} took {:.2f} seconds with mean objective: {:.4f}'.format(runID+1, maxCount, times[-1], objectiveValue))
                 objectiveValues.append(objectiveValue)
+                OPTIMIZATION_TRAJECTORIES[planName].append(objectiveTrajectory)
             except:
                 traceback.print_exc()
-        print (' - [optimizePlan()] Optimization took total {:.2f} seconds'.format(np.sum(times)))
+            
+            if runID+1 >= minCount and checkOptimizationConverged(objectiveValues, convergeRuns, convergeTol):
+                print (' - [optimizePlan()] Objective converged (rel. improvement < {} over last {} run(s)) after {}/{} steps'.format(convergeTol, convergeRuns, runID+1, maxCount))
+                break
+        print (' - [optimizePlan()] Optimization took total {:.2f} seconds with mean objective: {}'.format(np.sum(times), objectiveValues[-1] if len(objectiveValues) else None))
 
-        if runID == count-1:
+        if len(times) == maxCount or checkOptimizationConverged(objectiveValues, convergeRuns, convergeTol):
             optimizeStatus = True
         
         if optimizeStatus:
             applyIsoDoseColors(pathIsoDoseXML, case, beamset)
         else:
-            print (' - [optimizePlan()] Full optimization failed, not applying isodose colors')
+            print (' - [optimizePlan()] Full optimization failed, not applying isodose colors')
+
+    except:
+        traceback.print_exc()
+    
+    return optimizeStatus, objectiveValues
+
+########## STAGE LEDGER RELATED ##########
+
+LOCK_STAGE_LEDGER = threading.Lock()
+
+def getFileHash(pathFile):
+
+    fileHash = None
+    try:
+        if pathFile is not None and Path(pathFile).exists():
+            with open(str(pathFile), 'rb') as fp:
+                fileHash = hashlib.md5(fp.read()).hexdigest()
+    except:
+        traceback.print_exc()
+    
+    return fileHash
+
+def getStageInputsHash(pathPatient, basePlanName, newPlanName, pathObjectives, stageParams):
+    """
+    Params
+    ------
+    pathPatient: Path, patient folder containing config.FILENAME_STAGE_LEDGER
+    basePlanName, newPlanName: String, plan names of the stage
+    pathObjectives: Path, objectives .xml used by the stage
+    stageParams: Dict, any other parameters that define the stage (e.g. objectiveFType, optSteps, optReset)
+
+    NOTE: The hash and run id of the base plan's stage are included, so that a re-run of an earlier stage (even with the same inputs) invalidates all later stages
+    """
+
+    stageLedger = readStageLedger(pathPatient)
+    stageInputs = {
+        'basePlanName'      : basePlanName
+        , 'newPlanName'     : newPlanName
+        , 'objectivesHash'  : getFileHash(pathObjectives)
+        , 'baseInputsHash'  : stageLedger.get(basePlanName, {}).get(config.KEYNAME_INPUTS_HASH, None)
+        , 'baseRunId'       : stageLedger.get(basePlanName, {}).get(config.KEYNAME_RUN_ID, None)
+        , 'stageParams'     : {key: str(stageParams[key]) for key in stageParams}
+    }
+    
+    return hashlib.md5(json.dumps(stageInputs, sort_keys=True).encode('utf-8')).hexdigest()
+
+def readStageLedger(pathPatient):
+
+    stageLedger = {}
+    try:
+        if pathPatient is not None:
+            pathStageLedger = Path(pathPatient).joinpath(config.FILENAME_STAGE_LEDGER)
+            if Path(pathStageLedger).exists():
+                with open(str(pathStageLedger), 'r') as fp:
+                    stageLedger = json.load(fp)
+    except:
+        traceback.print_exc()
+    
+    return stageLedger
+
+def getStageFromLedger(pathPatient, planName, inputsHash):
+    """
+    Returns the ledger entry of a stage only if it is done with the same inputs
+    """
+    
+    stageEntry = readStageLedger(pathPatient).get(planName, None)
+    if stageEntry is not None:
+        if stageEntry[config.KEYNAME_STATUS] == config.KEYNAME_STAGE_DONE and stageEntry[config.KEYNAME_INPUTS_HASH] == inputsHash:
+            return stageEntry
+    
+    return None
+
+def updateStageLedger(pathPatient, planName, inputsHash, status, objValue=-1, timeTaken=-1, objTrajectory=None):
+
+    try:
+        if pathPatient is None:
+            return
+        
+        with LOCK_STAGE_LEDGER:
+            stageLedger = readStageLedger(pathPatient)
+            # a new run id for every (re-)run of a stage, kept until it finishes
+            runId = stageLedger.get(planName, {}).get(config.KEYNAME_RUN_ID, None)
+            if status == config.KEYNAME_STAGE_RUNNING or runId is None:
+                runId = uuid.uuid4().hex
+            stageLedger[planName] = {
+                config.KEYNAME_INPUTS_HASH : inputsHash
+                , config.KEYNAME_RUN_ID    : runId
+                , config.KEYNAME_STATUS    : status
+                , config.KEYNAME_OBJ_VALUE : objValue
+                , config.KEYNAME_TIME      : timeTaken
+                , config.KEYNAME_TIMESTAMP : datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+            }
+            if objTrajectory is not None:
+                stageLedger[planName][config.KEYNAME_OBJ_TRAJECTORY] = objTrajectory
+
+            # Write to a temp file first, so that a crash does not leave a half-written ledger
+            pathStageLedger    = Path(pathPatient).joinpath(config.FILENAME_STAGE_LEDGER)
+            pathStageLedgerTmp = Path(pathPatient).joinpath(config.FILENAME_STAGE_LEDGER + '.tmp')
+            with open(str(pathStageLedgerTmp), 'w') as fp:
+                json.dump(stageLedger, fp, indent=4)
+            os.replace(str(pathStageLedgerTmp), str(pathStageLedger))
+    
+    except:
+        traceback.print_exc()
+
+def resumeStage(pathPatient, basePlanName, newPlanName, pathObjectives, stageParams):
+    """
+    Returns
+    -------
+    inputsHash: String, hash of the stage inputs (to be passed to updateStageLedger())
+    stageEntry: Dict, ledger entry if this stage is already done (and the plan still exists in RStation), else None
+
+    NOTE: If a previous run crashed during this stage, the half-finished plan is deleted so that the stage is re-run from its base plan
+    """
+
+    inputsHash, stageEntry = None, None
+    try:
+        if pathPatient is None:
+            return inputsHash, stageEntry
+        
+        # Step 1 - Check ledger
+        inputsHash = getStageInputsHash(pathPatient, basePlanName, newPlanName, pathObjectives, stageParams)
+        _, case, newPlan, _ = getPatientAndPlan(newPlanName)
+        stageEntry = getStageFromLedger(pathPatient, newPlanName, inputsHash)
+        if stageEntry is not None and newPlan is not None:
+            print (f' - [resumeStage()] Stage {newPlanName} already done (objValue={stageEntry[config.KEYNAME_OBJ_VALUE]}, time={stageEntry[config.KEYNAME_TIME]} s). Skipping ...')
+            return inputsHash, stageEntry
+        stageEntry = None
+
+        # Step 2 - Delete stale plan (only if it was created by an earlier run of this stage)
+        if newPlan is not None and newPlanName in readStageLedger(pathPatient):
+            print (f' - [resumeStage()] Stage {newPlanName} is incomplete or outdated. Deleting plan and re-running ...')
+            case.DeletePlan(PlanName=newPlanName)
+            getCaseNameIndex(case).removePlan(newPlanName)
+            invalidateDoseStatistics(newPlanName)
+            rayStationSave()
+
+    except:
+        traceback.print_exc()
+    
+    return inputsHash, stageEntry
+
+########## WARM START RELATED ##########
+
+LOCK_WARM_START = threading.Lock()
+
+def getContourDiceScores(case, roiNames):
+    """
+    Dice of each clinical ROI with its auto-contour (roiName + config.KEY_AUTOCONTOUR_SUFFIX), for ROIs that have both
+
+    Returns
+    -------
+    diceScores: Dict, {roiName: dice} (dice=None if RS could not compare the two)
+    """
+
+    diceScores = {}
+    try:
+        caseNameIndex = getCaseNameIndex(case)
+        structureSet  = case.PatientModel.StructureSets[0]
+        for roiName in roiNames:
+            roiNameAuto = roiName + config.KEY_AUTOCONTOUR_SUFFIX
+            if not (caseNameIndex.hasContours(roiName) and caseNameIndex.hasContours(roiNameAuto)):
+                continue
+            try:
+                comparison = structureSet.ComparisonOfRoiGeometries(RoiA=roiName, RoiB=roiNameAuto, ComputeDistanceToAgreementMeasures=False)
+                diceScores[roiName] = float(comparison['DiceSimilarityCoefficient'])
+            except:
+                traceback.print_exc()
+                diceScores[roiName] = None
+    except:
+        traceback.print_exc()
+    
+    return diceScores
+
+def getWarmStartBasePlan(pathPatient, basePlanName, warmStartPlanName, newPlanName, roiNames):
+    """
+    Returns warmStartPlanName (i.e. copy its optimized segments/spots instead of starting from scratch) if
+     1) it exists (and is done, as per config.FILENAME_STAGE_LEDGER) and 2) the auto-contours of roiNames are near-identical to the clinical ones
+
+    Params
+    ------
+    basePlanName: String, plan to start from otherwise
+    warmStartPlanName: String, e.g. the clinical class-solution plan (None = no warm start)
+    roiNames: List, ROIs that differ between the clinical and auto-contour objectives (e.g. config.PHOTON_POTENTIAL_ROIS_TO_RENAME_FOR_AUTO)
+
+    Returns
+    -------
+    basePlanName: String
+    warmStartBool: Bool
+    """
+
+    if warmStartPlanName is None:
+        return basePlanName, False
+    
+    warmStartBool = False
+    diceScores = {}
+    try:
+
+        # Step 1 - Check plan
+        _, case, warmStartPlan, _ = getPatientAndPlan(warmStartPlanName)
+        if warmStartPlan is None:
+            print (f' - [getWarmStartBasePlan()] No plan {warmStartPlanName} to warm-start {newPlanName} from')
+            return basePlanName, warmStartBool
+        if pathPatient is not None:
+            if readStageLedger(pathPatient).get(warmStartPlanName, {}).get(config.KEYNAME_STATUS, None) != config.KEYNAME_STAGE_DONE:
+                print (f' - [getWarmStartBasePlan()] Stage {warmStartPlanName} is not done, not warm-starting {newPlanName}')
+                return basePlanName, warmStartBool
+        
+        # Step 2 - Check contours
+        diceScores = getContourDiceScores(case, roiNames)
+        if len(diceScores) and all(diceScores[roiName] is not None and diceScores[roiName] >= config.WARM_START_MIN_DICE for roiName in diceScores):
+            warmStartBool = True
+        print (f' - [getWarmStartBasePlan()] {newPlanName} from {warmStartPlanName if warmStartBool else basePlanName} (dice: {diceScores})')
+
+        # Step 3 - Snapshot
+        saveWarmStart(pathPatient, newPlanName, warmStartPlanName if warmStartBool else basePlanName, warmStartBool, diceScores)
+
+    except:
+        traceback.print_exc()
+    
+    return warmStartPlanName if warmStartBool else basePlanName, warmStartBool
+
+def saveWarmStart(pathPatient, newPlanName, basePlanName, warmStartBool, diceScores):
+
+    try:
+        if pathPatient is None:
+            return
+        
+        with LOCK_WARM_START:
+            pathWarmStart = Path(pathPatient).joinpath(config.FILENAME_WARM_START)
+            warmStart = {}
+            if pathWarmStart.exists():
+                with open(str(pathWarmStart), 'r') as fp:
+                    warmStart = json.load(fp)
+            warmStart[newPlanName] = {
+                config.KEYNAME_BASE_PLAN        : basePlanName
+                , config.KEYNAME_WARM_START     : warmStartBool
+                , config.KEYNAME_DICE           : diceScores
+                , config.KEYNAME_OBJ_TRAJECTORY : readStageLedger(pathPatient).get(basePlanName, {}).get(config.KEYNAME_OBJ_TRAJECTORY, None)
+                , config.KEYNAME_TIMESTAMP      : datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+            }
+            with open(str(pathWarmStart), 'w') as fp:
+                json.dump(warmStart, fp, indent=4)
+    
+    except:
+        traceback.print_exc()
+
+########## STAGE DAG RELATED ##########
+
+LOCK_RS_SESSION = threading.RLock() # the scripting session can only do one thing at a time
+
+def getStage(func, deps=[], after=[], usesRS=True):
+    """
+    Params
+    ------
+    func: Callable, func(stageResults) -> (status, value), where stageResults = {stageName: value} of all finished stages
+    deps: List, stage names that need to succeed before this stage can run (else this stage is skipped)
+    after: List, stage names that need to be finished (succeeded, failed or skipped) before this stage can run
+    usesRS: Bool, if True the stage runs in the thread that called runStageDAG() (one at a time, holding LOCK_RS_SESSION).
+            Only stages that do not touch RStation (False) can run on worker threads, i.e. overlap with a RStation stage
+    """
+    return {'func': func, 'deps': list(deps), 'after': list(after), 'usesRS': usesRS}
+
+def runStage(stageName, stage, stageResults):
+
+    t0 = time.time()
+    status, value = False, None
+    try:
+        if stage['usesRS']:
+            with LOCK_RS_SESSION, RayStationSaveSession(stageName):
+                status, value = stage['func'](stageResults)
+        else:
+            status, value = stage['func'](stageResults)
+    except:
+        traceback.print_exc()
+    
+    print (f' - [runStage()] Stage {stageName} finished with status={status} (in {round(time.time() - t0, 2)} s)')
+    return status, value
+
+def runStageDAG(stages, maxWorkers=1):
+    """
+    Params
+    ------
+    stages: Dict, {stageName: getStage(...)}. For ties, stages are started in the order of this dict
+    maxWorkers: Int, number of worker threads for the stages with usesRS=False (for maxWorkers=1 all stages run one after the other in this thread)
+                Stages with usesRS=True always run in this thread (since the scripting session is bound to it), so maxWorkers>1 only lets
+                e.g. offline (numpy) evaluation overlap with the next RStation stage
+
+    Returns
+    -------
+    stageStatus: Dict, {stageName: True/False/None}, None implies the stage was skipped (since one of its deps failed)
+    stageResults: Dict, {stageName: value}
+    """
+
+    stageStatus, stageResults = {}, {}
+    try:
+
+        # Step 0 - Ignore deps/after that are not part of this DAG (e.g. plans that already exist in RStation)
+        pending = {}
+        for stageName in stages:
+            stage = dict(stages[stageName])
+            stage['deps']  = [each for each in stage['deps'] if each in stages]
+            stage['after'] = [each for each in stage['after'] if each in stages]
+            pending[stageName] = stage
+        
+        # Step 1 - Run
+        executor = None
+        if maxWorkers > 1:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=maxWorkers)
+        running = {}
+
+        def collectFinished(timeout):
+            if not len(running):
+                return
+            done, _ = concurrent.futures.wait(list(running), timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                stageName = running.pop(future)
+                status, value = future.result()
+                stageStatus[stageName]  = bool(status)
+                stageResults[stageName] = value
+
+        while len(pending) or len(running):
+            
+            # Step 1.1 - Skip stages with failed deps (repeat, since skips cascade)
+            skipped = True
+            while skipped:
+                skipped = False
+                for stageName in list(pending):
+                    if any(stageStatus[dep] is not True for dep in pending[stageName]['deps'] if dep in stageStatus):
+                        print (f' - [runStageDAG()] Skipping stage {stageName} (deps={pending[stageName]["deps"]})')
+                        stageStatus[stageName] = None
+                        del pending[stageName]
+                        skipped = True
+            
+            # Step 1.2 - Stages whose deps/after are finished (offline stages go to the worker threads)
+            readyStageNames = [stageName for stageName in pending if all(each in stageStatus for each in pending[stageName]['deps'] + pending[stageName]['after'])]
+            if executor is not None:
+                for stageName in [each for each in readyStageNames if not pending[each]['usesRS']]:
+                    future = executor.submit(runStage, stageName, pending.pop(stageName), dict(stageResults))
+                    running[future] = stageName
+                readyStageNames = [each for each in readyStageNames if each in pending]
+
+            # Step 1.3 - Run the next stage in this thread
+            if len(readyStageNames):
+                stageName = readyStageNames[0]
+                status, value = runStage(stageName, pending.pop(stageName), dict(stageResults))
+                stageStatus[stageName]  = bool(status)
+                stageResults[stageName] = value
+                collectFinished(timeout=0)
+                continue
+            
+            if not len(running):
+                print (f' - [runStageDAG()] Stages {list(pending)} can never run (cyclic deps?)')
+                break
+
+            # Step 1.4 - Wait for a worker thread
+            collectFinished(timeout=None)
+        
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    except:
+        traceback.print_exc()
+    
+    return stageStatus, stageResults
+
+########## ROBUST EVALUATION RELATED ##########
+
+class ScenarioDoseAccumulator:
+    """
+    Voxelwise min/max (and optionally argmin/argmax and mean/variance) over the perturbed dose scenarios of a robust evaluation.
+    All buffers are allocated once (from the grid of the first scenario) and updated in place.
+
+    Usage
+    -----
+    accumulator = ScenarioDoseAccumulator(trackArg=True, trackStats=True)
+    for scenarioId, ... : accumulator.update(doseEvalObj.DoseValues.DoseData)
+    accumulator.doseMin, accumulator.doseMax, accumulator.argMin, accumulator.argMax, accumulator.getMean(), accumulator.getVariance()
+    """
+
+    def __init__(self, trackArg=False, trackStats=False, dtype=np.float32):
+        self.trackArg   = trackArg
+        self.trackStats = trackStats
+        self.dtype      = dtype
+        self.count      = 0
+
+        self.doseMin, self.doseMax = None, None
+        self.argMin, self.argMax   = None, None # scenario index (i.e. count of update() calls) that gave the min/max
+        self.mean, self.m2         = None, None # Welford's running mean and sum of squared differences
+        self._mask, self._delta, self._delta2 = None, None, None
+
+    def _allocate(self, dose):
+        self.doseMin = np.array(dose, dtype=self.dtype, copy=True)
+        self.doseMax = np.array(dose, dtype=self.dtype, copy=True)
+        if self.trackArg:
+            self.argMin = np.zeros(dose.shape, dtype=np.int16)
+            self.argMax = np.zeros(dose.shape, dtype=np.int16)
+            self._mask  = np.empty(dose.shape, dtype=bool)
+        if self.trackStats:
+            self.mean    = np.array(dose, dtype=self.dtype, copy=True)
+            self.m2      = np.zeros(dose.shape, dtype=self.dtype)
+            self._delta  = np.empty(dose.shape, dtype=self.dtype)
+            self._delta2 = np.empty(dose.shape, dtype=self.dtype)
+
+    def update(self, dose3Darray):
+
+        dose = np.asarray(dose3Darray, dtype=self.dtype)
+
+        # Step 1 - First scenario
+        if self.count == 0:
+            self._allocate(dose)
+            self.count = 1
+            return
+        
+        if dose.shape != self.doseMin.shape:
+            raise ValueError(' - [ScenarioDoseAccumulator.update()] Dose grid shape {} does not match {}'.format(dose.shape, self.doseMin.shape))
+        
+        # Step 2 - Argmin/argmax (before min/max are updated)
+        if self.trackArg:
+            np.less(dose, self.doseMin, out=self._mask)
+            np.copyto(self.argMin, self.count, where=self._mask)
+            np.greater(dose, self.doseMax, out=self._mask)
+            np.copyto(self.argMax, self.count, where=self._mask)
+
+        # Step 3 - Min/max
+        np.minimum(self.doseMin, dose, out=self.doseMin)
+        np.maximum(self.doseMax, dose, out=self.doseMax)
+        self.count += 1
+
+        # Step 4 - Mean/variance
+        if self.trackStats:
+            np.subtract(dose, self.mean, out=self._delta)
+            np.divide(self._delta, self.count, out=self._delta2)
+            np.add(self.mean, self._delta2, out=self.mean)
+            np.subtract(dose, self.mean, out=self._delta2)
+            np.multiply(self._delta, self._delta2, out=self._delta2)
+            np.add(self.m2, self._delta2, out=self.m2)
+
+    def getMean(self):
+        return self.mean
+
+    def getVariance(self):
+        if self.m2 is None or self.count < 2:
+            return None
+        return self.m2 / (self.count - 1)
+
+def getXYZDict(rsObj):
+    try:
+        return {'x': float(rsObj.x), 'y': float(rsObj.y), 'z': float(rsObj.z)}
+    except:
+        return None
+
+class ScenarioDoseStore:
+    """
+    On-disk store of the perturbed doses of a robust evaluation, so that they can be re-evaluated offline (i.e. without RStation)
+     - config.FILENAME_SCENARIO_DOSES     : .npy memmap of shape (scenario, z, y, x) and dtype float32
+     - config.FILENAME_SCENARIO_DOSES_META: .json with the grid geometry and the perturbation of each scenario
+     - config.FILENAME_SCENARIO_DOSES_NOMINAL: .npy of the nominal (total) dose
+     - config.FILENAME_SCENARIO_DOSES_MASKS  : .npz of the (sparse) ROI masks on the dose grid
+
+    Usage
+    -----
+    store = ScenarioDoseStore(pathPatient, planName)
+    store.create(scenarioCount, gridShape, gridMeta)                   # in RStation
+    store.write(scenarioId, dose3Darray, isoCenterShift, densityShift) # in RStation
+    store.writeNominal(dose3Darray); store.writeRoiMasks(getDoseGridRoiMasks(doseObj, roiNames)) # in RStation
+    store.open(); store.doses[scenarioId]                              # offline
+    store.getDVHEngine(store.doses[scenarioId], store.getRoiMasks())  # offline
+    """
+
+    def __init__(self, pathFolder, planName):
+        self.pathDoses   = Path(pathFolder).joinpath(config.FILENAME_SCENARIO_DOSES.format(planName))
+        self.pathMeta    = Path(pathFolder).joinpath(config.FILENAME_SCENARIO_DOSES_META.format(planName))
+        self.pathNominal = Path(pathFolder).joinpath(config.FILENAME_SCENARIO_DOSES_NOMINAL.format(planName))
+        self.pathMasks   = Path(pathFolder).joinpath(config.FILENAME_SCENARIO_DOSES_MASKS.format(planName))
+        self.doses       = None
+        self.meta        = {}
+
+    def create(self, scenarioCount, gridShape, gridMeta={}):
+        Path(self.pathDoses).parent.mkdir(parents=True, exist_ok=True)
+        self.doses = np.lib.format.open_memmap(str(self.pathDoses), mode='w+', dtype=np.float32, shape=(scenarioCount,) + tuple(gridShape))
+        self.meta  = {config.KEYNAME_SCENARIOS: {}}
+        self.meta.update(gridMeta)
+        self.saveMeta()
+
+    def write(self, scenarioId, dose3Darray, isoCenterShift=None, densityShift=None):
+        self.doses[scenarioId] = np.asarray(dose3Darray, dtype=np.float32).reshape(self.doses.shape[1:])
+        self.meta[config.KEYNAME_SCENARIOS][str(scenarioId)] = {config.KEYNAME_ISOCENTER_SHIFT: isoCenterShift, config.KEYNAME_DENSITY_SHIFT: densityShift}
+
+    def writeNominal(self, dose3Darray):
+        np.save(str(self.pathNominal), np.asarray(dose3Darray, dtype=np.float32).reshape(self.doses.shape[1:]))
+
+    def writeRoiMasks(self, roiMasks):
+        """
+        roiMasks: Dict, {roiName: (voxelIndices, relativeVolumes)} e.g. from getDoseGridRoiMasks()
+        """
+        arrays = {}
+        for roiIdx, (roiName, (voxelIndices, relativeVolumes)) in enumerate(roiMasks.items()):
+            arrays['indices{}'.format(roiIdx)] = np.asarray(voxelIndices, dtype=np.int64)
+            arrays['volumes{}'.format(roiIdx)] = np.asarray(relativeVolumes, dtype=np.float32)
+        np.savez_compressed(str(self.pathMasks), roiNames=np.array(list(roiMasks.keys())), **arrays)
+
+    def saveMeta(self):
+        with open(str(self.pathMeta), 'w') as fp:
+            json.dump(self.meta, fp, indent=4)
+
+    def close(self):
+        if self.doses is not None:
+            self.doses.flush()
+        self.saveMeta()
+        self.doses = None
+
+    def exists(self):
+        return Path(self.pathDoses).exists() and Path(self.pathMeta).exists()
+
+    def open(self):
+        self.doses = np.load(str(self.pathDoses), mmap_mode='r')
+        with open(str(self.pathMeta), 'r') as fp:
+            self.meta = json.load(fp)
+        return self
+
+    def getScenarioIds(self):
+        """
+        Returns the sorted ids of the scenarios recorded in the meta (i.e. written via write()) that have a slot in the memmap; unwritten slots are all-zero and are skipped
+        """
+        scenarioIds = sorted(int(scenarioId) for scenarioId in self.meta.get(config.KEYNAME_SCENARIOS, {}))
+        if self.doses is not None:
+            scenarioIds = [scenarioId for scenarioId in scenarioIds if 0 <= scenarioId < self.doses.shape[0]]
+        return scenarioIds
+
+    def getScenarioCount(self):
+        return len(self.getScenarioIds())
+
+    def isComplete(self):
+        return self.doses is not None and self.getScenarioIds() == list(range(self.doses.shape[0]))
+
+    def getFractionCount(self):
+        return self.meta.get(config.KEYNAME_NUMBER_OF_FRACTIONS, 1)
+
+    def getVoxelVolume(self):
+        voxelSize = self.meta[config.KEYNAME_GRID_VOXELSIZE] # in cm
+        return voxelSize['x'] * voxelSize['y'] * voxelSize['z']
+
+    def getNominal(self):
+        if not Path(self.pathNominal).exists():
+            return None
+        return np.load(str(self.pathNominal), mmap_mode='r')
+
+    def getRoiMasks(self):
+        roiMasks = {}
+        if Path(self.pathMasks).exists():
+            with np.load(str(self.pathMasks)) as masks:
+                for roiIdx, roiName in enumerate(masks['roiNames']):
+                    roiMasks[str(roiName)] = (masks['indices{}'.format(roiIdx)], masks['volumes{}'.format(roiIdx)])
+        return roiMasks
+
+    def getDVHEngine(self, dose3Darray, roiMasks, doseScale=1.0):
+        """
+        Returns a dvhHelpers.DVHEngine for dose3Darray*doseScale (e.g. doseScale=getFractionCount() for a scenario dose) and the ROIs in roiMasks
+        """
+        engine = DVHEngine(np.asarray(dose3Darray, dtype=np.float32) * doseScale, self.getVoxelVolume())
+        for roiName, (voxelIndices, relativeVolumes) in roiMasks.items():
+            engine.addRoiFromIndices(roiName, voxelIndices, relativeVolumes)
+        return engine
+
+    def getVoxelwiseMinMax(self, trackArg=False, trackStats=False):
+        """
+        Returns a ScenarioDoseAccumulator over all (written) scenarios, reading one scenario at a time from disk
+        """
+        doseAccumulator = ScenarioDoseAccumulator(trackArg=trackArg, trackStats=trackStats)
+        for scenarioId in self.getScenarioIds():
+            doseAccumulator.update(self.doses[scenarioId])
+        return doseAccumulator
+
+def getDoseGridRoiMasks(doseObj, roiNames):
+    """
+    Returns {roiName: (voxelIndices, relativeVolumes)} from the RoiVolumeDistribution of each ROI on the dose grid of doseObj (ROIs without one are skipped)
+    """
+
+    roiMasks = {}
+    for roiName in roiNames:
+        try:
+            roiVolumeDistribution = doseObj.GetDoseGridRoi(RoiName=roiName).RoiVolumeDistribution
+            roiMasks[roiName] = (np.array(roiVolumeDistribution.VoxelIndices, dtype=np.int64), np.array(roiVolumeDistribution.RelativeVolumes, dtype=np.float32))
+        except:
+            print (f' - [getDoseGridRoiMasks()] No dose grid ROI for {roiName}')
+    
+    return roiMasks
+
+def getScenarioDoseGridMeta(doseEvalObj):
+
+    gridMeta = {}
+    try:
+        doseGrid = doseEvalObj.InDoseGrid
+        gridMeta[config.KEYNAME_GRID_CORNER]    = getXYZDict(doseGrid.Corner)
+        gridMeta[config.KEYNAME_GRID_VOXELSIZE] = getXYZDict(doseGrid.VoxelSize)
+        gridMeta[config.KEYNAME_GRID_NRVOXELS]  = getXYZDict(doseGrid.NrVoxels)
+    except:
+        traceback.print_exc()
+    
+    return gridMeta
+
+def getRobustTemplateRoiNames(pathRobustTemplate):
+    
+    roiNames = []
+    if Path(pathRobustTemplate).exists():
+        with open(str(pathRobustTemplate), 'r') as fp:
+            robustGoals = [parseRobustGoalKey(templateKey) for templateKey in json.load(fp)]
+        roiNames = list(dict.fromkeys(robustGoal.roiName for robustGoal in robustGoals if robustGoal is not None))
+    
+    return roiNames
+
+def getRobustGoalAcceptance(robustGoal):
+    # acceptance level (in cGy) of a dvhHelpers.RobustGoal
+    if robustGoal.acceptanceValue is None or not robustGoal.isRelative:
+        return robustGoal.acceptanceValue
+    prescription = config.ROBUST_GOAL_PRESCRIPTIONS.get(robustGoal.roiName, config.ROBUST_GOAL_PRESCRIPTION_DEFAULT)
+    return robustGoal.acceptanceValue / 100 * prescription
+
+def getRobustGoalStatus(robustGoal, value):
+    if robustGoal.criteria == '' or value == '':
+        return None
+    acceptance = getRobustGoalAcceptance(robustGoal)
+    if robustGoal.criteria == '<':
+        return value <= acceptance
+    return value >= acceptance
+
+def evaluateRobustTemplateFromStore(pathFolder, planName, pathRobustTemplate, pathRobustResultsSave=None):
+    """
+    Offline (i.e. without RStation) version of the goal evaluation in hnDoseProtons.robustEvaluationViaSelf()
+     - the keys of pathRobustTemplate (see dvhHelpers.parseRobustGoalKey()) are evaluated with a dvhHelpers.DVHEngine on each scenario dose, the voxelwise min/max dose and the nominal dose of a ScenarioDoseStore
+     - scenario doses are fraction doses and are scaled to the full treatment (as ScaleFractionDoseToBeamSet=True in RStation)
+     - goals without a threshold (e.g. 'Parotid_L [Dmean (cGy)]') keep config.KEYNAME_PASSED=-1
+
+    Returns
+    -------
+    robustTemplate: Dict, {templateKey: {config.KEYNAME_PASSED, config.KEYNAME_VOXELWISE_WORST, config.KEYNAME_NOMINAL_DOSE, config.KEYNAME_SCENARIOS}}, None if the store or template is missing or not all scenarios of the store were written
+    """
+
+    robustTemplate = None
+
+    try:
+
+        # Step 1 - Init
+        store = ScenarioDoseStore(pathFolder, planName)
+        if not store.exists() or not Path(pathRobustTemplate).exists():
+            print (f' - [evaluateRobustTemplateFromStore()] Scenario doses ({store.pathDoses}) or robust template ({pathRobustTemplate}) not found')
+            return robustTemplate
+        store.open()
+        if not store.isComplete():
+            print (f' - [evaluateRobustTemplateFromStore()] Scenario doses ({store.pathDoses}) are incomplete: {store.getScenarioCount()}/{store.doses.shape[0]} scenarios written')
+            return robustTemplate
+        with open(str(pathRobustTemplate), 'r') as fp:
+            robustTemplate = json.load(fp)
+
+        roiMasks    = store.getRoiMasks()
+        robustGoals = {}
+        for templateKey in robustTemplate:
+            robustGoal = parseRobustGoalKey(templateKey)
+            if robustGoal is None:
+                print (f' - [evaluateRobustTemplateFromStore()] Cant parse robust goal: {templateKey}')
+            elif robustGoal.roiName not in roiMasks:
+                print (f' - [evaluateRobustTemplateFromStore()] No ROI mask for robust goal: {templateKey}')
+            else:
+                robustGoals[templateKey] = robustGoal
+        goalRoiMasks = {roiName: roiMasks[roiName] for roiName in set(robustGoal.roiName for robustGoal in robustGoals.values())}
+
+        def getGoalValues(dose3Darray, doseScale):
+            engine = store.getDVHEngine(dose3Darray, goalRoiMasks, doseScale=doseScale)
+            return {templateKey: engine.getDVHParam(robustGoal.roiName, robustGoal.dvhLabel) for templateKey, robustGoal in robustGoals.items()}
+
+        # Step 2 - Scenario doses (one at a time from disk) and voxelwise min/max dose
+        fractionCount   = store.getFractionCount()
+        scenarioValues  = [getGoalValues(store.doses[scenarioId], fractionCount) for scenarioId in store.getScenarioIds()]
+        doseAccumulator = store.getVoxelwiseMinMax()
+        minValues       = getGoalValues(doseAccumulator.doseMin, fractionCount)
+        maxValues       = getGoalValues(doseAccumulator.doseMax, fractionCount)
+
+        # Step 3 - Nominal dose
+        doseNominal   = store.getNominal()
+        nominalValues = getGoalValues(doseNominal, 1.0) if doseNominal is not None else {}
+
+        # Step 4 - Fill template
+        for templateKey, robustGoal in robustGoals.items():
+            values = [scenarioValue[templateKey] for scenarioValue in scenarioValues]
+            robustTemplate[templateKey][config.KEYNAME_SCENARIOS] = [round(value, 4) if value != '' else value for value in values]
+            
+            statuses = [getRobustGoalStatus(robustGoal, value) for value in values]
+            if robustGoal.criteria != '' and len(statuses):
+                robustTemplate[templateKey][config.KEYNAME_PASSED] = round(sum(status is True for status in statuses) / len(statuses), 4)
+
+            if nominalValues.get(templateKey, '') != '':
+                robustTemplate[templateKey][config.KEYNAME_NOMINAL_DOSE] = round(nominalValues[templateKey], 4)
+
+            worstValue = minValues[templateKey] if templateKey in config.OBJECTIVES_ROIS_TUMOR else maxValues[templateKey]
+            if worstValue != '':
+                robustTemplate[templateKey][config.KEYNAME_VOXELWISE_WORST] = round(worstValue, 4)
+
+        # Step 5 - Save (same layout as hnDoseProtons.robustEvaluationViaSelf())
+        if pathRobustResultsSave is not None:
+            print (f' - [evaluateRobustTemplateFromStore()] Saving robustTemplate to: {pathRobustResultsSave}')
+            with open(str(pathRobustResultsSave), 'w') as fp:
+                json.dump({planName: robustTemplate}, fp, indent=4)
+
+    except:
+        traceback.print_exc()
+        robustTemplate = None
+
+    return robustTemplate
+
+########## DOSE STATISTICS CACHE RELATED ##########
+
+LOCK_DOSE_STATISTICS  = threading.Lock()
+DOSE_STATE_VERSIONS   = {} # {(patientIdentifier, planName): version}, bumped whenever the dose of that plan changes
+DOSE_STATISTICS_CACHE = {} # {(patientIdentifier, planName, version, roiName, doseType): value in cGy}
+
+def getDoseStateKey(planName):
+    return (getPatientIdentifier(connect.get_current("Patient")), planName)
+
+def invalidateDoseStatistics(planName):
+    """
+    To be called whenever the dose of planName changes (re-optimization, dose (re)computation, plan deletion)
+    """
+    try:
+        doseStateKey = getDoseStateKey(planName)
+        with LOCK_DOSE_STATISTICS:
+            DOSE_STATE_VERSIONS[doseStateKey] = DOSE_STATE_VERSIONS.get(doseStateKey, 0) + 1
+            for cacheKey in [cacheKey for cacheKey in DOSE_STATISTICS_CACHE if cacheKey[:2] == doseStateKey]:
+                del DOSE_STATISTICS_CACHE[cacheKey]
+    except:
+        traceback.print_exc()
+
+def getDoseStatistic(planName, dose, roiName, doseType):
+    """
+    Plan-scoped cache around dose.GetDoseStatistic() shared by evaluatePlans(), KNONTCP and robust evaluation
+
+    Params
+    ------
+    planName: str, plan that dose belongs to (i.e. dose = plan.TreatmentCourse.TotalDose)
+    dose: RStation dose distribution
+    doseType: str, 'Min', 'Max', 'Average'
+    """
+
+    doseStateKey = getDoseStateKey(planName)
+    with LOCK_DOSE_STATISTICS:
+        cacheKey = doseStateKey + (DOSE_STATE_VERSIONS.get(doseStateKey, 0), roiName, doseType)
+        if cacheKey in DOSE_STATISTICS_CACHE:
+            return DOSE_STATISTICS_CACHE[cacheKey]
+
+    value = dose.GetDoseStatistic(RoiName=roiName, DoseType=doseType)
+    with LOCK_DOSE_STATISTICS:
+        DOSE_STATISTICS_CACHE[cacheKey] = value
+
+    return value
+
+########## RS NAME INDEX RELATED ##########
+
+CASE_NAME_INDEXES = {} # {(patientIdentifier, caseName): CaseNameIndex}
+
+def getRSStandardName(name, isRoi=True):
+    """
+    Name under which RStation lists a ROI/plan in dir(), e.g. 'Parotid_L-(CTV_DL1+3mm)' --> '_Parotid_L_CTV_DL1_3mm_'
+    """
+    if isRoi:
+        nameRSStandard = config.RS_CHECK_PREFIX + str(name).replace('-(', '-').translate(config.RS_STR_TRANSLATE_OBJ)
+        return nameRSStandard.replace('___', '_')
+    return config.RS_CHECK_PREFIX + str(name).translate(config.RS_STR_TRANSLATE_OBJ)
+
+class CaseNameIndex:
+    """
+    Case-scoped index of ROI and plan names, built once (instead of a dir() over RStation objects for every check)
+     - has to be updated (addRoi(), renameRoi(), updateRoi(), addPlan(), removePlan() etc) when ROIs/plans are created/renamed/deleted
+     - hasContours and volume of a ROI are queried on first use and reset by updateRoi()
+    """
+
+    def __init__(self, case):
+        self.case = case
+        self.build()
+
+    def build(self):
+        self.rois  = {} # {roiName: {'nameRSStandard': str, 'hasContours': None/bool, 'volume': None/float}}
+        self.plans = [] # [planName] in the order of case.TreatmentPlans
+        self.roisRSStandard, self.plansRSStandard = {}, {}
+        for roiGeometry in self.case.PatientModel.StructureSets[0].RoiGeometries:
+            self.addRoi(roiGeometry.OfRoi.Name)
+        for plan in self.case.TreatmentPlans:
+            self.addPlan(plan.Name)
+
+    def addRoi(self, roiName):
+        self.rois[roiName] = {'nameRSStandard': getRSStandardName(roiName), 'hasContours': None, 'volume': None}
+        self.roisRSStandard[self.rois[roiName]['nameRSStandard']] = roiName
+
+    def removeRoi(self, roiName):
+        if roiName in self.rois:
+            self.roisRSStandard.pop(self.rois.pop(roiName)['nameRSStandard'], None)
+
+    def renameRoi(self, roiName, roiNameNew):
+        roiEntry = self.rois.get(roiName, None)
+        self.removeRoi(roiName)
+        self.addRoi(roiNameNew)
+        if roiEntry is not None:
+            self.rois[roiNameNew]['hasContours'], self.rois[roiNameNew]['volume'] = roiEntry['hasContours'], roiEntry['volume']
+
+    def updateRoi(self, roiName):
+        # for when the geometry of a ROI has changed
+        if roiName in self.rois:
+            self.rois[roiName]['hasContours'], self.rois[roiName]['volume'] = None, None
+        else:
+            self.addRoi(roiName)
+
+    def getRoiName(self, roiName):
+        # exact name, else the name that RStation considers the same
+        if roiName in self.rois:
+            return roiName
+        return self.roisRSStandard.get(getRSStandardName(roiName), None)
 
+    def hasRoi(self, roiName):
+        return self.getRoiName(roiName) is not None
+
+    def hasContours(self, roiName):
+        roiName = self.getRoiName(roiName)
+        if roiName is None:
+            return False
+        if self.rois[roiName]['hasContours'] is None:
+            self.rois[roiName]['hasContours'] = self.case.PatientModel.StructureSets[0].RoiGeometries[roiName].HasContours()
+        return self.rois[roiName]['hasContours']
+
+    def getRoiVolume(self, roiName):
+        volume = -1
+        if self.hasContours(roiName):
+            roiName = self.getRoiName(roiName)
+            if self.rois[roiName]['volume'] is None:
+                self.rois[roiName]['volume'] = self.case.PatientModel.StructureSets[0].RoiGeometries[roiName].GetRoiVolume()
+            volume = self.rois[roiName]['volume']
+        return volume
+
+    def addPlan(self, planName):
+        if planName not in self.plans:
+            self.plans.append(planName)
+            self.plansRSStandard[getRSStandardName(planName, isRoi=False)] = planName
+
+    def removePlan(self, planName):
+        if planName in self.plans:
+            self.plans.remove(planName)
+            self.plansRSStandard.pop(getRSStandardName(planName, isRoi=False), None)
+
+    def hasPlan(self, planName):
+        return planName in self.plans or getRSStandardName(planName, isRoi=False) in self.plansRSStandard
+
+    def getPlanIndex(self, planName):
+        return self.plans.index(planName) # raises ValueError (like list.index()) if it does not exist
+
+def getCaseNameIndex(case):
+    
+    try:
+        caseKey = (getPatientIdentifier(connect.get_current(config.KEYNAME_PATIENT)), case.CaseName)
     except:
-        traceback.print_exc()
+        caseKey = (None, case.CaseName)
+    if caseKey not in CASE_NAME_INDEXES:
+        CASE_NAME_INDEXES[caseKey] = CaseNameIndex(case)
     
-    return optimizeStatus, objectiveValues
+    return CASE_NAME_INDEXES[caseKey]
+
+def resetCaseNameIndex(case=None):
+    """
+    For bulk changes (DICOM import, auto-contouring). case=None resets all indexes
+    """
+    if case is None:
+        CASE_NAME_INDEXES.clear()
+    else:
+        for caseKey in [caseKey for caseKey in CASE_NAME_INDEXES if caseKey[1] == case.CaseName]:
+            del CASE_NAME_INDEXES[caseKey]
 
 ########## RS ROI RELATED ##########
 
@@ -671,7 +2060,7 @@ def checkOARDuplicateStatus(case, verbose=False):
         else:
             oarDuplicate = oar + config.KEY_AUTOCONTOUR_SUFFIX
         
-        if config.RS_CHECK_PREFIX + oarDuplicate.translate(config.RS_STR_TRANSLATE_OBJ) in dir(case.PatientModel.StructureSets[0].RoiGeometries):
+        if getCaseNameIndex(case).hasRoi(oarDuplicate):
             duplicateStatus[oar] = True
             case.PatientModel.RegionsOfInterest[oarDuplicate].Color = config.OAR_DUPLICATE_COLOR_RGB_STRING # ["128, 0, 64", "Purple"]
         else:
@@ -683,11 +2072,7 @@ def checkROIExists(case, roiName):
     # [roi.Name for roi in case.PatientModel.RegionsOfInterest]
     exists = False
 
-    roiNameCopy       = copy.deepcopy(roiName).replace('-(', '-') # 'Parotid_L-(CTV_DL1+3mm)'
-    roiNameRSStandard = config.RS_CHECK_PREFIX + roiNameCopy.translate(config.RS_STR_TRANSLATE_OBJ)
-    roiNameRSStandard = roiNameRSStandard.replace('___', '_')
-
-    if roiNameRSStandard in dir(case.PatientModel.StructureSets[0].RoiGeometries):
+    if getCaseNameIndex(case).hasRoi(roiName):
         exists = True
     
     return exists
@@ -698,9 +2083,7 @@ def getRoiVolume(case, roiName):
 
     try:
         if checkROIExists(case, roiName):
-            roiObj = case.PatientModel.StructureSets[0].RoiGeometries[roiName]
-            if roiObj.HasContours():
-                volume = roiObj.GetRoiVolume()
+            volume = getCaseNameIndex(case).getRoiVolume(roiName)
         else:
             print (f'\n - [getRoiVolume()] {roiName} does not exist in case: {case.CaseName}!')
 
@@ -750,6 +2133,7 @@ def doROIAlgebraForAutoContours(case):
                     roiNameNew = param['roiNameNew']
                     if checkROIExists(case, roiName) and not checkROIExists(case, roiNameNew):
                         case.PatientModel.CreateRoi(Name=roiNameNew, Color="128, 0, 64", Type=roiType, TissueName=None, RbeCellTypeName=None, RoiMaterial=None)
+                        getCaseNameIndex(case).addRoi(roiNameNew)
                         case.PatientModel.RegionsOfInterest[roiNameNew].SetAlgebraExpression(
                             ExpressionA={ 'Operation': "Union", 'SourceRoiNames': param['expARois'], 'MarginSettings': param['expAMarginSettings']}
                             , ExpressionB={ 'Operation': "Union", 'SourceRoiNames': param['expBRois'], 'MarginSettings': param['expBMarginSettings']}
@@ -757,6 +2141,7 @@ def doROIAlgebraForAutoContours(case):
                         )
                         case.PatientModel.RegionsOfInterest[roiNameNew].Color = config.OAROBJ_DUPLICATE_COLOR_RGB_STRING 
                         case.PatientModel.RegionsOfInterest[roiNameNew].UpdateDerivedGeometry(Examination=case.Examinations['CT 1'], Algorithm="Auto")
+                        getCaseNameIndex(case).updateRoi(roiNameNew)
                     else:
                         print (f' - [doROIAlgebraForAutoContours] {roiName}:{checkROIExists(case, roiName)} and {roiNameNew}:{checkROIExists(case, roiNameNew)}')
                 
@@ -823,6 +2208,7 @@ def doROIAlgebraForAutoContours(case):
                     roiNameRef = param['expBRois'][0]
                     if checkROIExists(case, roiName) and checkROIExists(case, roiNameRef) and not checkROIExists(case, roiNameNew):
                         case.PatientModel.CreateRoi(Name=roiNameNew, Color="Red", Type=roiType, TissueName=None, RbeCellTypeName=None, RoiMaterial=None)
+                        getCaseNameIndex(case).addRoi(roiNameNew)
                         case.PatientModel.RegionsOfInterest[roiNameNew].SetAlgebraExpression(
                             ExpressionA={ 'Operation': "Union", 'SourceRoiNames': param['expARois'], 'MarginSettings': param['expAMarginSettings'] }
                             , ExpressionB={ 'Operation': "Union", 'SourceRoiNames': param['expBRois'], 'MarginSettings': param['expBMarginSettings']}
@@ -830,6 +2216,7 @@ def doROIAlgebraForAutoContours(case):
                         )
                         case.PatientModel.RegionsOfInterest[roiNameNew].Color = config.OAROBJ_DUPLICATE_COLOR_RGB_STRING 
                         case.PatientModel.RegionsOfInterest[roiNameNew].UpdateDerivedGeometry(Examination=case.Examinations['CT 1'], Algorithm="Auto")
+                        getCaseNameIndex(case).updateRoi(roiNameNew)
                     else:
                         print (f' - [doROIAlgebraForAutoContours] {roiName}:{checkROIExists(case, roiName)} and {roiNameNew}:{checkROIExists(case, roiNameNew)} and {roiNameRef}:{checkROIExists(case, roiNameRef)}')
 
@@ -842,6 +2229,7 @@ def doROIAlgebraForAutoContours(case):
                 roiNameNew = config.KEYNAME_SWAL_COMP + config.KEY_AUTOCONTOUR_SUFFIX # 'Swal_Comp (1)'
                 if not checkROIExists(case, roiNameNew):
                     roiNew = case.PatientModel.CreateRoi(Name=roiNameNew, Color=config.OAR_DUPLICATE_COLOR_RGB_STRING, Type=roiType, TissueName=None, RbeCellTypeName=None, RoiMaterial=None)
+                    getCaseNameIndex(case).addRoi(roiNameNew)
                     roiName1 = config.KEYNAME_MUSC_CONSTRICT_I
                     roiName2 = config.KEYNAME_MUSC_CONSTRICT_M
                     roiName3 = config.KEYNAME_MUSC_CONSTRICT_S
@@ -864,8 +2252,10 @@ def doROIAlgebraForAutoContours(case):
                             , ResultOperation="None", ResultMarginSettings=getMarginSettings(0)
                         )
                         roiNew.UpdateDerivedGeometry(Examination=case.Examinations['CT 1'], Algorithm="Auto")
+                        getCaseNameIndex(case).updateRoi(roiNameNew)
                         case.PatientModel.RegionsOfInterest[roiNameNew].Color = config.OAROBJ_DUPLICATE_COLOR_RGB_STRING 
                         case.PatientModel.RegionsOfInterest[roiNameNew].UpdateDerivedGeometry(Examination=case.Examinations['CT 1'], Algorithm="Auto")
+                        getCaseNameIndex(case).updateRoi(roiNameNew)
 
                     else:
                         print (f' - [doROIAlgebraForAutoContours] {roiName1}:{checkROIExists(case, roiName1)} and {roiName2}:{checkROIExists(case, roiName2)} and {roiName3}:{checkROIExists(case, roiName3)} and {roiName4}:{checkROIExists(case, roiName4)} and {roiName5}:{checkROIExists(case, roiName5)} and {roiName6}:{checkROIExists(case, roiName6)}')
@@ -875,6 +2265,7 @@ def doROIAlgebraForAutoContours(case):
                 roiNameNewObj = config.KEYNAME_SWAL_OBJ + config.KEY_AUTOCONTOUR_SUFFIX # 'Swal_obj (1)'
                 if checkROIExists(case, roiNameNew) and not checkROIExists(case, roiNameNewObj):
                     case.PatientModel.CreateRoi(Name=roiNameNewObj, Color=config.OAR_DUPLICATE_COLOR_RGB_STRING, Type=roiType, TissueName=None, RbeCellTypeName=None, RoiMaterial=None)
+                    getCaseNameIndex(case).addRoi(roiNameNewObj)
 
                     if checkROIExists(case, config.KEYNAME_PTV_DL2_DVH):
                         case.PatientModel.RegionsOfInterest[roiNameNewObj].SetAlgebraExpression(
@@ -890,6 +2281,7 @@ def doROIAlgebraForAutoContours(case):
                         )
                     case.PatientModel.RegionsOfInterest[roiNameNewObj].Color = config.OAROBJ_DUPLICATE_COLOR_RGB_STRING 
                     case.PatientModel.RegionsOfInterest[roiNameNewObj].UpdateDerivedGeometry(Examination=case.Examinations['CT 1'], Algorithm="Auto")
+                    getCaseNameIndex(case).updateRoi(roiNameNewObj)
                 else:
                     print (f' - [doROIAlgebraForAutoContours] {roiNameNew}:{checkROIExists(case, roiNameNew)} and {roiNameNewObj}:{checkROIExists(case, roiNameNewObj)}')
             except:
@@ -967,6 +2359,7 @@ def doROIAlgebraForProtonAutoContours(case):
                     if checkROIExists(case, roiName) and checkROIExists(case, roiNameRef) and getRoiVolume(case, roiNameNew) <= 0.0:
                         if not checkROIExists(case, roiNameNew):
                             case.PatientModel.CreateRoi(Name=roiNameNew, Color="Red", Type=roiType, TissueName=None, RbeCellTypeName=None, RoiMaterial=None)
+                            getCaseNameIndex(case).addRoi(roiNameNew)
                         case.PatientModel.RegionsOfInterest[roiNameNew].SetAlgebraExpression(
                             ExpressionA={ 'Operation': "Union", 'SourceRoiNames': param['expARois'], 'MarginSettings': param['expAMarginSettings'] }
                             , ExpressionB={ 'Operation': "Union", 'SourceRoiNames': param['expBRois'], 'MarginSettings': param['expBMarginSettings']}
@@ -974,6 +2367,7 @@ def doROIAlgebraForProtonAutoContours(case):
                         )
                         case.PatientModel.RegionsOfInterest[roiNameNew].Color = config.OAROBJ_DUPLICATE_COLOR_RGB_STRING 
                         case.PatientModel.RegionsOfInterest[roiNameNew].UpdateDerivedGeometry(Examination=case.Examinations[0], Algorithm="Auto")
+                        getCaseNameIndex(case).updateRoi(roiNameNew)
                         assert getRoiVolume(case, roiNameNew) > 0.0, f' - [doROIAlgebraForProtonAutoContours] No volume for {roiNameNew}:{checkROIExists(case, roiNameNew)}'
                     else:
                         print (f'  -- [doROIAlgebraForProtonAutoContours] {roiName}:{checkROIExists(case, roiName)} and {roiNameRef}:{checkROIExists(case, roiNameRef)} and {roiNameNew}:{checkROIExists(case, roiNameNew), getRoiVolume(case, roiNameNew)}')
@@ -990,6 +2384,7 @@ def doROIAlgebraForProtonAutoContours(case):
                 if getRoiVolume(case, roiNameNew) <= 0.0:
                     if not checkROIExists(case, roiNameNew):
                         case.PatientModel.CreateRoi(Name=roiNameNew, Color=config.OAR_DUPLICATE_COLOR_RGB_STRING, Type=roiType, TissueName=None, RbeCellTypeName=None, RoiMaterial=None)
+                        getCaseNameIndex(case).addRoi(roiNameNew)
                     roiName1 = config.KEYNAME_ESOPHAGUS + config.KEY_AUTOCONTOUR_SUFFIX # 'Esophagus (1)'
                     roiName2 = config.KEYNAME_TRACHEA 
                     roiName3 = config.KEYNAME_LARYNX_SG + config.KEY_AUTOCONTOUR_SUFFIX # 'Larynx_SG (1)'
@@ -1010,8 +2405,10 @@ def doROIAlgebraForProtonAutoContours(case):
                                 , ResultOperation="Subtraction", ResultMarginSettings=getMarginSettings(0)
                             )
                         case.PatientModel.RegionsOfInterest[roiNameNew].UpdateDerivedGeometry(Examination=case.Examinations[0], Algorithm="Auto")
+                        getCaseNameIndex(case).updateRoi(roiNameNew)
                         case.PatientModel.RegionsOfInterest[roiNameNew].Color = config.OAROBJ_DUPLICATE_COLOR_RGB_STRING 
                         case.PatientModel.RegionsOfInterest[roiNameNew].UpdateDerivedGeometry(Examination=case.Examinations[0], Algorithm="Auto")
+                        getCaseNameIndex(case).updateRoi(roiNameNew)
                         assert getRoiVolume(case, roiNameNew) > 0.0, f' - [doROIAlgebraForProtonAutoContours] No volume for {roiNameNew}:{checkROIExists(case, roiNameNew)}'
 
                     else:
@@ -1153,7 +2550,9 @@ def read_dvhparamlist_csv_or_txt(csv_path, csv_delimiter):
 def process_dvhparam(plan, doselevels, dose, roi, dvhparam_label, verbose=False):
     
     # dvhparam not recognized, return empty string (leads to empty entry in csv)
-    dvhparam_quantity, dvhparam_unit, dvhparam_input_value, dvhparam_input_unit, dvhparam_untangle_status = untangle_dvhparam_string(dvhparam_label, verbose=verbose)
+    dvhparam_query = parseDVHLabel(dvhparam_label) # memoized version of untangle_dvhparam_string()
+    dvhparam_quantity, dvhparam_unit, dvhparam_input_value, dvhparam_input_unit, dvhparam_untangle_status = dvhparam_query[1:6]
+    if verbose: print(f"\t\t{dvhparam_query}")
 
     if dvhparam_untangle_status:
         dvhparam_value = calc_dvhparam(plan, doselevels, dose, roi, dvhparam_label, dvhparam_quantity, dvhparam_unit, dvhparam_input_value, dvhparam_input_unit, verbose)
@@ -1279,7 +2678,7 @@ def calc_dvhparam(plan, doselevels, dose, roi, dvhparam_label, dvhparam_quantity
                 print(f"\t\t\texternal/body ROI not detected, calulated CI without, ~1 prct different (checked for: {', '.join(roi_external_options)})")
                 roi_ref_temp_name = 'isodose_temp'
                 roi_ref_temp = case.PatientModel.CreateRoi(Name=roi_ref_temp_name, Color='red', Type='Control')
-                roi_ref_temp.CreateRoiGeometryFromDose(DoseDistribution=dose, ThresholdLevel=int(dvhparam_input_value))
+                roi_ref_temp.CreateRoiGeometryFromDose(DoseDistribution=getattr(dose, 'doseDistribution', dose), ThresholdLevel=int(dvhparam_input_value))
                 volume_ref_isodose = case.PatientModel.StructureSets[exam.Name].RoiGeometries[roi_ref_temp_name].GetRoiVolume()    # based on structureset (this value is typically slightly larger than what RS shows in several windows, e.g. roi properties, dose statistics), we use this here so we don't need to update the dose statistics (which is not possible if the machine is deprecated, and potentially if the plan is approved)
                 case.PatientModel.RegionsOfInterest[roi_ref_temp_name].DeleteRoi()
 
@@ -1318,45 +2717,109 @@ def calc_dvhparam(plan, doselevels, dose, roi, dvhparam_label, dvhparam_quantity
 
     return(dvhparam_value)
 
-def untangle_dvhparam_string(dvhparam_label, verbose=False):
-    output_quantity = ''
-    output_unit = ''
-    input_value = ''
-    input_unit = ''
-    untangle_status = ''
-
-    # untangle the dvh parameter string using regexp
-    if verbose: print(f"\t\t{dvhparam_label}")
-    if dvhparam_label == 'Volume':
-        output_quantity = 'V'
-        output_unit = 'cc'
-        untangle_status = 1
-    elif 'Dmin' in dvhparam_label or 'Dmax' in dvhparam_label or 'Dmean' in dvhparam_label:
-        output_quantity = 'D'
-        output_unit = re.search('\((.*)\)', dvhparam_label).group(1)            # string between brackets ()
-        untangle_status = 1
-    elif dvhparam_label[0:1] in ['V', 'D', 'C','H']:
-        output_quantity = re.findall('([a-zA-Z]*)\d*.*', dvhparam_label)[0]     # string till numeric
-        input_value = re.findall(r"[-+]?\d*\.?\d+", dvhparam_label)[0]              # old: r'\d+'     does not work for decimals
-        if output_quantity == 'HI':
-            input_unit = re.search(input_value + '(.*)', dvhparam_label).group(1)  # string after input_value (no space at end)
-        else:
-            input_unit = re.search(input_value + '(.*) ', dvhparam_label).group(1)      # string after input_value and before space
-            output_unit = re.search('\((.*)\)', dvhparam_label).group(1)            # string between brackets ()
-        input_value = float(input_value)
-        untangle_status = 1
-
-    # print
-    if verbose:
-        if untangle_status:
-            print(f"\t\t\toutput_quantity: {output_quantity}   input_value: {input_value}   input_unit: {input_unit}   output_unit: {output_unit}")
-        else:
-            print(f"\t\t\tUnknown format for dvhparam_label")
+DVH_QUERY_PLANS = {} # {(path, mtime): read-only {roi_input: (DVHQuery, ...)}}
+
+def getDVHQueryPlanFromPath(pathDVHParams):
+    """
+    Reads (once per process and file version) the roi/dvh parameter file into an immutable query plan (see dvhHelpers.getDVHQueryPlan())
+    Labels that cannot be processed are reported here, instead of once per plan in evaluatePlans()
+    """
+
+    pathDVHParams = Path(pathDVHParams)
+    cacheKey = (str(pathDVHParams.resolve()), pathDVHParams.stat().st_mtime)
+    if cacheKey not in DVH_QUERY_PLANS:
+        queryPlan = getDVHQueryPlan(read_dvhparamlist_csv_or_txt(str(pathDVHParams), ';'))
+        for roi_input, dvhparam_label, reason in validateDVHQueryPlan(queryPlan):
+            print (' - [getDVHQueryPlanFromPath()] Cannot process dvh parameter {} of {} ({}) in {}'.format(dvhparam_label, roi_input, reason, pathDVHParams.name))
+        DVH_QUERY_PLANS[cacheKey] = queryPlan
+
+    return DVH_QUERY_PLANS[cacheKey]
+
+class BatchedDoseQueries:
+    """
+    Wraps plan.TreatmentCourse.TotalDose so that all dose-at-volume and volume-at-dose queries of a ROI are done in one call each (see prefetch())
+    calc_dvhparam() then gets its single-element queries from the cache. Queries that were not prefetched are passed on to RStation.
+    """
+
+    def __init__(self, doseDistribution, planName=None):
+        self.doseDistribution = doseDistribution
+        self.planName = planName # if given, dose statistics go via the plan-scoped cache (see getDoseStatistic())
+        self.cacheDoseAtVolume  = {} # {roi: {relVolume: dose}}
+        self.cacheVolumeAtDose  = {} # {roi: {dose: relVolume}}
+        self.cacheDoseGridRoi   = {} # {roi: DoseGridRoi}
+        self.cacheDoseStatistic = {} # {(roi, doseType): dose}
+        self.calls = 0
+
+    def getDVHQueries(self, roi, dvhparams_labels, doselevels):
+        """
+        Returns the relative volumes and dose values (in cGy) that calc_dvhparam() will ask for (with the same arithmetic, so that cache keys match)
+        """
+
+        relVolumes, doseValues = [], []
+        for dvhparam_label in dvhparams_labels:
+            try:
+                quantity, unit, inputValue, inputUnit, status = parseDVHLabel(dvhparam_label)[1:6]
+                if not status or dvhparam_label == 'Volume' or 'Dmin' in dvhparam_label or 'Dmax' in dvhparam_label or 'Dmean' in dvhparam_label:
+                    continue
+                if quantity in ['V', 'CI']:
+                    if inputUnit == 'Gy'    : doseValues.append(inputValue*100)
+                    elif inputUnit == 'cGy' : doseValues.append(inputValue)
+                    elif '%DL' in inputUnit : doseValues.append(inputValue / 100 * doselevels[int(inputUnit[-1])-1])
+                elif quantity == 'D':
+                    if inputUnit == 'cc'    : relVolumes.append(inputValue/self.GetDoseGridRoi(RoiName=roi).RoiVolumeDistribution.TotalVolume)
+                    elif inputUnit == '%'   : relVolumes.append(inputValue / 100)
+                elif quantity == 'HI':
+                    relVolumes += [inputValue / 100, 1.0 - inputValue / 100]
+            except:
+                traceback.print_exc()
 
+        return relVolumes, doseValues
+
+    def prefetch(self, roi, dvhparams_labels, doselevels):
+
+        relVolumes, doseValues = self.getDVHQueries(roi, dvhparams_labels, doselevels)
+        if len(relVolumes):
+            self.GetDoseAtRelativeVolumes(RoiName=roi, RelativeVolumes=relVolumes)
+        if len(doseValues):
+            self.GetRelativeVolumeAtDoseValues(RoiName=roi, DoseValues=doseValues)
+
+    def GetDoseAtRelativeVolumes(self, RoiName, RelativeVolumes):
+        cache   = self.cacheDoseAtVolume.setdefault(RoiName, {})
+        missing = list(dict.fromkeys([each for each in RelativeVolumes if each not in cache]))
+        if len(missing):
+            self.calls += 1
+            for relVolume, doseValue in zip(missing, self.doseDistribution.GetDoseAtRelativeVolumes(RoiName=RoiName, RelativeVolumes=missing)):
+                cache[relVolume] = doseValue
+        return [cache[each] for each in RelativeVolumes]
+
+    def GetRelativeVolumeAtDoseValues(self, RoiName, DoseValues):
+        cache   = self.cacheVolumeAtDose.setdefault(RoiName, {})
+        missing = list(dict.fromkeys([each for each in DoseValues if each not in cache]))
+        if len(missing):
+            self.calls += 1
+            for doseValue, relVolume in zip(missing, self.doseDistribution.GetRelativeVolumeAtDoseValues(RoiName=RoiName, DoseValues=missing)):
+                cache[doseValue] = relVolume
+        return [cache[each] for each in DoseValues]
+
+    def GetDoseStatistic(self, RoiName, DoseType):
+        if (RoiName, DoseType) not in self.cacheDoseStatistic:
+            self.calls += 1
+            if self.planName is not None:
+                self.cacheDoseStatistic[(RoiName, DoseType)] = getDoseStatistic(self.planName, self.doseDistribution, RoiName, DoseType)
+            else:
+                self.cacheDoseStatistic[(RoiName, DoseType)] = self.doseDistribution.GetDoseStatistic(RoiName=RoiName, DoseType=DoseType)
+        return self.cacheDoseStatistic[(RoiName, DoseType)]
 
-    return(output_quantity, output_unit, input_value, input_unit, untangle_status)
+    def GetDoseGridRoi(self, RoiName):
+        if RoiName not in self.cacheDoseGridRoi:
+            self.calls += 1
+            self.cacheDoseGridRoi[RoiName] = self.doseDistribution.GetDoseGridRoi(RoiName=RoiName)
+        return self.cacheDoseGridRoi[RoiName]
 
-def evaluatePlans(pathDVHParams, planNames, planTimes={}, planValues={}, planExtras={}, pathPatient=None, contourType=config.KEYNAME_CONTOUR_CLINICAL, save=True, verbose=False):
+def evaluatePlans(pathDVHParams, planNames, planTimes={}, planValues={}, planExtras={}, pathPatient=None, contourType=config.KEYNAME_CONTOUR_CLINICAL, save=True, verbose=False, report=True):
+    """
+    report: bool, if False the results are only returned (i.e. not saved/printed), e.g. to call reportEvaluatedPlans() in a stage that does not use RStation
+    """
 
     # Step 0 - Initialize
     res = {}
@@ -1365,8 +2828,8 @@ def evaluatePlans(pathDVHParams, planNames, planTimes={}, planValues={}, planExt
         if Path(pathDVHParams).exists():
             
             # Step 1 - Get metrics (and other common vars)
-            rois_and_dvhparams = read_dvhparamlist_csv_or_txt(str(pathDVHParams), ';')
-            patient    = rayStationSave()
+            dvhQueryPlan = getDVHQueryPlanFromPath(pathDVHParams)
+            patient    = rayStationSave(dirty=False)
             case       = patient.Cases[0]
             exam       = case.Examinations[0]
             rois_case = [roi.Name for roi in case.PatientModel.RegionsOfInterest]
@@ -1400,6 +2863,7 @@ def evaluatePlans(pathDVHParams, planNames, planTimes={}, planValues={}, planExt
                         
                         dose = plan.TreatmentCourse.TotalDose
                         dose.UpdateDoseGridStructures()
+                        doseBatched = BatchedDoseQueries(dose, planName=plan.Name)
                         doselevels_processed = [beamset.Prescription.DosePrescriptions[0].DoseValue]
                         doselevels_processed =  [int(value) for dl, value in re.findall("(DL[0-9]) ([0-9]+)", beamset.Comment)]
 
@@ -1409,10 +2873,11 @@ def evaluatePlans(pathDVHParams, planNames, planTimes={}, planValues={}, planExt
                         headerline = []                         # holds the output headerline (ie all roi+dvh parameter labels) (headerline is filled every pt/plan iteration, only written once when output file is first generated)
                         pt_curplan_all_dvhparams_labels = []
                         pt_curplan_all_dvhparams_values = []    # holds per patient all dvh parameters of all the rois (an entire row in the output file)
-                        for i, (roi_input, dvhparams_labels) in enumerate(rois_and_dvhparams.items()):
+                        for i, (roi_input, dvhQueries) in enumerate(dvhQueryPlan.items()):
+                            dvhparams_labels = [dvhQuery.label for dvhQuery in dvhQueries]
                             res[config.KEYNAME_PLANS][plan.Name][roi_input] = {}
                             if verbose: 
-                                print(f"\n\tentry ({i+1}/{len(rois_and_dvhparams)}): {roi_input}")
+                                print(f"\n\tentry ({i+1}/{len(dvhQueryPlan)}): {roi_input}")
 
                             try:
                             # first check for prescribeddose, or doselevels, if not then assume it is a roi (or roi synonym list)
@@ -1455,13 +2920,17 @@ def evaluatePlans(pathDVHParams, planNames, planTimes={}, planValues={}, planExt
                                             if verbose: print(f'\t\t{roi_synonym}: {roi_status}')
                                             break
                                     
+                                    # batch the dose/volume queries of this roi
+                                    if validDose and roi_status == 'contoured':
+                                        doseBatched.prefetch(roi_synonym_hit, dvhparams_labels, doselevels_processed)
+
                                     # loop over the dvh parameters of this roi
                                     for dvhparam_label in dvhparams_labels:
                                         res[config.KEYNAME_PLANS][plan.Name][roi_input][dvhparam_label] = {}
                                         if not validDose:
                                             dvhparam_value = 'no dose'
                                         elif roi_status == 'contoured':
-                                            dvhparam_value  = process_dvhparam(plan, doselevels_processed, dose, roi_synonym_hit, dvhparam_label, verbose=verbose)
+                                            dvhparam_value  = process_dvhparam(plan, doselevels_processed, doseBatched, roi_synonym_hit, dvhparam_label, verbose=verbose)
                                         else:
                                             dvhparam_value = roi_status
                                         res[config.KEYNAME_PLANS][plan.Name][roi_input][dvhparam_label] = dvhparam_value
@@ -1484,6 +2953,7 @@ def evaluatePlans(pathDVHParams, planNames, planTimes={}, planValues={}, planExt
 
                         # Step 3.99 - Save plan information
                         pt_all_plan_all_dvhparams_values.append(pt_curplan_all_dvhparams_values)
+                        print (' - [evaluatePlans()] Dose queries to RStation for plan {}: {}'.format(plan.Name, doseBatched.calls))
 
                     else:
                         print (' - [evaluatePlans()] No RTDose found for plan: ', plan.Name)
@@ -1493,24 +2963,52 @@ def evaluatePlans(pathDVHParams, planNames, planTimes={}, planValues={}, planExt
                     print (' - [evaluatePlans()] Error in plan: ', plan.Name)
                     
 
-            # Step 5 - Save
-            if save:
-                try:
-                    import json
-                    if pathPatient is not None:
-                        if contourType == config.KEYNAME_CONTOUR_CLINICAL:
-                            pathPlanStats = Path(pathPatient, config.KEY_PLAN_STATS_JSON)
-                        elif contourType == config.KEYNAME_CONTOUR_AUTO:
-                            pathPlanStats = Path(pathPatient, config.KEY_PLAN_STATS_JSON_AUTO)
-                        elif contourType == config.KEYNAME_CONTOUR_ALL:
-                            pathPlanStats = Path(pathPatient, config.KEY_PLAN_STATS_JSON_ALL)
-                            
-                        with open(str(pathPlanStats), 'w') as fp:
-                            json.dump(res, fp, indent=4)
-                except:
-                    traceback.print_exc()
+            # Step 5 - Save and print (see reportEvaluatedPlans(), which can also run later without RStation)
+            if report:
+                reportEvaluatedPlans(res, pathPatient if save else None, contourType=contourType)
+
+        else:
+            print (' - [evaluatePlans()] DVH params file does not exist: ', pathDVHParams)
+
+    except:
+        traceback.print_exc()
+        
+
+    return res
+
+def reportEvaluatedPlans(res, pathPatient, contourType=config.KEYNAME_CONTOUR_CLINICAL, requiredPlanNames=None):
+    """
+    Saves (if pathPatient is not None) and prints the output of evaluatePlans(). Does not need RStation
+
+    Params
+    ------
+    requiredPlanNames: List, plans that need to have results (default: all plans in res)
+
+    Returns
+    -------
+    status: bool, True if at least one plan (and all requiredPlanNames) has results and nothing failed while saving
+    """
+
+    status = False
+    try:
+        
+        if not len(res):
+            return status
+
+        # Step 1 - Save
+        if pathPatient is not None:
+            if contourType == config.KEYNAME_CONTOUR_CLINICAL:
+                pathPlanStats = Path(pathPatient, config.KEY_PLAN_STATS_JSON)
+            elif contourType == config.KEYNAME_CONTOUR_AUTO:
+                pathPlanStats = Path(pathPatient, config.KEY_PLAN_STATS_JSON_AUTO)
+            elif contourType == config.KEYNAME_CONTOUR_ALL:
+                pathPlanStats = Path(pathPatient, config.KEY_PLAN_STATS_JSON_ALL)
+                
+            with open(str(pathPlanStats), 'w') as fp:
+                json.dump(res, fp, indent=4)
 
-            # Step 6 - Print
+        # Step 2 - Print
+        try:
             res2 = {}
             for planName in res[config.KEYNAME_PLANS]:
                 res2[planName] = {}
@@ -1521,15 +3019,21 @@ def evaluatePlans(pathDVHParams, planNames, planTimes={}, planValues={}, planExt
             import pandas as pd
             df = pd.DataFrame.from_dict(res2, orient='index').T
             print (df)
+        except:
+            traceback.print_exc()
 
-        else:
-            print (' - [evaluatePlans()] DVH params file does not exist: ', pathDVHParams)
+        # Step 3 - Status (plans that do not exist or have no dose have no results)
+        planNamesWithResults = [planName for planName in res[config.KEYNAME_PLANS] if len(res[config.KEYNAME_PLANS][planName])]
+        requiredPlanNames    = list(res[config.KEYNAME_PLANS]) if requiredPlanNames is None else requiredPlanNames
+        planNamesMissing     = [planName for planName in requiredPlanNames if planName not in planNamesWithResults]
+        status = len(planNamesWithResults) > 0 and not len(planNamesMissing)
+        if not status:
+            print (' - [reportEvaluatedPlans()] No results for plans: ', planNamesMissing if len(planNamesMissing) else list(res[config.KEYNAME_PLANS]))
 
     except:
         traceback.print_exc()
-        
-
-    return res
+    
+    return status
 
 # rs_objective_template/helpers/condition_validator.py
 class ConditionalElementValidator:
@@ -2129,6 +3633,8 @@ class NtcpKnoAbstractBase(ABC):
         ...
 
     MODEL_ROI_COLOR_MAPPING: Dict[ModelRoiType, Dict[str, int]] = None
+    DOSE_COEFFICIENT_KEYS: Dict[ModelRoiType, str] = None # constants key of the dose coefficient of each ModelRoiType
+    SQRT_DOSE_ROI_TYPES = () # ModelRoiTypes whose mean dose enters the model as sqrt(dose)
 
     class BaselineType(Enum):
         """ Baseline types for the model
@@ -2206,25 +3712,85 @@ class NtcpKnoAbstractBase(ABC):
         Returns:
             Dict of floats ie. {dose_in_gy: ntcp_value}
         """
-        rounded_center_dose = round(center_dose_gy or self.get_mean_roi_dose(roi_type))
-        dose_points = np.arange(max(rounded_center_dose - round(curve_size_gy / 2), 0), rounded_center_dose + round(curve_size_gy / 2) + 1, step_size_gy)
-        ntcp_curve_values = {}
-
-        for dose in dose_points:
-            ntcp_curve_values[dose] = self.get_ntcp({roi_type: dose})
+        dose_points = self._get_curve_dose_points(roi_type, center_dose_gy, curve_size_gy, step_size_gy)
+        ntcp_values = self.get_ntcp_array({roi_type: dose_points})
 
-        return ntcp_curve_values
+        return dict(zip(dose_points, ntcp_values.tolist()))
 
-    def get_ntcp_per_gy(self, roi_type: ModelRoiType) -> float:
+    def get_ntcp_curves(self, curve_size_gy: int = 20, step_size_gy: float = 0.1) -> Dict[ModelRoiType, Dict[float, float]]:
+        """ Get NTCP curves (centered around the mean dose) of all model ROI's in one evaluation
+            Each ROI is swept while the other ROI's stay at their mean dose
+        Args:
+            curve_size_gy: Range of the created curves in Gy
+            step_size_gy: Step size in Gy of calculated points in the curves
+        Returns:
+            Dict of ModelRoiType to dict of floats ie. {roi_type: {dose_in_gy: ntcp_value}}
+        """
+        roi_types   = list(self.ModelRoiType)
+        dose_points = [self._get_curve_dose_points(roi_type, None, curve_size_gy, step_size_gy) for roi_type in roi_types]
+        roi_idx     = np.concatenate([np.full(len(points), idx) for idx, points in enumerate(dose_points)])
+        all_points  = np.concatenate(dose_points)
+
+        # Step 1 - Swap the mean dose term of the swept ROI for the term at each dose point
+        mean_terms  = np.array([self._get_dose_term(roi_type, self.get_mean_roi_dose(roi_type)) for roi_type in roi_types])
+        coefficients = np.array([self._get_dose_coefficient(roi_type) for roi_type in roi_types])
+        is_sqrt     = np.array([roi_type in self.SQRT_DOSE_ROI_TYPES for roi_type in roi_types])
+        exponent    = self._get_intercept() + mean_terms.sum() - mean_terms[roi_idx] + coefficients[roi_idx] * np.where(is_sqrt[roi_idx], np.sqrt(all_points), all_points)
+        ntcp_values = 1 / (1 + np.exp(-exponent))
+
+        # Step 2 - Split per ROI
+        ntcp_curves = {}
+        for idx, roi_type in enumerate(roi_types):
+            ntcp_curves[roi_type] = dict(zip(dose_points[idx], ntcp_values[roi_idx == idx].tolist()))
+
+        return ntcp_curves
+
+    def get_ntcp_per_gy(self, roi_type: ModelRoiType, dose: float = None) -> float:
         """ Get NTCP gradient for ModelRoiType for current model instance
+            Closed form: d/dD logistic(x) = ntcp * (1 - ntcp) * dx/dD
         Args:
             roi_type: ModelRoiType to get gradient for
+            dose: Dose in Gy to evaluate the gradient at, defaults to mean dose of chosen ROI
         Returns:
             Gradient in NTCP/Gy for given ModelRoiType
         """
-        point_before = self.get_ntcp({roi_type: max(self.get_mean_roi_dose(roi_type) - 0.5, 0)})
-        point_after = self.get_ntcp({roi_type: max(self.get_mean_roi_dose(roi_type) + 0.5, 1)})
-        return point_after - point_before
+        return self.get_ntcp_gradients({roi_type: dose} if dose is not None else None)[roi_type]
+
+    def get_ntcp_gradients(self, dose_overrides: Dict[ModelRoiType, float] = None) -> Dict[ModelRoiType, float]:
+        """ Get NTCP gradients of all model ROI's for current model instance
+        Args:
+            dose_overrides: Dict of ModelRoiType mean dose overrides to use
+        Returns:
+            Dict of ModelRoiType to gradient in NTCP/Gy
+        """
+        doses = {roi_type: dose_overrides.get(roi_type) if dose_overrides is not None and dose_overrides.get(roi_type) is not None else self.get_mean_roi_dose(roi_type) for roi_type in self.ModelRoiType}
+        ntcp  = float(self.get_ntcp_array(doses))
+
+        gradients = {}
+        for roi_type, dose in doses.items():
+            coefficient = self._get_dose_coefficient(roi_type)
+            if roi_type in self.SQRT_DOSE_ROI_TYPES:
+                if dose <= 0: # d/dD sqrt(D) is unbounded at 0 Gy, use the secant over [0, 1] Gy instead
+                    gradients[roi_type] = float(self.get_ntcp_array({**doses, roi_type: 1}) - self.get_ntcp_array({**doses, roi_type: 0}))
+                    continue
+                gradients[roi_type] = ntcp * (1 - ntcp) * coefficient / (2 * math.sqrt(dose))
+            else:
+                gradients[roi_type] = ntcp * (1 - ntcp) * coefficient
+
+        return gradients
+
+    def get_ntcp_array(self, dose_overrides: Dict[ModelRoiType, np.ndarray] = None) -> np.ndarray:
+        """ Vectorized get_ntcp(), dose overrides may be (broadcastable) arrays of doses
+        Args:
+            dose_overrides: Dict of ModelRoiType mean dose overrides to use
+        Returns:
+            np.ndarray of NTCP values
+        """
+        exponent = self._get_intercept()
+        for roi_type in self.ModelRoiType:
+            dose = dose_overrides.get(roi_type) if dose_overrides is not None and dose_overrides.get(roi_type) is not None else self.get_mean_roi_dose(roi_type)
+            exponent = exponent + self._get_dose_term(roi_type, dose)
+        return 1 / (1 + np.exp(-exponent))
 
     def get_ntcp_threshold(self) -> float:
         """ Get NTCP PV threshold for current model instance
@@ -2241,6 +3807,33 @@ class NtcpKnoAbstractBase(ABC):
         return self.get_ntcp({roi_type: 0 for roi_type, _ in self.model_rois.items()})
 
     # Helper functions
+    @abstractmethod
+    def _get_intercept(self) -> float:
+        """ Get the dose independent part of the logistic exponent (grade, baseline, ...)
+        Returns:
+            float: Intercept of the model
+        """
+        ...
+
+    def _get_constants(self) -> Dict[str, Dict[int, float]]:
+        return self.PRIMARY_CONSTANTS if self._treatment_type == TreatmentType.PRIMARY else self.POSTOPERATIVE_CONSTANTS
+
+    def _get_dose_coefficient(self, roi_type: ModelRoiType) -> float:
+        return self._get_constants()[self.DOSE_COEFFICIENT_KEYS[roi_type]][self._grade]
+
+    def _get_dose_term(self, roi_type: ModelRoiType, dose) -> np.ndarray:
+        """ Get the contribution of a ROI (mean) dose to the logistic exponent
+        Args:
+            roi_type: ModelRoiType of the dose
+            dose: Dose in Gy, scalar or array
+        """
+        dose = np.asarray(dose, dtype=float)
+        return self._get_dose_coefficient(roi_type) * (np.sqrt(dose) if roi_type in self.SQRT_DOSE_ROI_TYPES else dose)
+
+    def _get_curve_dose_points(self, roi_type: ModelRoiType, center_dose_gy: float, curve_size_gy: int, step_size_gy: float) -> np.ndarray:
+        rounded_center_dose = round(center_dose_gy or self.get_mean_roi_dose(roi_type))
+        return np.arange(max(rounded_center_dose - round(curve_size_gy / 2), 0), rounded_center_dose + round(curve_size_gy / 2) + 1, step_size_gy)
+
     def get_mean_roi_dose(self, roi_type: ModelRoiType) -> float:
         """ Get mean dose of ModelRoiType bound ROI
             Calculates only once, then stores it in bound model for future requests
@@ -2261,7 +3854,7 @@ class NtcpKnoAbstractBase(ABC):
                 raise InvalidRoiDoseException(f"ROI '{roi_cache.name}' has no dose grid")
             if roi_dose_grid.RoiVolumeDistribution is None:
                 raise InvalidRoiDoseException(f"ROI '{roi_cache.name}' has no volume distribution, update dose statistics?")
-            roi_cache.dose = self.plan.TreatmentCourse.TotalDose.GetDoseStatistic(RoiName=roi_cache.name, DoseType="Average") / 100
+            roi_cache.dose = getDoseStatistic(self.plan.Name, self.plan.TreatmentCourse.TotalDose, roi_cache.name, "Average") / 100 # shared with the other models (and evaluatePlans()) of this plan
         return roi_cache.dose
 
 # rs_ntcp_kno/models/ntcp_xerostomia.py
@@ -2293,6 +3886,12 @@ class NtcpKnoXerostomia(NtcpKnoAbstractBase):
         ModelRoiType.PAROTID_RIGHT: {"r": 0, "g": 192, "b": 192},
         ModelRoiType.SUBMANDIBULARS: {"r": 139, "g": 69, "b": 19}
     }
+    DOSE_COEFFICIENT_KEYS: Dict[ModelRoiType, str] = {
+        ModelRoiType.PAROTID_LEFT: "parotid",
+        ModelRoiType.PAROTID_RIGHT: "parotid",
+        ModelRoiType.SUBMANDIBULARS: "submandibular"
+    }
+    SQRT_DOSE_ROI_TYPES = (ModelRoiType.PAROTID_LEFT, ModelRoiType.PAROTID_RIGHT)
 
     class BaselineType(Enum):
         NONE = "None (helemaal niet)"
@@ -2338,6 +3937,12 @@ class NtcpKnoXerostomia(NtcpKnoAbstractBase):
 
         return ntcp_total
 
+    def _get_intercept(self) -> float:
+        if not all([self._treatment_type, self._baseline_type]):
+            raise ValueError("Cannot calculate NTCP without setting all variables")
+        constants = self._get_constants()
+        return constants["grade"][self._grade] + constants[f"xerostomia_{self.BASELINETYPE_MAPPING[self._baseline_type]}"][self._grade]
+
 # rs_ntcp_kno/models/ntcp_dysphagia.py
 class NtcpKnoDysphagia(NtcpKnoAbstractBase):
     PRIMARY_CONSTANTS: Dict[str, Dict[int, float]] = {
@@ -2380,6 +3985,12 @@ class NtcpKnoDysphagia(NtcpKnoAbstractBase):
         ModelRoiType.PCM_MIDDLE: {"r": 138, "g": 224, "b": 52},
         ModelRoiType.PCM_INFERIOR: {"r": 204, "g": 100, "b": 204}
     }
+    DOSE_COEFFICIENT_KEYS: Dict[ModelRoiType, str] = {
+        ModelRoiType.ORAL_CAVITY: "oral_cavity",
+        ModelRoiType.PCM_SUPERIOR: "pcm_superior",
+        ModelRoiType.PCM_MIDDLE: "pcm_middle",
+        ModelRoiType.PCM_INFERIOR: "pcm_inferior"
+    }
 
     class BaselineType(Enum):
         GRADE_0_1 = "Grade 0-1"
@@ -2437,6 +4048,254 @@ class NtcpKnoDysphagia(NtcpKnoAbstractBase):
 
         return ntcp_total
 
+    def _get_intercept(self) -> float:
+        if not all([self._treatment_type, self._baseline_type, self._tumor_location]):
+            raise ValueError("Cannot calculate NTCP without setting all variables")
+        constants = self._get_constants()
+        intercept = constants["grade"][self._grade]
+        intercept += constants[f"dysphagia_{self.BASELINETYPE_MAPPING[self._baseline_type]}"][self._grade]
+        intercept += constants[f"tumor_loc_{self._tumor_location.name.lower()}"][self._grade]
+        return intercept
+
+# rs_ntcp_kno/models/ntcp_vectorized.py
+class NtcpKnoVectorized:
+    """ Vectorized evaluation of the KNO xerostomia/dysphagia models over a cohort (or many dose scenarios)
+        Uses the PRIMARY_CONSTANTS/POSTOPERATIVE_CONSTANTS of NtcpKnoXerostomia and NtcpKnoDysphagia
+    """
+
+    GRADES = (2, 3)
+    TREATMENT_TYPES = (TreatmentType.PRIMARY, TreatmentType.POSTOPERATIVE)
+    TUMOR_LOCATIONS = (NtcpKnoDysphagia.TumorLocationType.ORAL_CAVITY, NtcpKnoDysphagia.TumorLocationType.PHARYNX, NtcpKnoDysphagia.TumorLocationType.LARYNX)
+
+    ENDPOINT_XEROSTOMIA_GRADE_2 = "xerostomia_grade_2"
+    ENDPOINT_XEROSTOMIA_GRADE_3 = "xerostomia_grade_3"
+    ENDPOINT_DYSPHAGIA_GRADE_2  = "dysphagia_grade_2"
+    ENDPOINT_DYSPHAGIA_GRADE_3  = "dysphagia_grade_3"
+
+    _coefficients: Dict[str, np.ndarray] = None
+
+    @classmethod
+    def get_coefficients(cls) -> Dict[str, np.ndarray]:
+        """ Coefficient tables of both models, built once from the model constants
+        Returns:
+            Dict of arrays indexed as [treatment, grade] for dose terms and [treatment, category, grade] for intercepts
+        """
+        if cls._coefficients is None:
+            def get_table(model_cls, key):
+                return np.array([[(model_cls.PRIMARY_CONSTANTS if treatment_type == TreatmentType.PRIMARY else model_cls.POSTOPERATIVE_CONSTANTS)[key][grade] for grade in cls.GRADES] for treatment_type in cls.TREATMENT_TYPES], dtype=float)
+
+            cls._coefficients = {
+                "xerostomia_grade":     get_table(NtcpKnoXerostomia, "grade"),
+                "xerostomia_baseline":  np.stack([get_table(NtcpKnoXerostomia, f"xerostomia_{idx}") for idx in range(3)], axis=-2),
+                "parotid":              get_table(NtcpKnoXerostomia, "parotid"),
+                "submandibular":        get_table(NtcpKnoXerostomia, "submandibular"),
+                "dysphagia_grade":      get_table(NtcpKnoDysphagia, "grade"),
+                "dysphagia_baseline":   np.stack([get_table(NtcpKnoDysphagia, f"dysphagia_{idx}") for idx in range(3)], axis=-2),
+                "tumor_location":       np.stack([get_table(NtcpKnoDysphagia, f"tumor_loc_{tumor_location.name.lower()}") for tumor_location in cls.TUMOR_LOCATIONS], axis=-2),
+                "oral_cavity":          get_table(NtcpKnoDysphagia, "oral_cavity"),
+                "pcm_superior":         get_table(NtcpKnoDysphagia, "pcm_superior"),
+                "pcm_middle":           get_table(NtcpKnoDysphagia, "pcm_middle"),
+                "pcm_inferior":         get_table(NtcpKnoDysphagia, "pcm_inferior")
+            }
+        return cls._coefficients
+
+    @staticmethod
+    def _get_indices(values, enum_cls, mapping: dict) -> np.ndarray:
+        """ Convert enum members, their (string) values or plain indices to an index array
+        Args:
+            values: Scalar or sequence of enum members, enum values or ints
+            enum_cls: Enum class the values belong to
+            mapping: Dict of enum member to index
+        """
+        def get_index(value):
+            if isinstance(value, enum_cls):
+                return mapping[value]
+            if isinstance(value, str):
+                return mapping[enum_cls(value)]
+            return int(value)
+
+        if np.ndim(values) == 0:
+            return np.array(get_index(values.item() if isinstance(values, np.ndarray) else values))
+        return np.array([get_index(value) for value in np.asarray(values, dtype=object).ravel()]).reshape(np.shape(values))
+
+    @classmethod
+    def get_xerostomia_ntcp(cls, parotid_left_dose, parotid_right_dose, submandibulars_dose, baseline, treatment_type, coefficients: Dict[str, np.ndarray] = None) -> Dict[str, np.ndarray]:
+        """ Get xerostomia grade 2/3 NTCP values for arrays of patients/scenarios
+        Args:
+            parotid_left_dose, parotid_right_dose, submandibulars_dose: Mean doses in Gy (scalars or arrays broadcastable with the categorical inputs)
+            baseline: NtcpKnoXerostomia.BaselineType (members, values or 0/1/2), scalar or array
+            treatment_type: TreatmentType (members or values), scalar or array
+            coefficients: Coefficient tables to use instead of get_coefficients(), may have a leading (draws) axis
+        Returns:
+            Dict of {endpoint: ntcp array}
+        """
+        coefficients = coefficients or cls.get_coefficients()
+        baseline_idx  = cls._get_indices(baseline, NtcpKnoXerostomia.BaselineType, NtcpKnoXerostomia.BASELINETYPE_MAPPING)
+        treatment_idx = cls._get_indices(treatment_type, TreatmentType, {treatment_type: idx for idx, treatment_type in enumerate(cls.TREATMENT_TYPES)})
+        baseline_idx, treatment_idx = np.broadcast_arrays(baseline_idx, treatment_idx)
+
+        exponent = coefficients["xerostomia_grade"][..., treatment_idx, :] + coefficients["xerostomia_baseline"][..., treatment_idx, baseline_idx, :]
+        exponent = exponent + coefficients["parotid"][..., treatment_idx, :] * (np.sqrt(np.asarray(parotid_left_dose, dtype=float)) + np.sqrt(np.asarray(parotid_right_dose, dtype=float)))[..., None]
+        exponent = exponent + coefficients["submandibular"][..., treatment_idx, :] * np.asarray(submandibulars_dose, dtype=float)[..., None]
+        ntcp = 1 / (1 + np.exp(-exponent))
+
+        return {cls.ENDPOINT_XEROSTOMIA_GRADE_2: ntcp[..., 0], cls.ENDPOINT_XEROSTOMIA_GRADE_3: ntcp[..., 1]}
+
+    @classmethod
+    def get_dysphagia_ntcp(cls, oral_cavity_dose, pcm_superior_dose, pcm_middle_dose, pcm_inferior_dose, baseline, treatment_type, tumor_location, coefficients: Dict[str, np.ndarray] = None) -> Dict[str, np.ndarray]:
+        """ Get dysphagia grade 2/3 NTCP values for arrays of patients/scenarios
+        Args:
+            oral_cavity_dose, pcm_superior_dose, pcm_middle_dose, pcm_inferior_dose: Mean doses in Gy (scalars or arrays broadcastable with the categorical inputs)
+            baseline: NtcpKnoDysphagia.BaselineType (members, values or 0/1/2), scalar or array
+            treatment_type: TreatmentType (members or values), scalar or array
+            tumor_location: NtcpKnoDysphagia.TumorLocationType (members, values or 0/1/2), scalar or array
+            coefficients: Coefficient tables to use instead of get_coefficients(), may have a leading (draws) axis
+        Returns:
+            Dict of {endpoint: ntcp array}
+        """
+        coefficients = coefficients or cls.get_coefficients()
+        baseline_idx  = cls._get_indices(baseline, NtcpKnoDysphagia.BaselineType, NtcpKnoDysphagia.BASELINETYPE_MAPPING)
+        treatment_idx = cls._get_indices(treatment_type, TreatmentType, {treatment_type: idx for idx, treatment_type in enumerate(cls.TREATMENT_TYPES)})
+        location_idx  = cls._get_indices(tumor_location, NtcpKnoDysphagia.TumorLocationType, {tumor_location: idx for idx, tumor_location in enumerate(cls.TUMOR_LOCATIONS)})
+        baseline_idx, treatment_idx, location_idx = np.broadcast_arrays(baseline_idx, treatment_idx, location_idx)
+
+        exponent = coefficients["dysphagia_grade"][..., treatment_idx, :] + coefficients["dysphagia_baseline"][..., treatment_idx, baseline_idx, :] + coefficients["tumor_location"][..., treatment_idx, location_idx, :]
+        for key, dose in [("oral_cavity", oral_cavity_dose), ("pcm_superior", pcm_superior_dose), ("pcm_middle", pcm_middle_dose), ("pcm_inferior", pcm_inferior_dose)]:
+            exponent = exponent + coefficients[key][..., treatment_idx, :] * np.asarray(dose, dtype=float)[..., None]
+        ntcp = 1 / (1 + np.exp(-exponent))
+
+        return {cls.ENDPOINT_DYSPHAGIA_GRADE_2: ntcp[..., 0], cls.ENDPOINT_DYSPHAGIA_GRADE_3: ntcp[..., 1]}
+
+    @classmethod
+    def get_ntcp(cls, doses: Dict[Enum, np.ndarray], treatment_type, baseline_xerostomia=None, baseline_dysphagia=None, tumor_location=None) -> Dict[str, np.ndarray]:
+        """ Get all grade 2/3 endpoints in one call
+        Args:
+            doses: Dict of {NtcpKnoXerostomia.ModelRoiType | NtcpKnoDysphagia.ModelRoiType: mean doses in Gy}
+                   (a missing ROI, or a NaN dose, gives NaN for the endpoints of that model)
+            treatment_type: TreatmentType (members or values), scalar or array
+            baseline_xerostomia, baseline_dysphagia, tumor_location: scalar or array, None skips that model
+        Returns:
+            Dict of {endpoint: ntcp array}
+        """
+        results = {}
+        xerostomia_rois = list(NtcpKnoXerostomia.ModelRoiType)
+        dysphagia_rois  = list(NtcpKnoDysphagia.ModelRoiType)
+        if baseline_xerostomia is not None and any(roi_type in doses for roi_type in xerostomia_rois):
+            results.update(cls.get_xerostomia_ntcp(*[doses.get(roi_type, np.nan) for roi_type in xerostomia_rois], baseline_xerostomia, treatment_type))
+        if baseline_dysphagia is not None and tumor_location is not None and any(roi_type in doses for roi_type in dysphagia_rois):
+            results.update(cls.get_dysphagia_ntcp(*[doses.get(roi_type, np.nan) for roi_type in dysphagia_rois], baseline_dysphagia, treatment_type, tumor_location))
+        return results
+
+# rs_ntcp_kno/models/ntcp_uncertainty.py
+class NtcpKnoMonteCarlo:
+    """ Monte Carlo NTCP uncertainty on top of NtcpKnoVectorized
+        Each draw samples all model coefficients (shared by all patients of that draw) and the ROI mean doses of every patient,
+        either from a normal distribution around the planned dose or from a set of (robust) dose scenarios
+    """
+
+    def __init__(self, draws: int = config.NTCP_MC_DRAWS, coefficient_rel_sd: float = config.NTCP_MC_COEFFICIENT_REL_SD
+                 , dose_sd_gy: float = config.NTCP_MC_DOSE_SD_GY, credible_interval=config.NTCP_MC_CREDIBLE_INTERVAL, seed: int = None):
+        self.draws = draws
+        self.coefficient_rel_sd = coefficient_rel_sd
+        self.dose_sd_gy = dose_sd_gy
+        self.credible_interval = credible_interval
+        self._random = np.random.RandomState(seed)
+
+    def sample_coefficients(self) -> Dict[str, np.ndarray]:
+        """ Coefficient tables of NtcpKnoVectorized with a leading axis of draws
+            Reference categories (coefficient 0) stay 0
+        """
+        coefficients = {}
+        for key, table in NtcpKnoVectorized.get_coefficients().items():
+            noise = self._random.standard_normal((self.draws,) + table.shape)
+            coefficients[key] = table * (1 + self.coefficient_rel_sd * noise)
+        return coefficients
+
+    def sample_doses(self, doses: Dict[Enum, np.ndarray], dose_scenarios: Dict[Enum, np.ndarray] = None) -> Dict[Enum, np.ndarray]:
+        """ Sample ROI mean doses, shape (draws, patients)
+        Args:
+            doses: Dict of {ModelRoiType: mean doses in Gy of each patient}
+            dose_scenarios: Dict of {ModelRoiType: array (patients, scenarios) of mean doses}, e.g. from robust evaluation.
+                            All ROIs of a patient use the same scenario in a draw. ROIs without scenarios are sampled with dose_sd_gy
+        """
+        patient_count = max([np.size(dose) for dose in doses.values()] + [1])
+        scenario_idx = None
+        if dose_scenarios:
+            scenario_count = min([np.shape(scenarios)[-1] for scenarios in dose_scenarios.values()])
+            scenario_idx = self._random.randint(0, scenario_count, (self.draws, patient_count))
+
+        dose_draws = {}
+        for roi_type, dose in doses.items():
+            if dose_scenarios and roi_type in dose_scenarios:
+                scenarios = np.broadcast_to(np.asarray(dose_scenarios[roi_type], dtype=float).reshape(-1, np.shape(dose_scenarios[roi_type])[-1]), (patient_count, np.shape(dose_scenarios[roi_type])[-1]))
+                dose_draws[roi_type] = np.clip(scenarios[np.arange(patient_count), scenario_idx], 0, None)
+            else:
+                dose = np.broadcast_to(np.asarray(dose, dtype=float).ravel(), (patient_count,))
+                dose_draws[roi_type] = np.clip(dose + self.dose_sd_gy * self._random.standard_normal((self.draws, patient_count)), 0, None)
+        return dose_draws
+
+    def get_ntcp_draws(self, doses: Dict[Enum, np.ndarray], treatment_type, baseline_xerostomia=None, baseline_dysphagia=None, tumor_location=None
+                       , dose_scenarios: Dict[Enum, np.ndarray] = None) -> Dict[str, np.ndarray]:
+        """ Get NTCP draws of all grade 2/3 endpoints
+        Args:
+            doses, treatment_type, baseline_xerostomia, baseline_dysphagia, tumor_location: see NtcpKnoVectorized.get_ntcp(), per patient
+            dose_scenarios: see sample_doses()
+        Returns:
+            Dict of {endpoint: ntcp array (draws, patients)}
+        """
+        patient_count = max([np.size(dose) for dose in doses.values()] + [1])
+        coefficients  = self.sample_coefficients()
+        dose_draws    = self.sample_doses(doses, dose_scenarios)
+
+        def get_categorical(values):
+            return np.broadcast_to(np.asarray(values, dtype=object).ravel(), (patient_count,))
+
+        results = {}
+        xerostomia_rois = list(NtcpKnoXerostomia.ModelRoiType)
+        dysphagia_rois  = list(NtcpKnoDysphagia.ModelRoiType)
+        if baseline_xerostomia is not None and any(roi_type in doses for roi_type in xerostomia_rois):
+            results.update(NtcpKnoVectorized.get_xerostomia_ntcp(*[dose_draws.get(roi_type, np.nan) for roi_type in xerostomia_rois]
+                                                                  , get_categorical(baseline_xerostomia), get_categorical(treatment_type), coefficients=coefficients))
+        if baseline_dysphagia is not None and tumor_location is not None and any(roi_type in doses for roi_type in dysphagia_rois):
+            results.update(NtcpKnoVectorized.get_dysphagia_ntcp(*[dose_draws.get(roi_type, np.nan) for roi_type in dysphagia_rois]
+                                                                 , get_categorical(baseline_dysphagia), get_categorical(treatment_type), get_categorical(tumor_location), coefficients=coefficients))
+        return results
+
+    def get_ntcp_intervals(self, doses: Dict[Enum, np.ndarray], treatment_type, baseline_xerostomia=None, baseline_dysphagia=None, tumor_location=None
+                           , dose_scenarios: Dict[Enum, np.ndarray] = None) -> Dict[str, Dict[str, np.ndarray]]:
+        """ Get credible intervals of all grade 2/3 endpoints
+        Returns:
+            Dict of {endpoint: {mean, median, lower, upper}}, each an array over patients
+        """
+        intervals = {}
+        for endpoint, ntcp_draws in self.get_ntcp_draws(doses, treatment_type, baseline_xerostomia, baseline_dysphagia, tumor_location, dose_scenarios).items():
+            lower, median, upper = np.nanpercentile(ntcp_draws, [self.credible_interval[0], 50, self.credible_interval[1]], axis=0)
+            intervals[endpoint] = {config.KEYNAME_NTCP_MEAN: np.nanmean(ntcp_draws, axis=0), config.KEYNAME_NTCP_MEDIAN: median
+                                   , config.KEYNAME_NTCP_LOWER: lower, config.KEYNAME_NTCP_UPPER: upper}
+        return intervals
+
+    def get_delta_ntcp_intervals(self, doses_1: Dict[Enum, np.ndarray], doses_2: Dict[Enum, np.ndarray], treatment_type, baseline_xerostomia=None, baseline_dysphagia=None, tumor_location=None
+                                 ) -> Dict[str, Dict[str, np.ndarray]]:
+        """ Get credible intervals of NTCP(plan 1) - NTCP(plan 2) per patient (e.g. clinical vs auto-contour plans)
+            Both plans use the same coefficient draws, so only the dose difference (and its interaction with the model) remains
+        Returns:
+            Dict of {endpoint: {mean, median, lower, upper}}, each an array over patients
+        """
+        state = self._random.get_state()
+        ntcp_draws_1 = self.get_ntcp_draws(doses_1, treatment_type, baseline_xerostomia, baseline_dysphagia, tumor_location)
+        self._random.set_state(state)
+        ntcp_draws_2 = self.get_ntcp_draws(doses_2, treatment_type, baseline_xerostomia, baseline_dysphagia, tumor_location)
+
+        intervals = {}
+        for endpoint in ntcp_draws_1:
+            if endpoint not in ntcp_draws_2:
+                continue
+            delta_draws = ntcp_draws_1[endpoint] - ntcp_draws_2[endpoint]
+            lower, median, upper = np.nanpercentile(delta_draws, [self.credible_interval[0], 50, self.credible_interval[1]], axis=0)
+            intervals[endpoint] = {config.KEYNAME_NTCP_MEAN: np.nanmean(delta_draws, axis=0), config.KEYNAME_NTCP_MEDIAN: median
+                                   , config.KEYNAME_NTCP_LOWER: lower, config.KEYNAME_NTCP_UPPER: upper}
+        return intervals
+
 # rs_ntcp_kno/viewmodels/mainviewmodel.py
 class KNONTCP:
 
@@ -2462,6 +4321,41 @@ class KNONTCP:
             print (' - [ERROR][KNONTCP] Plan 1 not found in plan list', self._selected_plan1)
 
         # Step 3 - Get model parameters (NOTE: this will be passed as params here)
+        self._set_model_parameters(params)
+
+        # Step 4 - Define NTCP model objects
+        plan1Index = getRTPlanIndex(self._case, self._selected_plan1)
+        plan2Index = getRTPlanIndex(self._case, self._selected_plan2)
+        self._set_plan1_models(plan1Index)
+        
+        if plan2Index > -1:
+            self.plan2_ntcp_xerostomia_grade_2 = NtcpKnoXerostomia(self._case.TreatmentPlans[plan2Index], 2)
+            self.plan2_ntcp_xerostomia_grade_3 = NtcpKnoXerostomia(self._case.TreatmentPlans[plan2Index], 3)
+            self.plan2_ntcp_dysphagia_grade_2  = NtcpKnoDysphagia(self._case.TreatmentPlans[plan2Index], 2)
+            self.plan2_ntcp_dysphagia_grade_3  = NtcpKnoDysphagia(self._case.TreatmentPlans[plan2Index], 3)
+            self._set_xerostomia_variables(self.plan2_ntcp_xerostomia_grade_2)
+            self._set_xerostomia_variables(self.plan2_ntcp_xerostomia_grade_3)
+            self._set_dysphagia_variables(self.plan2_ntcp_dysphagia_grade_2)
+            self._set_dysphagia_variables(self.plan2_ntcp_dysphagia_grade_3)
+        else:
+            self.plan2_ntcp_xerostomia_grade_2: NtcpKnoXerostomia = None
+            self.plan2_ntcp_xerostomia_grade_3: NtcpKnoXerostomia = None
+            self.plan2_ntcp_dysphagia_grade_2 : NtcpKnoDysphagia  = None
+            self.plan2_ntcp_dysphagia_grade_3 : NtcpKnoDysphagia  = None
+
+        # Step 99 - Results
+        self._dose_grids_updated = set()
+        self._reset_results()
+
+    def _reset_results(self):
+        self._ntcp_xerostomia_grade_2_values = None
+        self._ntcp_xerostomia_grade_3_values = None
+        self._ntcp_dysphagia_grade_2_values = None
+        self._ntcp_dysphagia_grade_3_values = None
+        self._sum_grade_2_values = None
+        self._sum_grade_3_values = None
+
+    def _set_model_parameters(self, params):
         self._treatment_type        = params.get(config.KEY_NTCP_TREATMENT_TYPE, None)
         self._tumor_location        = params.get(config.KEY_NTCP_TUMOR_LOCATION, None)
         self._baseline_xerostomia   = params.get(config.KEY_NTCP_BASELINE_XEROSTOMIA, None)
@@ -2491,10 +4385,7 @@ class KNONTCP:
         if self._pcm_inferior is None:
             print (' - [INFO][KNONTCP] Musc_Constrict_I not found in ROI list')
 
-        # Step 4 - Define NTCP model objects
-        plan1Index = getRTPlanIndex(self._case, self._selected_plan1)
-        plan2Index = getRTPlanIndex(self._case, self._selected_plan2)
-
+    def _set_plan1_models(self, plan1Index):
         if plan1Index > -1:
             if self._parotid_left is not None and self._parotid_right is not None and self._submandibulars is not None:
                 self.plan1_ntcp_xerostomia_grade_2 = NtcpKnoXerostomia(self._case.TreatmentPlans[plan1Index], 2)
@@ -2518,29 +4409,6 @@ class KNONTCP:
             self.plan1_ntcp_xerostomia_grade_3: NtcpKnoXerostomia = None
             self.plan1_ntcp_dysphagia_grade_2 : NtcpKnoDysphagia  = None
             self.plan1_ntcp_dysphagia_grade_3 : NtcpKnoDysphagia  = None
-        
-        if plan2Index > -1:
-            self.plan2_ntcp_xerostomia_grade_2 = NtcpKnoXerostomia(self._case.TreatmentPlans[plan2Index], 2)
-            self.plan2_ntcp_xerostomia_grade_3 = NtcpKnoXerostomia(self._case.TreatmentPlans[plan2Index], 3)
-            self.plan2_ntcp_dysphagia_grade_2  = NtcpKnoDysphagia(self._case.TreatmentPlans[plan2Index], 2)
-            self.plan2_ntcp_dysphagia_grade_3  = NtcpKnoDysphagia(self._case.TreatmentPlans[plan2Index], 3)
-            self._set_xerostomia_variables(self.plan2_ntcp_xerostomia_grade_2)
-            self._set_xerostomia_variables(self.plan2_ntcp_xerostomia_grade_3)
-            self._set_dysphagia_variables(self.plan2_ntcp_dysphagia_grade_2)
-            self._set_dysphagia_variables(self.plan2_ntcp_dysphagia_grade_3)
-        else:
-            self.plan2_ntcp_xerostomia_grade_2: NtcpKnoXerostomia = None
-            self.plan2_ntcp_xerostomia_grade_3: NtcpKnoXerostomia = None
-            self.plan2_ntcp_dysphagia_grade_2 : NtcpKnoDysphagia  = None
-            self.plan2_ntcp_dysphagia_grade_3 : NtcpKnoDysphagia  = None
-
-        # Step 99 - Results
-        self._ntcp_xerostomia_grade_2_values = None
-        self._ntcp_xerostomia_grade_3_values = None
-        self._ntcp_dysphagia_grade_2_values = None
-        self._ntcp_dysphagia_grade_3_values = None
-        self._sum_grade_2_values = None
-        self._sum_grade_3_values = None
 
     def _do_smd_algebra(self):
         
@@ -2574,12 +4442,14 @@ class KNONTCP:
                         if roiNameNew not in self._roi_names:
                             print (f'\n  -- [doROIAlgebraForProtonAutoContours] Creating ROI: {roiNameNew} \n')
                             self._case.PatientModel.CreateRoi(Name=roiNameNew, Color="Green", Type=param['roiType'], TissueName=None, RbeCellTypeName=None, RoiMaterial=None)
+                            getCaseNameIndex(self._case).addRoi(roiNameNew)
                         self._case.PatientModel.RegionsOfInterest[roiNameNew].SetAlgebraExpression(
                             ExpressionA={ 'Operation': "Union", 'SourceRoiNames': expARois, 'MarginSettings': param['expAMarginSettings'] }
                             , ExpressionB={ 'Operation': "Union", 'SourceRoiNames': expBRois, 'MarginSettings': param['expBMarginSettings']}
                             , ResultOperation="Union", ResultMarginSettings=getMarginSettings(0)
                         )
                         self._case.PatientModel.RegionsOfInterest[roiNameNew].UpdateDerivedGeometry(Examination=self._case.Examinations[0], Algorithm="Auto")
+                        getCaseNameIndex(self._case).updateRoi(roiNameNew)
                         roiNameNewObj = self._case.PatientModel.StructureSets[0].RoiGeometries[roiNameNew]
                         print ('')
                         if roiNameNewObj.HasContours():
@@ -2649,10 +4519,12 @@ class KNONTCP:
 
             if plan1_model is not None:
                 
-                try:
-                    plan1_model.plan.TreatmentCourse.TotalDose.UpdateDoseGridStructures() # done for dose.GetDoseStatistic(RoiName="Glnds_Submand", DoseType="Average") in get_mean_roi_dose
-                except:
-                    traceback.print_exc()
+                if plan1_model.plan.Name not in self._dose_grids_updated:
+                    try:
+                        plan1_model.plan.TreatmentCourse.TotalDose.UpdateDoseGridStructures() # done for dose.GetDoseStatistic(RoiName="Glnds_Submand", DoseType="Average") in get_mean_roi_dose
+                        self._dose_grids_updated.add(plan1_model.plan.Name)
+                    except:
+                        traceback.print_exc()
 
                 values['Plan_1'] = {'Name':                plan1_model.plan.Name,
                                     'Modality':            plan1_model.plan.BeamSets[0].Modality,
@@ -2662,9 +4534,10 @@ class KNONTCP:
                                     'ComparisonJustified': None,
                                     'Rois':                {}
                                     }
+                plan1_gradients = plan1_model.get_ntcp_gradients()
                 for roi_type, roi in plan1_model.model_rois.items():
                     values['Plan_1']['Rois'][roi.name] = {
-                        'mean_dose': plan1_model.get_mean_roi_dose(roi_type), 'gradient': plan1_model.get_ntcp_per_gy(roi_type)
+                        'mean_dose': plan1_model.get_mean_roi_dose(roi_type), 'gradient': plan1_gradients[roi_type]
                     }
                 if plan1_model.plan.BeamSets[0].Modality == "Photons":
                     values['Plan_1']['ComparisonJustified'] = values['Plan_1']['PlanValue'] > values['Plan_1']['Threshold']
@@ -2679,8 +4552,9 @@ class KNONTCP:
                                     'PlanWins':       False,
                                     'Rois':           {}
                                     }
+                plan2_gradients = plan2_model.get_ntcp_gradients()
                 for roi_type, roi in plan2_model.model_rois.items():
-                    values['Plan_2']['Rois'][roi.name] = {'mean_dose': plan2_model.get_mean_roi_dose(roi_type), 'gradient': plan2_model.get_ntcp_per_gy(roi_type), 'color': "Black"}
+                    values['Plan_2']['Rois'][roi.name] = {'mean_dose': plan2_model.get_mean_roi_dose(roi_type), 'gradient': plan2_gradients[roi_type], 'color': "Black"}
 
                 if plan1_model is not None:
                     values['Plan_2']['DeltaNtcp'] = values['Plan_1']['PlanValue'] - values['Plan_2']['PlanValue']
@@ -2738,3 +4612,150 @@ class KNONTCP:
         if self._ntcp_dysphagia_grade_3_values is None:
             self._ntcp_dysphagia_grade_3_values = self._get_ntcp_model(self.plan1_ntcp_dysphagia_grade_3, self.plan2_ntcp_dysphagia_grade_3)
         return self._ntcp_dysphagia_grade_3_values
+
+class KNONTCPMultiPlan(KNONTCP):
+    """ KNONTCP over many plans of the current case (e.g. OG, Final and FinalAuto)
+        ROI geometries, the Glnds_Submand union and the ROI bindings are resolved once per case (the plans share the planning CT),
+        each plan then only binds its four model objects
+    """
+
+    ENDPOINTS = (NtcpKnoVectorized.ENDPOINT_XEROSTOMIA_GRADE_2, NtcpKnoVectorized.ENDPOINT_XEROSTOMIA_GRADE_3
+                 , NtcpKnoVectorized.ENDPOINT_DYSPHAGIA_GRADE_2, NtcpKnoVectorized.ENDPOINT_DYSPHAGIA_GRADE_3)
+
+    def __init__(self, params, plan_names) -> None:
+
+        # Step 1 - Get the plans
+        self._selected_plan1 = None
+        self._selected_plan2 = None
+
+        # Step 2 - Get RStation objects (and the ROI names once, from the first plan found)
+        self._patient    = connect.get_current("Patient")
+        self._case       = self._patient.Cases[0]
+        self._requested_plan_names = list(plan_names)
+        self._plan_names = []
+        self._roi_names  = []
+        for plan_name in plan_names:
+            if getRTPlanIndex(self._case, plan_name) > -1:
+                self._plan_names.append(plan_name)
+            else:
+                print (' - [ERROR][KNONTCPMultiPlan] Plan not found in plan list', plan_name)
+
+        if len(self._plan_names):
+            self._plan = self._case.TreatmentPlans[self._plan_names[0]]
+            self._roi_names = [roi.OfRoi.Name for roi in self._plan.GetTotalDoseStructureSet().RoiGeometries if roi.HasContours()]
+            if "Glnds_Submand" not in self._roi_names:
+                smdAlgebraStatus = self._do_smd_algebra()
+                self._roi_names = [roi.OfRoi.Name for roi in self._plan.GetTotalDoseStructureSet().RoiGeometries if roi.HasContours()]
+        self._roi_names_with_removed = [ModelRoi.REMOVED_NAME]
+        self._roi_names_with_removed.extend(self._roi_names)
+
+        # Step 3 - Get model parameters
+        self._set_model_parameters(params)
+
+        # Step 4 - No model objects until a plan is selected
+        self._set_plan1_models(-1)
+        self.plan2_ntcp_xerostomia_grade_2: NtcpKnoXerostomia = None
+        self.plan2_ntcp_xerostomia_grade_3: NtcpKnoXerostomia = None
+        self.plan2_ntcp_dysphagia_grade_2 : NtcpKnoDysphagia  = None
+        self.plan2_ntcp_dysphagia_grade_3 : NtcpKnoDysphagia  = None
+
+        # Step 99 - Results
+        self._dose_grids_updated = set()
+        self._reset_results()
+
+    def set_plan(self, plan_name) -> bool:
+        """ Bind the model objects to the given plan (ROI bindings are reused)
+        Returns:
+            bool: True if the plan exists in the case
+        """
+        self._selected_plan1 = plan_name
+        self._reset_results()
+        if plan_name not in self._plan_names:
+            self._set_plan1_models(-1)
+            return False
+        self._set_plan1_models(getRTPlanIndex(self._case, plan_name))
+        return True
+
+    def get_plan_values(self, plan_name) -> Dict[str, dict]:
+        """ Get the values of all NTCP endpoints for a plan
+        Returns:
+            Dict of {endpoint: values of _get_ntcp_model() or None}
+        """
+        values = {}
+        if not self.set_plan(plan_name):
+            return values
+        for endpoint in self.ENDPOINTS:
+            try:
+                values[endpoint] = getattr(self, f"ntcp_{endpoint}_values")
+            except:
+                traceback.print_exc()
+                values[endpoint] = None
+        return values
+
+    @staticmethod
+    def get_plan_result(plan_values: Dict[str, dict]) -> Dict[str, float]:
+        """ Default result of a plan ie. {model_name: ntcp_value}
+        """
+        res = {}
+        for endpoint, values in plan_values.items():
+            if values is not None and values.get(config.KEY_NTCP_PLAN_1) is not None:
+                res[values[config.KEY_NTCP_MODEL_NAME]] = round(values[config.KEY_NTCP_PLAN_1][config.KEY_NTCP_PLAN_VALUE], 5)
+        return res
+
+    def evaluate(self, path_results=None, get_plan_result=None) -> Dict[str, dict]:
+        """ Evaluate all plans in one pass, writing the results file after every plan
+        Args:
+            path_results: Path of the results json (e.g. <pathPatient>/ntcpResultsV2.json), None to not save
+            get_plan_result: Function converting the output of get_plan_values() into the saved result of a plan
+        Returns:
+            Dict of {plan_name: result}
+        """
+        get_plan_result = get_plan_result or self.get_plan_result
+        res = {}
+        for plan_name in self._requested_plan_names:
+            try:
+                res[plan_name] = get_plan_result(self.get_plan_values(plan_name))
+            except:
+                traceback.print_exc()
+                res[plan_name] = get_plan_result({})
+
+            if path_results is not None:
+                with open(str(path_results), 'w', encoding='utf-8') as fp:
+                    json.dump(res, fp, indent=4)
+
+        return res
+
+def getNTCPParams(patientInfo, defaultTumorLocation=None, forceTumorLocation=None):
+    """
+    Params
+    ------
+    patientInfo: Dict, registry row of a patient (see patientRegistry.getPatientInfo()), or None
+    defaultTumorLocation: NtcpKnoDysphagia.TumorLocationType, used when the patient is not in the registry
+    forceTumorLocation: NtcpKnoDysphagia.TumorLocationType, used instead of the registry's tumorLocation (the other registry columns are still used)
+
+    Returns
+    -------
+    params: Dict, as expected by KNONTCP()/KNONTCPMultiPlan()
+    """
+
+    info = dict(config.PATIENT_REGISTRY_DEFAULTS)
+    if patientInfo is not None:
+        info.update({keyname: patientInfo[keyname] for keyname in config.PATIENT_REGISTRY_DEFAULTS if keyname in patientInfo})
+        tumorLocation = NtcpKnoDysphagia.TumorLocationType[info[config.KEYNAME_TUMOR_LOCATION]] if info[config.KEYNAME_TUMOR_LOCATION] is not None else None
+    else:
+        tumorLocation = defaultTumorLocation
+    if forceTumorLocation is not None:
+        tumorLocation = forceTumorLocation
+
+    params = {
+        config.KEY_NTCP_PLAN1  : None
+        , config.KEY_NTCP_PLAN2: None
+        , config.KEY_NTCP_TREATMENT_TYPE       : TreatmentType[info[config.KEYNAME_TREATMENT_TYPE]]
+        , config.KEY_NTCP_TUMOR_LOCATION       : tumorLocation
+        , config.KEY_NTCP_BASELINE_XEROSTOMIA  : NtcpKnoXerostomia.BaselineType[info[config.KEYNAME_BASELINE_XEROSTOMIA]]
+        , config.KEY_NTCP_BASELINE_DYSPHAGIA   : NtcpKnoDysphagia.BaselineType[info[config.KEYNAME_BASELINE_DYSPHAGIA]]
+        , config.KEY_NTCP_IS_TOTAL_LARYNGECTOMY: info[config.KEYNAME_IS_TOTAL_LARYNGECTOMY]
+        , config.KEY_PAROTIDS_REMOVED          : info[config.KEYNAME_PAROTIDS_REMOVED]
+    }
+
+    return params
@@ -0,0 +1,491 @@
+"""
+This script is used to run a cohort of patients (photons and/or protons) across multiple worker processes
+It expects
+    - a cohort manifest (.csv) with one row per patient and the columns
+        - PatientID                 : e.g. HCAI-Dose-x40 (optional, defaults to the parent folder name of pathPatient)
+        - modality                  : photon / proton
+        - pathPatient               : folder containing CT, RTDose, RTPlan, RTStruct
+        - cancerType                : e.g. 1A OROFARKL (i.e. name of the clinical plan in RStation) (optional, defaults to the patient registry, see patientRegistry.py)
+        - pathKNOObjectivesClinical : path to the clinical KNO objectives .xml
+        - contourType               : one of config.{KEYNAME_CONTOUR_CLINICAL, KEYNAME_CONTOUR_AUTO, KEYNAME_CONTOUR_ALL, KEYNAME_CONTOUR_EVAL} (optional)
+        - optStepsForRe             : number of optimization runs per plan (optional)
+    - the same assets as hnDosePhotons.py and hnDoseProtons.py
+
+Before the cohort runs, runPreflight() checks all patients (without RStation) and only the ones that pass are dispatched.
+
+Each patient runs in a fresh worker process, so a crash for one patient does not affect the others.
+A RayStation instance has a single current patient, so each worker needs its own instance: the workers are bound to the process ids in
+commonParams[config.KEYNAME_RS_INSTANCES] (via config.ENV_RS_INSTANCE, before connect is imported) and there are never more workers than instances.
+Without instances, the cohort runs with one worker on the default instance.
+
+A failed patient is only retried if it has a stage ledger (config.FILENAME_STAGE_LEDGER, see helpers.resumeStage()), since only then
+a retry resumes from the last finished plan (and deletes a half-finished one) instead of running on a half-modified patient.
+
+Run the script from "__main__"
+"""
+
+# Import private libraries
+import config as config
+import patientRegistry
+
+# Import general libraries
+import os
+import csv
+import sys
+import pdb
+import json
+import time
+import logging
+import datetime
+import importlib
+import traceback
+import multiprocessing
+import concurrent.futures
+from pathlib import Path
+
+DEBUG_PDB = False
+def print(*args, **kwargs):
+    logging.info(" ".join(map(str, args)), **kwargs)
+
+########################################################
+#                        HELPERS                       #
+########################################################
+
+def readCohortManifest(pathManifest, pathRegistry=None):
+    """
+    Params
+    ------
+    pathManifest: Path, .csv file with the columns mentioned in the docstring of this script
+    pathRegistry: Path, patient registry (.csv) to fill in missing columns from (see patientRegistry.py)
+
+    Returns
+    -------
+    manifest: List of dicts, one per patient
+    """
+
+    manifest = []
+    try:
+
+        # Step 1 - Read rows
+        with open(str(pathManifest), 'r', newline='') as fp:
+            reader = csv.DictReader(fp)
+            for row in reader:
+                row = {key.strip(): str(val).strip() for key, val in row.items() if key is not None and val is not None}
+                if not len(row.get(config.KEYNAME_PATH_PATIENT, '')):
+                    continue
+
+                # Step 2 - Fill defaults
+                if not len(row.get(config.KEY_PATIENTID, '')):
+                    row[config.KEY_PATIENTID] = Path(row[config.KEYNAME_PATH_PATIENT]).parts[-2]
+                row[config.KEYNAME_MODALITY] = row.get(config.KEYNAME_MODALITY, config.KEYNAME_MODALITY_PHOTON).lower()
+                if row[config.KEYNAME_MODALITY] not in config.MODULE_MODALITY:
+                    print (f' - [readCohortManifest()] Unknown modality={row[config.KEYNAME_MODALITY]} for {row[config.KEY_PATIENTID]}')
+                    continue
+                if not len(row.get(config.KEYNAME_CANCER_TYPE, '')):
+                    patientInfo = patientRegistry.getPatientInfo(row[config.KEY_PATIENTID], pathRegistry)
+                    if patientInfo is None or not len(patientInfo.get(config.KEYNAME_CANCER_TYPE, '')):
+                        print (f' - [readCohortManifest()] No {config.KEYNAME_CANCER_TYPE} for {row[config.KEY_PATIENTID]} (in the manifest or patient registry)')
+                        continue
+                    row[config.KEYNAME_CANCER_TYPE] = patientInfo[config.KEYNAME_CANCER_TYPE]
+
+                manifest.append(row)
+
+        print (f' - [readCohortManifest()] Found {len(manifest)} patients in {pathManifest}')
+
+    except:
+        traceback.print_exc()
+        if DEBUG_PDB: pdb.set_trace()
+
+    return manifest
+
+def getPatientParams(row, commonParams):
+    """
+    Params
+    ------
+    row: Dict, single row of the cohort manifest
+    commonParams: Dict, paths and plan parameters shared by all patients of a cohort
+
+    Returns
+    -------
+    params: Dict, as expected by hnDosePhotons.main() or hnDoseProtons.main()
+    """
+
+    modality = row[config.KEYNAME_MODALITY]
+    rowOptSteps = row.get(config.KEYNAME_OPT_STEPS_RE, None) or '' # optional manifest column, overrides commonParams (which may also be a Dict, see helpers.getOptimizationSteps())
+    params = {
+
+        # Patient Case related
+        config.KEYNAME_PATH_PATIENT            : Path(row[config.KEYNAME_PATH_PATIENT])
+        , config.KEY_PATIENTID                 : row[config.KEY_PATIENTID]
+        , config.KEYNAME_FORCE_UPLOAD_PATIENT  : False
+        , config.KEYNAME_FORCE_CURRENT_PATIENT : False
+        , config.KEYNAME_FORCE_LOAD_PATIENT    : modality == config.KEYNAME_MODALITY_PROTON # for protons patients are already in RStation
+
+        # Paths
+        , config.KEYNAME_PATH_CLASSSOL         : commonParams[modality][config.KEYNAME_PATH_CLASSSOL]
+        , config.KEYNAME_PATH_OBJECTIVES       : Path(row[config.KEYNAME_PATH_OBJECTIVES])
+        , config.KEYNAME_PATH_DVHPARAMS        : commonParams[modality].get(config.KEYNAME_PATH_DVHPARAMS, None)
+        , config.KEYNAME_PATH_ROBUST_TEMPLATE  : commonParams[modality].get(config.KEYNAME_PATH_ROBUST_TEMPLATE, None)
+        , config.KEYNAME_PATH_ISODOSEXML       : commonParams[modality][config.KEYNAME_PATH_ISODOSEXML]
+        , config.KEYNAME_PATH_PATIENT_REGISTRY : commonParams.get(config.KEYNAME_PATH_PATIENT_REGISTRY, None)
+
+        # Plan parameters
+        , config.KEYNAME_CANCER_TYPE           : row[config.KEYNAME_CANCER_TYPE]
+        , config.KEYNAME_OPT_STEPS_RE          : int(rowOptSteps) if len(rowOptSteps.strip()) else commonParams[config.KEYNAME_OPT_STEPS_RE]
+        , config.KEYNAME_CONTOUR_TYPE          : row.get(config.KEYNAME_CONTOUR_TYPE, '') or commonParams[config.KEYNAME_CONTOUR_TYPE]
+    }
+
+    return params
+
+def isPatientResumable(params):
+    """
+    True if main() of a patient records its stages in a ledger (see helpers.resumeStage()), i.e. it is safe to run main() again on the same (half-modified) patient
+    """
+    pathPatient = params.get(config.KEYNAME_PATH_PATIENT, None)
+    return pathPatient is not None and Path(pathPatient).joinpath(config.FILENAME_STAGE_LEDGER).exists()
+
+def runPatient(args):
+    """
+    Runs main() of hnDosePhotons.py/hnDoseProtons.py for a single patient (in a worker process)
+
+    Params
+    ------
+    args: Tuple, (row, commonParams, retries, retryWait, dirLogs, rsInstances)
+          rsInstances: Queue of free RayStation instance ids (or None for the default instance). The worker holds one instance while it runs
+
+    Returns
+    -------
+    res: Dict, {patientID, modality, status, attempts, time, error, rsInstance}
+    """
+
+    row, commonParams, retries, retryWait, dirLogs, rsInstances = args
+    patientID = row[config.KEY_PATIENTID]
+    modality  = row[config.KEYNAME_MODALITY]
+    res = {config.KEY_PATIENTID: patientID, config.KEYNAME_MODALITY: modality, config.KEYNAME_STATUS: False
+           , config.KEYNAME_ATTEMPTS: 0, config.KEYNAME_TIME: -1, config.KEYNAME_ERROR: None, config.KEYNAME_RS_INSTANCE: None}
+    t0 = time.time()
+
+    rsInstance = None
+    try:
+
+        # Step 0 - Logging (one file per patient)
+        loggerTimestamp = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+        pathLogFile     = Path(dirLogs).joinpath("{}-log_{}_{}.txt".format(modality, patientID, loggerTimestamp))
+        Path(pathLogFile).parent.mkdir(parents=True, exist_ok=True)
+        logging.basicConfig(filename=str(pathLogFile), level=logging.DEBUG, filemode='a', format='%(asctime)s[%(levelname)s] %(funcName)s: %(message)s',datefmt='%d/%m/%Y %I:%M:%S %p')
+
+        # Step 1 - Bind this worker to a free RayStation instance (before the script module imports connect)
+        if rsInstances is not None:
+            rsInstance = rsInstances.get()
+            os.environ[config.ENV_RS_INSTANCE] = str(rsInstance)
+            res[config.KEYNAME_RS_INSTANCE] = rsInstance
+            print (f' - [runPatient()][{patientID}] Using RayStation instance: {rsInstance}')
+
+        # Step 1.1 - Get script module (imported within the worker, i.e. after the instance is set)
+        moduleScript = importlib.import_module(config.MODULE_MODALITY[modality])
+        params       = getPatientParams(row, commonParams)
+        print ('\n -------------------------- [runPatient] params: ')
+        print (params)
+
+        # Step 2 - Run (with retries)
+        for attempt in range(1, retries + 2):
+            res[config.KEYNAME_ATTEMPTS] = attempt
+            try:
+                mainStatus = moduleScript.main(params)
+                if mainStatus:
+                    res[config.KEYNAME_STATUS] = True
+                    res[config.KEYNAME_ERROR]  = None
+                    break
+                res[config.KEYNAME_ERROR] = 'main() returned {}'.format(mainStatus)
+            except:
+                traceback.print_exc()
+                res[config.KEYNAME_ERROR] = traceback.format_exc()
+
+            print (f' - [runPatient()][{patientID}] Attempt {attempt} failed: {res[config.KEYNAME_ERROR]}')
+            if attempt < retries + 1:
+                if not isPatientResumable(params):
+                    print (f' - [runPatient()][{patientID}] Not retrying, since there is no stage ledger in {params[config.KEYNAME_PATH_PATIENT]}')
+                    break
+                time.sleep(retryWait)
+
+    except:
+        traceback.print_exc()
+        res[config.KEYNAME_ERROR] = traceback.format_exc()
+    
+    finally:
+        if rsInstance is not None:
+            rsInstances.put(rsInstance)
+
+    res[config.KEYNAME_TIME] = round(time.time() - t0, 2)
+    return res
+
+def saveCohortSummary(pathCohortSummary, results, tCohort):
+
+    try:
+        summary = {
+            'total'    : len(results)
+            , 'passed' : len([each for each in results if each[config.KEYNAME_STATUS]])
+            , 'failed' : [each[config.KEY_PATIENTID] for each in results if not each[config.KEYNAME_STATUS]]
+            , 'retried': [each[config.KEY_PATIENTID] for each in results if each[config.KEYNAME_ATTEMPTS] > 1]
+            , config.KEYNAME_TIME : round(time.time() - tCohort, 2)
+        }
+        Path(pathCohortSummary).parent.mkdir(parents=True, exist_ok=True)
+        with open(str(pathCohortSummary), 'w') as fp:
+            json.dump({config.KEYNAME_SUMMARY: summary, config.KEYNAME_PATIENTS: results}, fp, indent=4)
+        return summary
+
+    except:
+        traceback.print_exc()
+        if DEBUG_PDB: pdb.set_trace()
+
+    return {}
+
+def getEvalRoiNames(pathDVHParams):
+    """
+    ROI names (first column) of the roi/dvh parameter file (see helpers.read_dvhparamlist_csv_or_txt())
+    """
+    
+    roiNames = []
+    with open(str(pathDVHParams), 'r') as fp:
+        for line in fp:
+            roiName = line.split(';')[0].strip()
+            if len(roiName) and roiName not in roiNames:
+                roiNames.append(roiName)
+    
+    return roiNames
+
+def preflightPatient(row, commonParams):
+    """
+    Checks (without RStation) what uploadRTAppsDataToRStation() and main() of hnDosePhotons.py/hnDoseProtons.py expect of a patient
+
+    Returns
+    -------
+    res: Dict, {patientID, modality, go, errors, warnings, time}
+    """
+
+    import dicomHelpers # pydicom is only needed for the preflight
+
+    patientID = row[config.KEY_PATIENTID]
+    modality  = row[config.KEYNAME_MODALITY]
+    res = {config.KEY_PATIENTID: patientID, config.KEYNAME_MODALITY: modality, config.KEYNAME_GO: False
+           , config.KEYNAME_ERRORS: [], config.KEYNAME_WARNINGS: [], config.KEYNAME_TIME: -1}
+    t0 = time.time()
+
+    try:
+        params = getPatientParams(row, commonParams)
+        # for protons, patients are already in RStation (config.KEYNAME_FORCE_LOAD_PATIENT), so DICOM issues are only warnings
+        dicomIssues = res[config.KEYNAME_WARNINGS] if params[config.KEYNAME_FORCE_LOAD_PATIENT] else res[config.KEYNAME_ERRORS]
+
+        # Step 1 - Files
+        for keyname in [config.KEYNAME_PATH_CLASSSOL, config.KEYNAME_PATH_OBJECTIVES, config.KEYNAME_PATH_ISODOSEXML, config.KEYNAME_PATH_DVHPARAMS, config.KEYNAME_PATH_ROBUST_TEMPLATE]:
+            if params[keyname] is not None and not Path(params[keyname]).exists():
+                res[config.KEYNAME_ERRORS].append(f'{keyname} not found: {params[keyname]}')
+        
+        # Step 2 - Folder layout
+        pathPatient = params[config.KEYNAME_PATH_PATIENT]
+        if not Path(pathPatient).exists():
+            dicomIssues.append(f'{config.KEYNAME_PATH_PATIENT} not found: {pathPatient}')
+        
+        else:
+            manifest = dicomHelpers.getDicomManifest(pathPatient)
+            folders  = {}
+            for folderPrefix in [config.KEYNAME_CT, config.KEYNAME_RTDOSE, config.KEYNAME_RTPLAN, config.KEYNAME_RTSTRUCT]:
+                folders[folderPrefix] = dicomHelpers.getManifestFolders(manifest, pathPatient, folderPrefix)
+                if len(folders[folderPrefix]) != 1:
+                    dicomIssues.append(f'{len(folders[folderPrefix])} {folderPrefix} folders (with DICOM files) instead of 1')
+                
+                # Step 3 - DICOM headers
+                for pathFolder in folders[folderPrefix]:
+                    series = dicomHelpers.getManifestSeries(manifest, pathFolder)
+                    if len(series) != 1:
+                        dicomIssues.append(f'{len(series)} series in {pathFolder.name} instead of 1')
+                    if any(seriesPatientID != series[0][0] for seriesPatientID, _, _ in series):
+                        dicomIssues.append(f'multiple PatientIDs in {pathFolder.name}')
+            
+            # Step 4 - ROI names
+            if len(folders[config.KEYNAME_RTSTRUCT]) == 1:
+                relPathsRTStruct = [relPath for relPath, entry in manifest.items() if entry[config.KEYNAME_FOLDER] == folders[config.KEYNAME_RTSTRUCT][0].name]
+                roiNames = dicomHelpers.getRTStructRoiNames(Path(pathPatient).joinpath(sorted(relPathsRTStruct)[0]))
+                if config.KEYNAME_PTV_DL1_DVH not in roiNames:
+                    dicomIssues.append(f'{config.KEYNAME_PTV_DL1_DVH} not in RTSTRUCT')
+                roisMissing = [roiName for roiName in config.OARS if roiName not in roiNames]
+                if len(roisMissing):
+                    res[config.KEYNAME_WARNINGS].append(f'OARs not in RTSTRUCT: {roisMissing}')
+                if params[config.KEYNAME_PATH_DVHPARAMS] is not None and Path(params[config.KEYNAME_PATH_DVHPARAMS]).exists():
+                    roisMissing = [roiName for roiName in getEvalRoiNames(params[config.KEYNAME_PATH_DVHPARAMS]) if roiName not in roiNames]
+                    if len(roisMissing):
+                        res[config.KEYNAME_WARNINGS].append(f'eval ROIs not in RTSTRUCT: {roisMissing}')
+
+        # Step 5 - Patient registry (for NTCP)
+        patientInfo = patientRegistry.getPatientInfo(patientID, params[config.KEYNAME_PATH_PATIENT_REGISTRY])
+        if patientInfo is None:
+            res[config.KEYNAME_WARNINGS].append('not in the patient registry')
+        elif patientInfo[config.KEYNAME_TUMOR_LOCATION] is None:
+            res[config.KEYNAME_WARNINGS].append(f'no {config.KEYNAME_TUMOR_LOCATION} in the patient registry (no NTCP)')
+
+    except:
+        traceback.print_exc()
+        res[config.KEYNAME_ERRORS].append(traceback.format_exc())
+
+    res[config.KEYNAME_GO]   = len(res[config.KEYNAME_ERRORS]) == 0
+    res[config.KEYNAME_TIME] = round(time.time() - t0, 2)
+    return res
+
+def runPreflight(manifest, commonParams, dirLogs, workers=8):
+    """
+    Checks all patients of a cohort at the same time (I/O bound, so threads) and saves a go/no-go report in dirLogs
+
+    Params
+    ------
+    manifest: List of dicts, see readCohortManifest()
+
+    Returns
+    -------
+    results: List of dicts, see preflightPatient()
+    """
+
+    results = []
+    tPreflight = time.time()
+    try:
+        
+        # Step 1 - Check patients
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(workers, len(manifest)))) as executor:
+            results = list(executor.map(lambda row: preflightPatient(row, commonParams), manifest))
+        
+        # Step 2 - Report
+        for res in results:
+            sys.stdout.write(f' - [runPreflight()] {res[config.KEY_PATIENTID]}: {"GO" if res[config.KEYNAME_GO] else "NO-GO"} (errors={res[config.KEYNAME_ERRORS]}, warnings={res[config.KEYNAME_WARNINGS]}) \n')
+        summary = {
+            'total'   : len(results)
+            , config.KEYNAME_GO : len([each for each in results if each[config.KEYNAME_GO]])
+            , 'noGo'  : [each[config.KEY_PATIENTID] for each in results if not each[config.KEYNAME_GO]]
+            , config.KEYNAME_TIME : round(time.time() - tPreflight, 2)
+        }
+        loggerTimestamp   = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+        pathPreflight     = Path(dirLogs).joinpath(config.FILENAME_COHORT_PREFLIGHT.format(loggerTimestamp))
+        Path(pathPreflight).parent.mkdir(parents=True, exist_ok=True)
+        with open(str(pathPreflight), 'w') as fp:
+            json.dump({config.KEYNAME_SUMMARY: summary, config.KEYNAME_PATIENTS: results}, fp, indent=4)
+        sys.stdout.write(f' - [runPreflight()] {summary} (report: {pathPreflight}) \n')
+
+    except:
+        traceback.print_exc()
+        if DEBUG_PDB: pdb.set_trace()
+
+    return results
+
+########################################################
+#                        MAIN(S)                       #
+########################################################
+
+def runCohort(pathManifest, commonParams, dirLogs, workers=1, retries=1, retryWait=60, pathCohortSummary=None, preflight=True):
+    """
+    Params
+    ------
+    pathManifest: Path, cohort manifest (.csv)
+    commonParams: Dict, {config.KEYNAME_MODALITY_PHOTON: {...}, config.KEYNAME_MODALITY_PROTON: {...}, config.KEYNAME_OPT_STEPS_RE: int | Dict (see helpers.getOptimizationSteps()), config.KEYNAME_CONTOUR_TYPE: str
+                         , config.KEYNAME_PATH_PATIENT_REGISTRY: Path (optional), config.KEYNAME_RS_INSTANCES: List of RayStation process ids (optional)}
+    dirLogs: Path, folder for the per-patient log files and the cohort summary
+    workers: Int, number of worker processes, capped at the number of RayStation instances in commonParams (i.e. 1 without instances)
+    retries: Int, number of retries for a patient whose main() failed (only for patients with a stage ledger, see isPatientResumable())
+    retryWait: Int, seconds to wait before retrying a patient
+    pathCohortSummary: Path, .json file for the aggregated summary (updated as each patient finishes)
+    preflight: Bool, if True, patients that fail runPreflight() are not run (and are reported as failed)
+    """
+
+    results = []
+    tCohort = time.time()
+    try:
+
+        # Step 0 - Init
+        manifest = readCohortManifest(pathManifest, commonParams.get(config.KEYNAME_PATH_PATIENT_REGISTRY, None))
+        if not len(manifest):
+            return results
+        if pathCohortSummary is None:
+            loggerTimestamp   = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+            pathCohortSummary = Path(dirLogs).joinpath(config.FILENAME_COHORT_SUMMARY.format(loggerTimestamp))
+
+        # Step 0 - Preflight (so that RStation time is not spent on patients that will fail halfway)
+        if preflight:
+            preflightResults = runPreflight(manifest, commonParams, dirLogs)
+            patientIDsNoGo   = [each[config.KEY_PATIENTID] for each in preflightResults if not each[config.KEYNAME_GO]]
+            for each in preflightResults:
+                if not each[config.KEYNAME_GO]:
+                    results.append({config.KEY_PATIENTID: each[config.KEY_PATIENTID], config.KEYNAME_MODALITY: each[config.KEYNAME_MODALITY], config.KEYNAME_STATUS: False
+                                    , config.KEYNAME_ATTEMPTS: 0, config.KEYNAME_TIME: each[config.KEYNAME_TIME], config.KEYNAME_ERROR: 'preflight: {}'.format(each[config.KEYNAME_ERRORS])})
+            manifest = [row for row in manifest if row[config.KEY_PATIENTID] not in patientIDsNoGo]
+            if not len(manifest):
+                saveCohortSummary(pathCohortSummary, results, tCohort)
+                return results
+
+        # Step 0 - One worker per RayStation instance (a RayStation instance has a single current patient)
+        rsInstanceIds = list(commonParams.get(config.KEYNAME_RS_INSTANCES, None) or [])
+        if workers > max(1, len(rsInstanceIds)):
+            print (f' - [runCohort()] {workers} workers for {len(rsInstanceIds)} RayStation instances, using {max(1, len(rsInstanceIds))} worker(s)')
+            workers = max(1, len(rsInstanceIds))
+
+        sys.stdout.write(f' \n\n ===================== start cohort of {len(manifest)} patients ({workers} workers) ===================== \n')
+
+        # Step 1 - Dispatch patients (maxtasksperchild=1 gives every patient a fresh process, each taking a free instance from rsInstances)
+        with multiprocessing.Manager() as manager:
+            rsInstances = None
+            if len(rsInstanceIds):
+                rsInstances = manager.Queue()
+                for rsInstanceId in rsInstanceIds:
+                    rsInstances.put(rsInstanceId)
+            argsList = [(row, commonParams, retries, retryWait, dirLogs, rsInstances) for row in manifest]
+            resultsPrior = len(results)
+            with multiprocessing.Pool(processes=min(workers, len(argsList)), maxtasksperchild=1) as pool:
+                for res in pool.imap_unordered(runPatient, argsList):
+                    results.append(res)
+                    sys.stdout.write(f' - [runCohort()][{len(results) - resultsPrior}/{len(argsList)}] {res[config.KEY_PATIENTID]}: status={res[config.KEYNAME_STATUS]} (attempts={res[config.KEYNAME_ATTEMPTS]}, {res[config.KEYNAME_TIME]} s) \n')
+                    saveCohortSummary(pathCohortSummary, results, tCohort)
+
+        # Step 2 - Summary
+        summary = saveCohortSummary(pathCohortSummary, results, tCohort)
+        sys.stdout.write(f' \n\n ===================== end cohort (in {round(time.time() - tCohort, 2)} s): {summary} ===================== \n')
+
+    except:
+        traceback.print_exc()
+        if DEBUG_PDB: pdb.set_trace()
+
+    return results
+
+########################################################
+#                       PARAMS(S)                      #
+########################################################
+
+if __name__ == "__main__":
+
+    ###################################################################################
+    # Step 0 - Init project paths
+    ###################################################################################
+    DIR_THIS = Path(__file__).parent.absolute() # P:\RayStationScripts
+    DIR_DATA = Path(DIR_THIS).parent.absolute().joinpath('RayStationData')
+    DIR_LOGS = Path(DIR_THIS).joinpath('_logs', 'logsCohort', 'run1')
+
+    ###################################################################################
+    # Step 1 - Get common files
+    ###################################################################################
+    commonParams = {
+        config.KEYNAME_MODALITY_PHOTON: {
+            config.KEYNAME_PATH_CLASSSOL     : Path(DIR_DATA).joinpath('assets', 'objective-template-photon-kno.xml')
+            , config.KEYNAME_PATH_DVHPARAMS  : Path(DIR_DATA).joinpath('assets', 'eval-template-photon.csv')
+            , config.KEYNAME_PATH_ISODOSEXML : Path(DIR_DATA).joinpath('assets', 'isodose.xml')
+        }
+        , config.KEYNAME_MODALITY_PROTON: {
+            config.KEYNAME_PATH_CLASSSOL          : Path(DIR_DATA).joinpath('assets', 'objective-template-proton-kno.xml')
+            , config.KEYNAME_PATH_ROBUST_TEMPLATE : Path(DIR_DATA).joinpath('assets', 'eval-template-proton-robust.json')
+            , config.KEYNAME_PATH_ISODOSEXML      : Path(DIR_DATA).joinpath('assets', 'isodose.xml')
+        }
+        , config.KEYNAME_OPT_STEPS_RE : 4
+        , config.KEYNAME_CONTOUR_TYPE : config.KEYNAME_CONTOUR_ALL
+        , config.KEYNAME_PATH_PATIENT_REGISTRY : Path(DIR_DATA).joinpath('assets', config.FILENAME_PATIENT_REGISTRY)
+        , config.KEYNAME_RS_INSTANCES : [] # e.g. [12345, 23456] i.e. process ids of the RayStation instances to run the cohort on (one worker each)
+    }
+
+    ###################################################################################
+    # Step 2 - Run cohort
+    ###################################################################################
+    pathManifest = Path(DIR_DATA).joinpath('LUMC-Dose', 'cohort-manifest.csv')
+    runCohort(pathManifest, commonParams, DIR_LOGS, workers=max(1, len(commonParams[config.KEYNAME_RS_INSTANCES])), retries=1)
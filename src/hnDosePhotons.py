@@ -14,6 +14,7 @@ import connect
 # Import private libraries
 import helpers as helpers
 import config as config
+import patientRegistry
 
 # Import general libraries
 import re
@@ -37,61 +38,7 @@ def print(*args, **kwargs):
 #                        HELPERS                       #
 ########################################################
 
-def optimizePlan(planName, count=10, reset=True, pathIsoDoseXML=None):
-
-    optimizeStatus = False
-    objectiveValues = []
-    try:
-        # Step 1 - Get plan and beamset
-        patient = helpers.rayStationSave()
-        case    = patient.Cases[0]
-        plan    = case.TreatmentPlans[planName]
-        beamset = case.TreatmentPlans[planName].BeamSets[planName]
-        beamSetIndex = plan.BeamSets.IndexOf(beamset)
-
-        # Step 2 - Reset existing optimization
-        if reset:
-            plan.PlanOptimizations[beamSetIndex].ResetOptimization()
-            print ('\n\n - [optimizePlan()][Patient={}][Plan={}] Optimization has been reset ...'.format(helpers.getPatientIdentifier(patient), planName))
-        else:
-            print ('\n\n - [optimizePlan()][Patient={}][Plan={}] Optimization has not been reset ...'.format(helpers.getPatientIdentifier(patient), planName))
-            if plan.PlanOptimizations[beamSetIndex].ProgressOfOptimization is not None:
-                objectiveValue = plan.PlanOptimizations[beamSetIndex].ProgressOfOptimization.ObjectiveValues[-1] # [TODO: range = (0.36,?)]
-                print (' - [optimizePlan()][Patient={}][Plan={}] Previous objective {:.4f}'.format(helpers.getPatientIdentifier(patient), planName, objectiveValue))
-        _ = helpers.rayStationSave()
-
-        # Step 3 - Run optimization
-        times = []
-        
-        for runID in range(count):
-            t0 = time.time()
-            print (' - [optimizePlan()][Patient={}][Plan={}] Running optimization step {}/{} ... '.format(helpers.getPatientIdentifier(patient), planName, runID+1, count))
-            plan.PlanOptimizations[beamSetIndex].RunOptimization()   
-            times.append(time.time() - t0)
-            try:
-                objectiveValue = plan.PlanOptimizations[beamSetIndex].ProgressOfOptimization.ObjectiveValues[-1] # [TODO: range = (0.36,?)]
-                print (' --- [optimizePlan()] Optimization step {}/{} took {:.2f} seconds with mean objective: {:.4f}'.format(runID+1, count, times[-1], objectiveValue))
-                objectiveValues.append(objectiveValue)
-            except:
-                traceback.print_exc()
-                if DEBUG_PDB: pdb.set_trace()
-        print (' - [optimizePlan()] Optimization took total {:.2f} seconds with mean objective: {:.4f}'.format(np.sum(times), objectiveValue))
-
-        if runID == count-1:
-            optimizeStatus = True
-        
-        if optimizeStatus:
-            helpers.applyIsoDoseColors(pathIsoDoseXML, case, beamset)
-        else:
-            print (' - [optimizePlan()] Full optimization failed, not applying isodose colors')
-
-    except:
-        traceback.print_exc()
-        if DEBUG_PDB: pdb.set_trace() 
-    
-    return optimizeStatus, objectiveValues
-
-def uploadORUpdateObjectives(planName, pathKNOObjectives, uploadObjectivesBool, updateObjectivesBool, forceObjectives, objectiveFType):
+def uploadORUpdateObjectives(planName, pathKNOObjectives, uploadObjectivesBool, updateObjectivesBool, forceObjectives, objectiveFType, pathPatient=None):
 
     # Step 1 - Init
     objectiveStatus    = False
@@ -112,7 +59,7 @@ def uploadORUpdateObjectives(planName, pathKNOObjectives, uploadObjectivesBool,
     
     elif updateObjectivesBool:
         if len(objectivesFromRS) > 0:
-            objectiveStatus = updateObjectives(planName, objectivesFromRS, objectivesFromPath, objectiveFType)
+            objectiveStatus = updateObjectives(planName, objectivesFromRS, objectivesFromPath, objectiveFType, pathPatient=pathPatient)
         else:
             print(' - [uploadORUpdateObjectives()] No objectives found, not updating')
     
@@ -121,71 +68,34 @@ def uploadORUpdateObjectives(planName, pathKNOObjectives, uploadObjectivesBool,
 
     return objectiveStatus
 
-def checkIfRoiIgnore(planName, objectiveFType, roiName):
-    
-    # Step 1 - Init
-    roisFullIgnore = []
-    roisPartialIgnore = []
-    roiIgnoreBool = False
+# ROI-ignore rules (while updating objectives) for each plan stage, compiled once (see helpers.RoiIgnoreRuleEngine)
+roisPartialIgnorePhoton = [config.REGEX_PROSTHESE, config.REGEX_DFO, config.REGEX_DMAX, config.REGEX_DOSE, config.REGEX_KAAK
+                            , config.REGEX_LIPPEN
+                            , config.KEYNAME_MANDIBLE_PTV
+                            , config.KEYNAME_MANDIBLE
+                            , config.REGEX_5805
+                            , config.KEYNAME_BRAIN
+                        ]
+ROI_IGNORE_RULES = helpers.RoiIgnoreRuleEngine(
+    roisNoIgnore=[config.KEYNAME_BRAINSTEM, config.KEYNAME_BRAINSTEM + config.KEY_3MM_SUFFIX
+                  , config.KEYNAME_SPINALCORD, config.KEYNAME_SPINALCORD + config.KEY_3MM_SUFFIX
+                  , config.KEYNAME_GHOST_CRANIAL, config.KEYNAME_EAR_L_GHOST, config.KEYNAME_EAR_R_GHOST
+                  ]
+    , stageRules=[
+        [[config.SUFFIX_PLAN_CS.format(config.PREFIX_CLINICAL_CONTOURS), config.SUFFIX_PLAN_CS.format(config.PREFIX_AUTOMATED_CONTOURS)]
+            , None, [config.KEYNAME_BODY, config.KEYNAME_RING_PTV_DL2, config.KEYNAME_GHOST], []] # this will actually never be called
+        , [[config.SUFFIX_PLAN_DFO.format(config.PREFIX_CLINICAL_CONTOURS), config.SUFFIX_PLAN_DFO.format(config.PREFIX_AUTOMATED_CONTOURS)]
+            , config.KEY_FTYPE_DOSEFALLOFF, [config.KEYNAME_BODY, config.KEYNAME_RING_PTV_DL2, config.KEYNAME_GHOST], roisPartialIgnorePhoton]
+        , [[config.SUFFIX_PLAN_DFO2.format(config.PREFIX_CLINICAL_CONTOURS), config.SUFFIX_PLAN_DFO2.format(config.PREFIX_AUTOMATED_CONTOURS)]
+            , config.KEY_FTYPE_DOSEFALLOFF, [config.KEYNAME_BODY, config.KEYNAME_RING_PTV_DL2, config.KEYNAME_GHOST], roisPartialIgnorePhoton]
+        , [[config.SUFFIX_PLAN_EUD.format(config.PREFIX_CLINICAL_CONTOURS), config.SUFFIX_PLAN_EUD.format(config.PREFIX_AUTOMATED_CONTOURS)]
+            , config.KEY_FTYPE_MAXEUD, [config.KEYNAME_BODY, config.KEYNAME_RING_PTV_DL2, config.KEYNAME_GHOST], roisPartialIgnorePhoton]
+        , [[config.SUFFIX_PLAN_FINAL.format(config.PREFIX_CLINICAL_CONTOURS), config.SUFFIX_PLAN_FINAL.format(config.PREFIX_AUTOMATED_CONTOURS)]
+            , None, [config.KEYNAME_BODY], []]
+    ])
 
-    keyPlanCSTerm        = config.SUFFIX_PLAN_CS.format(config.PREFIX_CLINICAL_CONTOURS)
-    keyPlanCSAutoTerm    = config.SUFFIX_PLAN_CS.format(config.PREFIX_AUTOMATED_CONTOURS)
-    keyPlanDFOTerm       = config.SUFFIX_PLAN_DFO.format(config.PREFIX_CLINICAL_CONTOURS)
-    keyPlanDFOAutoTerm   = config.SUFFIX_PLAN_DFO.format(config.PREFIX_AUTOMATED_CONTOURS)
-    keyPlanDFO2Term      = config.SUFFIX_PLAN_DFO2.format(config.PREFIX_CLINICAL_CONTOURS)
-    keyPlanDFO2AutoTerm  = config.SUFFIX_PLAN_DFO2.format(config.PREFIX_AUTOMATED_CONTOURS)
-    keyPlanEUDTerm       = config.SUFFIX_PLAN_EUD.format(config.PREFIX_CLINICAL_CONTOURS)
-    keyPlanEUDAutoTerm   = config.SUFFIX_PLAN_EUD.format(config.PREFIX_AUTOMATED_CONTOURS)
-    keyPlanFinalTerm     = config.SUFFIX_PLAN_FINAL.format(config.PREFIX_CLINICAL_CONTOURS)
-    keyPlanFinalAutoTerm = config.SUFFIX_PLAN_FINAL.format(config.PREFIX_AUTOMATED_CONTOURS)
-
-    # Step 2 - Ignore check on certain ROIs
-    if roiName in [config.KEYNAME_BRAINSTEM, config.KEYNAME_BRAINSTEM + config.KEY_3MM_SUFFIX
-                   , config.KEYNAME_SPINALCORD, config.KEYNAME_SPINALCORD + config.KEY_3MM_SUFFIX
-                   , config.KEYNAME_GHOST_CRANIAL, config.KEYNAME_EAR_L_GHOST, config.KEYNAME_EAR_R_GHOST
-                   ]:
-        return roiIgnoreBool
-
-    # Step 2 - Get ROIs to ignore (while updating objectives)
-    roisPartialIgnoreList = [config.REGEX_PROSTHESE, config.REGEX_DFO, config.REGEX_DMAX, config.REGEX_DOSE, config.REGEX_KAAK
-                             , config.REGEX_LIPPEN
-                             , config.KEYNAME_MANDIBLE_PTV
-                             , config.KEYNAME_MANDIBLE
-                             , config.REGEX_5805
-                             , config.KEYNAME_BRAIN
-                            ]
-    
-    if (keyPlanCSTerm in planName or keyPlanCSAutoTerm in planName) and objectiveFType == None: # this will actually never be called
-        roisFullIgnore = [config.KEYNAME_BODY, config.KEYNAME_RING_PTV_DL2, config.KEYNAME_GHOST]
-
-    elif (keyPlanDFOTerm in planName or keyPlanDFOAutoTerm in planName) and objectiveFType == config.KEY_FTYPE_DOSEFALLOFF:
-        roisFullIgnore = [config.KEYNAME_BODY, config.KEYNAME_RING_PTV_DL2, config.KEYNAME_GHOST]
-        roisPartialIgnore = roisPartialIgnoreList
-
-    elif (keyPlanDFO2Term in planName or keyPlanDFO2AutoTerm in planName) and objectiveFType == config.KEY_FTYPE_DOSEFALLOFF:
-        roisFullIgnore = [config.KEYNAME_BODY, config.KEYNAME_RING_PTV_DL2, config.KEYNAME_GHOST]
-        roisPartialIgnore = roisPartialIgnoreList
-    
-    elif (keyPlanEUDTerm in planName or keyPlanEUDAutoTerm in planName) and objectiveFType == config.KEY_FTYPE_MAXEUD:
-        roisFullIgnore = [config.KEYNAME_BODY, config.KEYNAME_RING_PTV_DL2, config.KEYNAME_GHOST]
-        roisPartialIgnore = roisPartialIgnoreList
-    
-    elif (keyPlanFinalTerm in planName or keyPlanFinalAutoTerm in planName) and objectiveFType == None:
-        roisFullIgnore = [config.KEYNAME_BODY]
-        roisPartialIgnore = []
-
-    # Step 3 - Check if ROI should be ignored
-    for roiFullIgnore in roisFullIgnore:
-        if roiName == roiFullIgnore:
-            roiIgnoreBool = True
-            break
-    
-    for roiPartialIgnore in roisPartialIgnore:
-        if re.search(roiPartialIgnore, str(roiName).lower()) is not None:
-            roiIgnoreBool = True
-            break
-
-    return roiIgnoreBool
+def checkIfRoiIgnore(planName, objectiveFType, roiName):
+    return ROI_IGNORE_RULES.isIgnored(planName, objectiveFType, roiName)
 
 def updateObjectiveRingPTVDL1(planName, objectivesFromRS, rsIdx):
 
@@ -218,7 +128,7 @@ def updateObjectiveRingPTVDL1(planName, objectivesFromRS, rsIdx):
 
     return updateStatus
     
-def updateObjectives(planName, objectivesFromRS, objectivesFromPath, objectiveFType):
+def updateObjectives(planName, objectivesFromRS, objectivesFromPath, objectiveFType, pathPatient=None):
     """
     Called from uploadORUpdateObjectives()
 
@@ -228,6 +138,7 @@ def updateObjectives(planName, objectivesFromRS, objectivesFromPath, objectiveFT
     objectivesFromRS: list
     objectivesFromPath: list
     objectiveFType: str, ['DoseFallOff', 'DoseFallOff', 'MaxEUD', None]
+    pathPatient: Path, (optional) folder to save the objective diff (config.FILENAME_OBJECTIVE_DIFF) in
     """
     updateObjectiveStatus = False
 
@@ -240,100 +151,26 @@ def updateObjectives(planName, objectivesFromRS, objectivesFromPath, objectiveFT
         keyPlanFinalTerm     = config.SUFFIX_PLAN_FINAL.format(config.PREFIX_CLINICAL_CONTOURS) # R5 
         keyPlanFinalAutoTerm = config.SUFFIX_PLAN_FINAL.format(config.PREFIX_AUTOMATED_CONTOURS) # A5
 
-        # Step 2 - Get existing objectives
-        updatedFromPathObjectivesStatus = {}
-        for pathIdx, objectiveFromPath in enumerate(objectivesFromPath):
-            newRoiName      = objectiveFromPath.roi_name
-            if newRoiName == config.KEYNAME_BODY: continue
-            newFunctionType = objectiveFromPath.function_type
-            key = f'{newRoiName}-{newFunctionType}'
-            updatedFromPathObjectivesStatus[key] = {'exists': False, 'idx':pathIdx}
-
-        # Step 4 - Update objectives
+        # Step 2 - Diff existing objectives with new objectives (keyed on roi-name and function-type)
         if len(objectivesFromRS) > 0:
             print ('\n\n - [INFO][updateObjectives()][Patient={}] Updating Objectives ... '.format(helpers.getPatientIdentifier(patient)))
-            
-            # Step 4.1 - Update weights of existing objectives (based on function-type and roi-name)
-            for rsIdx, objectiveFromRS in enumerate(objectivesFromRS):
-                try:
-                    existingRoiName      = objectiveFromRS.ForRegionOfInterest.Name
-                    existingWeight       = objectiveFromRS.DoseFunctionParameters.Weight
-                    if existingRoiName == config.KEYNAME_BODY: continue
-                    try:
-                        existingFunctionType = objectiveFromRS.DoseFunctionParameters.FunctionType
-                    except:
-                        existingFunctionType = config.KEY_FTYPE_DOSEFALLOFF
-                    
-                    # print (' - existingRoiName: {}/{}, existingFunctionType: {}, existingWeight: {}'.format(existingRoiName, config.KEYNAME_RING_LT_PTV_DL1, existingFunctionType, existingWeight))
-                    if existingRoiName == config.KEYNAME_RING_LT_PTV_DL1 and objectiveFType is not None:
-                        if updateObjectiveRingPTVDL1(planName, objectivesFromRS, rsIdx):
-                            continue
-                    
-                    # [DEBUG]
-                    if 0:
-                        print (' - [DEBUG][updateObjectives()] roi: {}, \tfunctionType: {}, \tweight: {}'.format(existingRoiName, existingFunctionType, existingWeight))
-                    
-                    # Make note of existing objectives that are in new objectives
-                    key = f'{existingRoiName}-{existingFunctionType}'
-                    if key in updatedFromPathObjectivesStatus: updatedFromPathObjectivesStatus[key]['exists'] = True
-
-                    # Step 4.1 - Check if existing objective is in new objectives
-                    for objectiveFromPath in objectivesFromPath:
-                        newRoiName      = objectiveFromPath.roi_name
-                        newFunctionType = objectiveFromPath.function_type
-                        newWeight       = objectiveFromPath.weight
-                        if newRoiName == config.KEYNAME_BODY: continue
-                        functionMatchBool = newFunctionType == objectiveFType
-                        if  keyPlanFinalTerm in planName or keyPlanFinalAutoTerm in planName:
-                            functionMatchBool = True # i.e update all rois
-
-                        if functionMatchBool:
-                            if not checkIfRoiIgnore(planName, objectiveFType, newRoiName):
-                                if existingRoiName == newRoiName and existingFunctionType == newFunctionType:
-
-                                    # Step 4.1.1 - Update weight 
-                                    objectivesFromRS[rsIdx].DoseFunctionParameters.Weight = newWeight
-                                    print (f'  -- [updateObjectives()] \troi: {existingRoiName}, \tfType: {existingFunctionType}, \tweight: {existingWeight} --> {newWeight}')
-
-                                    # Step 4.1.2 - Update dose level(s)
-                                    if existingFunctionType == config.KEY_FTYPE_MAXEUD:
-                                        existingDoseLevel = objectivesFromRS[rsIdx].DoseFunctionParameters.DoseLevel
-                                        existingEudParameterA = objectivesFromRS[rsIdx].DoseFunctionParameters.EudParameterA
-                                        objectivesFromRS[rsIdx].DoseFunctionParameters.DoseLevel     = objectiveFromPath.doselevel
-                                        objectivesFromRS[rsIdx].DoseFunctionParameters.EudParameterA = objectiveFromPath.eud_parameter_a
-                                        print (f' --- [updateObjectives()] \tDoseLevel: {existingDoseLevel} --> {objectiveFromPath.doselevel}')
-                                        print (f' --- [updateObjectives()] \tEudParameterA: {existingEudParameterA} --> {objectiveFromPath.eud_parameter_a}')
-                                    elif existingFunctionType == config.KEY_FTYPE_DOSEFALLOFF:
-                                        if keyPlanDFO2Term in planName or keyPlanDFO2AutoTerm in planName: # [Ref: https://iprova.lumc.nl/Portal/#/document/1fc74366-40c1-4b84-a653-0455b6c891f8 (Vervolgens voor beide opties)]
-                                            print (f' --- [updateObjectives()] \tHighDoseLevel: {objectiveFromRS.DoseFunctionParameters.HighDoseLevel} --> {objectiveFromPath.high_doselevel}')
-                                            print (f' --- [updateObjectives()] \tLowDoseLevel : {objectiveFromRS.DoseFunctionParameters.LowDoseLevel}  --> {objectiveFromPath.low_doselevel}')
-                                            objectivesFromRS[rsIdx].DoseFunctionParameters.HighDoseLevel = objectiveFromPath.high_doselevel
-                                            objectivesFromRS[rsIdx].DoseFunctionParameters.LowDoseLevel  = objectiveFromPath.low_doselevel
-                                
-                                key = f'{newRoiName}-{newFunctionType}'
-                                updatedFromPathObjectivesStatus[key]['updated'] = True
-                except:
-                    traceback.print_exc()
-                    if DEBUG_PDB: pdb.set_trace()
-
-            # Step 4.2 - Add new objectives (if 1) they dont exist, and if they match 2) function-type and 3) roiName conditions)
-            print ('')
-            for key in updatedFromPathObjectivesStatus:
-                if updatedFromPathObjectivesStatus[key]['exists'] is False:
-                    roiName = key.split('-')[0]
-                    fType   = key.split('-')[1]
-                    
-                    fTypeCondition     = fType == objectiveFType # only if ftType in [DoseFallOff, MaxEUD]
-                    roiIgnoreCondition = checkIfRoiIgnore(planName, objectiveFType, roiName) # this roiName comes from existing objectives of RS
-                    if objectiveFType == None: # since this is the last plan, we want to add all (non-existent) objectives
-                        fTypeCondition = True
-
-                    if fTypeCondition and not roiIgnoreCondition:
-                        print (f' - [updateKNOObjectivesinRStation()] Adding new objective for {roiName} of type {fType}')
-                        newObjective = objectivesFromPath[updatedFromPathObjectivesStatus[key]['idx']]
-                        print (f' --- [updateKNOObjectivesinRStation()] newObjective for roi: {newObjective.roi_name} and fType: {newObjective.function_type} with weight: {newObjective.weight}')
-                        if newObjective.weight > 0:
-                            newObjective.apply()
+
+            def skipRS(rsIdx, existingRoiName):
+                if existingRoiName == config.KEYNAME_BODY: return True
+                if existingRoiName == config.KEYNAME_RING_LT_PTV_DL1 and objectiveFType is not None:
+                    return updateObjectiveRingPTVDL1(planName, objectivesFromRS, rsIdx)
+                return False
+
+            objectiveDiff = helpers.getObjectiveDiff(objectivesFromRS, objectivesFromPath, objectiveFType
+                                , roiIgnoreFunc=lambda roiName: checkIfRoiIgnore(planName, objectiveFType, roiName)
+                                , updateAllFunctions=keyPlanFinalTerm in planName or keyPlanFinalAutoTerm in planName # i.e update all rois
+                                , updateDoseFallOffLevels=keyPlanDFO2Term in planName or keyPlanDFO2AutoTerm in planName # [Ref: https://iprova.lumc.nl/Portal/#/document/1fc74366-40c1-4b84-a653-0455b6c891f8 (Vervolgens voor beide opties)]
+                                , skipPathFunc=lambda objectiveFromPath: objectiveFromPath.roi_name == config.KEYNAME_BODY
+                                , skipRSFunc=skipRS)
+
+            # Step 3 - Update existing objectives and add new ones (if 1) they dont exist, and if they match 2) function-type and 3) roiName conditions)
+            helpers.applyObjectiveDiff(objectiveDiff, objectivesFromRS, objectivesFromPath)
+            helpers.saveObjectiveDiff(pathPatient, planName, objectiveDiff)
         
         else:
             print (f' - [updateKNOObjectivesinRStation()] No objectives found in RS for plan {planName}')
@@ -404,99 +241,55 @@ def airOverride(setMaterial=True):
 #                          NTCP                        #
 ########################################################
 
-def getNTCPVals(patientID, plans, pathPatient):
+def getNTCPPlanResult(planValues):
+    """
+    Photon NTCP result of a plan (-1 for endpoints that could not be calculated)
+    """
+
+    res = {}
+    for endpoint, keyName in [(helpers.NtcpKnoVectorized.ENDPOINT_XEROSTOMIA_GRADE_2, config.KEY_XERO_GRADE2), (helpers.NtcpKnoVectorized.ENDPOINT_XEROSTOMIA_GRADE_3, config.KEY_XERO_GRADE3)
+                              , (helpers.NtcpKnoVectorized.ENDPOINT_DYSPHAGIA_GRADE_2, config.KEY_DYS_GRADE2), (helpers.NtcpKnoVectorized.ENDPOINT_DYSPHAGIA_GRADE_3, config.KEY_DYS_GRADE3)]:
+        try:
+            values = planValues.get(endpoint, None)
+            if values is not None and values[config.KEY_NTCP_PLAN_1] is not None:
+                res[keyName] = round(values[config.KEY_NTCP_PLAN_1][config.KEY_NTCP_PLAN_VALUE], 5)
+            else:
+                res[keyName] = -1
+        except:
+            res[keyName] = -1
+    
+    return res
+
+def getNTCPVals(patientID, plans, pathPatient, pathRegistry=None):
+    """
+    Returns
+    -------
+    status: bool, True if the NTCP values of the plans were calculated and saved
+    """
 
+    status = False
     try:
         
         print (f' - [getNTCPVals()] Getting NTCP values for patient: {patientID}')
         
-        # Step 1 - Other params
-        params = {
-            config.KEY_NTCP_PLAN1  : None
-            , config.KEY_NTCP_PLAN2: None
-            , config.KEY_NTCP_TREATMENT_TYPE     : helpers.TreatmentType.PRIMARY
-            , config.KEY_NTCP_TUMOR_LOCATION     : helpers.NtcpKnoDysphagia.TumorLocationType.PHARYNX # NtcpKnoDysphagia.TumorLocationType.{ORAL_CAVITY, PHARYNX, LARYNX}
-            , config.KEY_NTCP_BASELINE_XEROSTOMIA: helpers.NtcpKnoXerostomia.BaselineType.NONE # NtcpKnoXerostomia.BaselineType.{NONE, LITTLE, SEVERE}
-            , config.KEY_NTCP_BASELINE_DYSPHAGIA : helpers.NtcpKnoDysphagia.BaselineType.GRADE_0_1 # NtcpKnoDysphagia.BaselineType.{GRADE_0_1, GRADE_2, GRADE_3_4}
-            , config.KEY_NTCP_IS_TOTAL_LARYNGECTOMY: False
-            , config.KEY_PAROTIDS_REMOVED          : False
-        }
+        # Step 1 - Other params (see patientRegistry.py, photon plans are always evaluated as a pharynx tumor, as before the registry)
+        patientInfo = patientRegistry.getPatientInfo(patientID, pathRegistry)
+        params = helpers.getNTCPParams(patientInfo, forceTumorLocation=helpers.NtcpKnoDysphagia.TumorLocationType.PHARYNX)
 
-        # Step 2 - main
+        # Step 2 - main (ROI bindings are resolved once for all plans, results are saved after every plan)
         res = {}
+        pathPatientNTCP = Path(pathPatient) / config.FILENAME_NTCP_PHOTON_RESULTS
         if params[config.KEY_NTCP_TUMOR_LOCATION] is not None:
-            for plan in plans:
-
-                # Step 2.1 - Init
-                params[config.KEY_NTCP_PLAN1] = plan
-                res[plan] = {}
-
-                initStatus = False
-                try:
-                    objNTCP = helpers.KNONTCP(params)
-                    initStatus = True
-                except:
-                    traceback.print_exc()
-                    res[plan] = {
-                        config.KEY_XERO_GRADE2: -1
-                        , config.KEY_XERO_GRADE3: -1
-                        , config.KEY_DYS_GRADE2 : -1
-                        , config.KEY_DYS_GRADE3 : -1
-                    }
-
-                # Step 2.2 - Calculate
-                if initStatus:
-                    try:
-                        tmpX2 = objNTCP.ntcp_xerostomia_grade_2_values
-                        if tmpX2 is not None:
-                            if tmpX2[config.KEY_NTCP_PLAN_1] is not None:
-                                res[plan][config.KEY_XERO_GRADE2] = round(tmpX2[config.KEY_NTCP_PLAN_1][config.KEY_NTCP_PLAN_VALUE], 5)
-                            else:
-                                res[plan][config.KEY_XERO_GRADE2] = -1    
-                        else:
-                            res[plan][config.KEY_XERO_GRADE2] = -1
-                    except:
-                        res[plan][config.KEY_XERO_GRADE2] = -1 
-
-                    try:
-                        tmpX3 = objNTCP.ntcp_xerostomia_grade_3_values
-                        if tmpX3 is not None:
-                            if tmpX3[config.KEY_NTCP_PLAN_1] is not None:
-                                res[plan][config.KEY_XERO_GRADE3] = round(tmpX3[config.KEY_NTCP_PLAN_1][config.KEY_NTCP_PLAN_VALUE], 5)
-                            else:
-                                res[plan][config.KEY_XERO_GRADE3] = -1    
-                        else:
-                            res[plan][config.KEY_XERO_GRADE3] = -1
-                    except:
-                        res[plan][config.KEY_XERO_GRADE3] = -1
-                    
-                    try:
-                        tmpD2 = objNTCP.ntcp_dysphagia_grade_2_values
-                        if tmpD2 is not None:
-                            if tmpD2[config.KEY_NTCP_PLAN_1] is not None:
-                                res[plan][config.KEY_DYS_GRADE2] = round(tmpD2[config.KEY_NTCP_PLAN_1][config.KEY_NTCP_PLAN_VALUE], 5)
-                            else:
-                                res[plan][config.KEY_DYS_GRADE2] = -1                    
-                        else:
-                            res[plan][config.KEY_DYS_GRADE2] = -1
-                    except:
-                        res[plan][config.KEY_DYS_GRADE2] = -1
-
-                    try:
-                        tmpD3 = objNTCP.ntcp_dysphagia_grade_3_values
-                        if tmpD3 is not None:
-                            if tmpD3[config.KEY_NTCP_PLAN_1] is not None:
-                                res[plan][config.KEY_DYS_GRADE3] = round(tmpD3[config.KEY_NTCP_PLAN_1][config.KEY_NTCP_PLAN_VALUE], 5)
-                            else:
-                                res[plan][config.KEY_DYS_GRADE3] = -1
-                        else:
-                            res[plan][config.KEY_DYS_GRADE3] = -1
-                    except:
-                        res[plan][config.KEY_DYS_GRADE3] = -1
+            try:
+                objNTCP = helpers.KNONTCPMultiPlan(params, plans)
+                res = objNTCP.evaluate(pathPatientNTCP, get_plan_result=getNTCPPlanResult)
+                status = True
+            except:
+                traceback.print_exc()
+                res = {plan: getNTCPPlanResult({}) for plan in plans}
                 
         # Step 3 - Save
         # print (f' - [getNTCPVals()] res: {res}')
-        pathPatientNTCP = Path(pathPatient) / config.FILENAME_NTCP_PHOTON_RESULTS
         with open(str(pathPatientNTCP), 'w', encoding='utf-8') as fp:
             json.dump(res, fp, indent=4)
         
@@ -505,6 +298,9 @@ def getNTCPVals(patientID, plans, pathPatient):
     except:
         traceback.print_exc()
         if DEBUG_PDB: pdb.set_trace()
+        status = False
+    
+    return status
 
 ########################################################
 #                    AUTO-HELPERS                      #
@@ -517,7 +313,7 @@ def doAutoContouring():
         
         # Step 0 - Init
         print (f' \n\n ===================== start autocontouring ===================== \n\n')
-        patient = helpers.rayStationSave()
+        patient = helpers.rayStationSave(dirty=False)
         case    = patient.Cases[0]
 
         # Step 1.1 - Get OARs to include    
@@ -530,10 +326,11 @@ def doAutoContouring():
                 
         # Step 1.2 - Run OAR segmentation
         if len(oarsToInclude):
-            _ = helpers.rayStationSave()
+            _ = helpers.rayStationSave(commit=True, dirty=False)
             case.SetCurrent() # Why == Potential Error: "The case to which the examination belongs mist be selected"
             examination = case.Examinations[0]
             _ = examination.RunOarSegmentation(ModelName="RSL Head and Neck CT", ExaminationsAndRegistrations={ 'CT 1': None }, RoisToInclude=oarsToInclude)
+            helpers.resetCaseNameIndex(case)
             helpers.rayStationSave()
         else:
             print (' - [doAutoContouring()] No OARs to auto-contour')
@@ -547,18 +344,21 @@ def doAutoContouring():
                 if oar == config.KEYNAME_CAVITY_ORAL:
                     newName                                            = config.KEYNAME_ORAL_CAVITY + config.KEY_AUTOCONTOUR_SUFFIX
                     case.PatientModel.RegionsOfInterest[oar].Name      = newName
+                    helpers.getCaseNameIndex(case).renameRoi(oar, newName)
                     case.PatientModel.RegionsOfInterest[newName].Color = config.OAR_DUPLICATE_COLOR_RGB_STRING 
                     print (' - [doAutoContouring()] Renamed OAR: ', oar, ' --> ', newName)
                 elif oar == config.KEYNAME_ESOPHAGUS_S:
                     try:
                         newName                                            = config.KEYNAME_ESOPHAGUS + config.KEY_AUTOCONTOUR_SUFFIX
                         case.PatientModel.RegionsOfInterest[oar].Name      = newName
+                        helpers.getCaseNameIndex(case).renameRoi(oar, newName)
                         case.PatientModel.RegionsOfInterest[newName].Color = config.OAR_DUPLICATE_COLOR_RGB_STRING 
                         print (' - [doAutoContouring()] Renamed OAR: ', oar, ' --> ', newName)
                     except:
                         traceback.print_exc()
                 else:
                     case.PatientModel.RegionsOfInterest[oar].Name = oar + config.KEY_AUTOCONTOUR_SUFFIX
+                    helpers.getCaseNameIndex(case).renameRoi(oar, oar + config.KEY_AUTOCONTOUR_SUFFIX)
 
         # Step 1.4 - Do ROI Algebra
         helpers.doROIAlgebraForAutoContours(case)
@@ -598,7 +398,7 @@ def uploadRTAppsDataToRStation(pathPatient, planName, forceUpload=False, forceCu
     
     # Step 0 - Init
     assert forceUpload + forceCurrentPatient < 2, ' - [uploadRTAppsDataToRStation] forceUpload and forceCurrentPatient cannot be both True!'
-    helpers.rayStationSave()
+    helpers.rayStationSave(commit=True, dirty=False)
     db = connect.get_current(config.KEYNAME_RS_PATIENTDB)
     patientCTBool, patientRTStructBool, patientRTPlanBool, patientRTDoseBool = False, False, False, False
     
@@ -630,6 +430,7 @@ def uploadRTAppsDataToRStation(pathPatient, planName, forceUpload=False, forceCu
                             patientID, studyUID, seriesUID = helpers.updateCTDicoms(pathPatientCTFolder)
                             print ('\n - [uploadRTAppsDataToRStation()] --------------------- Step 1.1: Uploading CT data for {} ... \n\n'.format(patientID))
                             warnings = db.ImportPatientFromPath(Path=str(pathPatientCTFolder), SeriesOrInstances=[{'PatientID': patientID, 'StudyInstanceUID': str(studyUID), 'SeriesInstanceUID': str(seriesUID)}], ImportFilter='', BrachyPlanImportOverrides={})
+                            helpers.resetCaseNameIndex()
                             patient = helpers.rayStationSave()
                             # patient.Cases[0].SetCurrent()
                             print ('\n - [uploadRTAppsDataToRStation()] --------------------- Step 1.1: Uploaded CT data for {} \n\n'.format(helpers.getPatientIdentifier(patient)))
@@ -650,7 +451,7 @@ def uploadRTAppsDataToRStation(pathPatient, planName, forceUpload=False, forceCu
             print ('\n ---------------------------------------------------------- ')
 
             # Step 1.2 - Upload (existing) RTStruct/RTPLAN/RTDOSE
-            patient = helpers.rayStationSave()
+            patient = helpers.rayStationSave(commit=True, dirty=False)
             if patient is not None and patientCTBool:
                 case      = patient.Cases[0]
                 casename  = case.CaseName
@@ -665,6 +466,7 @@ def uploadRTAppsDataToRStation(pathPatient, planName, forceUpload=False, forceCu
                             studyUIDRTStruct, seriesUIDRTStruct = helpers.updateRTStructDicoms(pathPatientRTStructFile)
                             print ('\n\n [uploadRTAppsDataToRStation()][Patient={}] --------------------- Step 1.2: Uploading RTStruct data ... \n\n'.format(helpers.getPatientIdentifier(patient)))
                             warningsRTStruct  = patient.ImportDataFromPath(Path=str(pathPatientRTStructFolder), CaseName=casename, SeriesOrInstances=[{'PatientID': patientID, 'StudyInstanceUID': str(studyUIDRTStruct), 'SeriesInstanceUID': str(seriesUIDRTStruct)}], ImportFilter='', BrachyPlanImportOverrides={}, AllowMismatchingPatientID=True)
+                            helpers.resetCaseNameIndex(case)
                             print ('\n\n [uploadRTAppsDataToRStation()][Patient={}] --------------------- Step 1.2: Uploaded RTStruct data \n\n'.format(helpers.getPatientIdentifier(patient)))
                             patientRTStructBool = True
                             helpers.rayStationSave()
@@ -699,6 +501,7 @@ def uploadRTAppsDataToRStation(pathPatient, planName, forceUpload=False, forceCu
                             {'PatientID': patientID, 'StudyInstanceUID': str(studyUIDRTPlan), 'SeriesInstanceUID': str(seriesUIDRTPlan)}    
                             , {'PatientID': patientID, 'StudyInstanceUID': str(studyUIDRTDose), 'SeriesInstanceUID': str(seriesUIDRTDose)}
                             ], ImportFilter='', BrachyPlanImportOverrides={}, AllowMismatchingPatientID=True)
+                        helpers.resetCaseNameIndex(case)
                         shutil.rmtree(pathTempRTDoseAndRTPlanFolder)
                         patientRTPlanBool = True
                         patientRTDoseBool = True
@@ -732,13 +535,33 @@ def uploadRTAppsDataToRStation(pathPatient, planName, forceUpload=False, forceCu
 def copyPlanAndOptimize(basePlanName, newPlanName
                         , pathKNOObjectives, uploadObjectivesBool, updateObjectivesBool, forceObjectives, objectiveFType
                         , optSteps, optReset, pathIsoDoseXML=None
-                        , debug=False):
+                        , debug=False, pathPatient=None, warmStartPlanName=None):
+    """
+    pathPatient: Path, if given, the stage is recorded in (and resumed from) config.FILENAME_STAGE_LEDGER in this folder
+    warmStartPlanName: String, if given (and its contours are near-identical, see helpers.getWarmStartBasePlan()), the plan is copied from this one and not reset
+    """
 
     t0 = time.time()
     optimizeValue = -1
     timeTaken = -1
+    inputsHash = None
     try:
 
+        # Step 0 - Warm-start from another plan (e.g. clinical class-solution for the auto-contour chain)
+        basePlanName, warmStartBool = helpers.getWarmStartBasePlan(pathPatient, basePlanName, warmStartPlanName, newPlanName, config.PHOTON_POTENTIAL_ROIS_TO_RENAME_FOR_AUTO)
+        if warmStartBool:
+            optReset, forceObjectives = False, True # keep segments/spots, but replace objectives
+
+        # Step 0 - Check if this stage was already done in a previous (crashed/interrupted) run
+        stageParams = {'uploadObjectivesBool': uploadObjectivesBool, 'updateObjectivesBool': updateObjectivesBool, 'forceObjectives': forceObjectives
+                       , 'objectiveFType': objectiveFType, 'optSteps': optSteps, 'optReset': optReset}
+        if warmStartPlanName is not None:
+            stageParams['warmStart'] = warmStartBool
+        inputsHash, stageEntry = helpers.resumeStage(pathPatient, basePlanName, newPlanName, pathKNOObjectives, stageParams)
+        if stageEntry is not None:
+            return True, stageEntry[config.KEYNAME_OBJ_VALUE], stageEntry[config.KEYNAME_TIME]
+        helpers.updateStageLedger(pathPatient, newPlanName, inputsHash, config.KEYNAME_STAGE_RUNNING)
+
         # Step 0 - for console printing (while debugging across multiple consoles)
         patient, _, _, _  = helpers.getPatientAndPlan(basePlanName)
         sys.stdout.write(f' \n\n ===================== [{patient.Name}] start for {newPlanName} ===================== \n')
@@ -751,24 +574,27 @@ def copyPlanAndOptimize(basePlanName, newPlanName
         keyPlanCSTerm     = config.SUFFIX_PLAN_CS.format(config.PREFIX_CLINICAL_CONTOURS)
         keyPlanCSAutoTerm = config.SUFFIX_PLAN_CS.format(config.PREFIX_AUTOMATED_CONTOURS)
         createArcBeam     = False
-        if keyPlanCSTerm in newPlanName or keyPlanCSAutoTerm in newPlanName:
+        if (keyPlanCSTerm in newPlanName or keyPlanCSAutoTerm in newPlanName) and not warmStartBool:
             createArcBeam = True
         print (f' - [copyPlanAndOptimize()][{newPlanName}] createArcBeam: {createArcBeam}')
         copyPlanStatus = helpers.copyPlan(basePlanName, newPlanName, createArcBeam=createArcBeam, debug=debug)
         if not copyPlanStatus:
+            helpers.updateStageLedger(pathPatient, newPlanName, inputsHash, config.KEYNAME_STAGE_FAILED)
             return False, optimizeValue, timeTaken
         
         # Step 2 - Upload/update objectives
-        objectiveStatus = uploadORUpdateObjectives(newPlanName, pathKNOObjectives, uploadObjectivesBool, updateObjectivesBool, forceObjectives, objectiveFType)
+        objectiveStatus = uploadORUpdateObjectives(newPlanName, pathKNOObjectives, uploadObjectivesBool, updateObjectivesBool, forceObjectives, objectiveFType, pathPatient=pathPatient)
         if not objectiveStatus:
+            helpers.updateStageLedger(pathPatient, newPlanName, inputsHash, config.KEYNAME_STAGE_FAILED)
             return False, optimizeValue, timeTaken
         
         # Step 3 - Optimize
-        optimizeStatus, optimizeValue = optimizePlan(newPlanName, optSteps, reset=optReset, pathIsoDoseXML=pathIsoDoseXML)
+        optimizeStatus, optimizeValue = helpers.optimizePlan(newPlanName, optSteps, reset=optReset, pathIsoDoseXML=pathIsoDoseXML)
         if optimizeStatus:
-            _ = helpers.rayStationSave()
+            _ = helpers.rayStationSave(commit=True)
         
         timeTaken = round(time.time() - t0, 2)
+        helpers.updateStageLedger(pathPatient, newPlanName, inputsHash, config.KEYNAME_STAGE_DONE if optimizeStatus else config.KEYNAME_STAGE_FAILED, optimizeValue, timeTaken, objTrajectory=helpers.getOptimizationTrajectory(newPlanName))
         print (f' \n\n ===================== end for {newPlanName} (in {timeTaken} s) ===================== \n\n')
         return optimizeStatus, optimizeValue, timeTaken
     
@@ -777,8 +603,87 @@ def copyPlanAndOptimize(basePlanName, newPlanName
         if DEBUG_PDB: pdb.set_trace()
 
     timeTaken = round(time.time() - t0, 2)
+    helpers.updateStageLedger(pathPatient, newPlanName, inputsHash, config.KEYNAME_STAGE_FAILED, optimizeValue, timeTaken)
     return False, optimizeValue, timeTaken
 
+# Func 3
+def getPlanChainStages(planNameOG, planNamesChain, pathKNOObjectivesClassSolution, pathKNOObjectives, optStepsRe, pathIsoDoseXML, pathPatient, deps, warmStartPlanName=None):
+    """
+    Params
+    ------
+    planNamesChain: List, plan names for the [class-solution, DFO, DFO2, EUD, final] stages (e.g. -R1, -R2, -R3, -R4, -R5)
+    deps: List, stage names that the class-solution stage depends on (e.g. upload, auto-contouring)
+    warmStartPlanName: String, (optional) plan the class-solution stage may warm-start from (e.g. the clinical class-solution plan), see helpers.getWarmStartBasePlan()
+
+    Returns
+    -------
+    stages: Dict, {planName: helpers.getStage(...)}
+    """
+
+    # Step 1 - [pathObjectives, uploadObjectivesBool, updateObjectivesBool, objectiveFType, optReset] for each stage
+    chainParams = [
+        [pathKNOObjectivesClassSolution, True, False, None, True]
+        , [pathKNOObjectives, False, True, config.KEY_FTYPE_DOSEFALLOFF, False]
+        , [pathKNOObjectives, False, True, config.KEY_FTYPE_DOSEFALLOFF, False]
+        , [pathKNOObjectives, False, True, config.KEY_FTYPE_MAXEUD, False]
+        , [pathKNOObjectives, False, True, None, False]
+    ]
+
+    # Step 2 - Make stages
+    def getStageFunc(basePlanName, newPlanName, pathObjectives, uploadObjectivesBool, updateObjectivesBool, objectiveFType, optReset, stageWarmStartPlanName):
+        def stageFunc(stageResults):
+            planStatus, planValue, planTime = copyPlanAndOptimize(basePlanName, newPlanName
+                                                , pathObjectives, uploadObjectivesBool=uploadObjectivesBool, updateObjectivesBool=updateObjectivesBool, forceObjectives=False, objectiveFType=objectiveFType
+                                                , optSteps=optStepsRe, optReset=optReset, pathIsoDoseXML=pathIsoDoseXML, debug=False, pathPatient=pathPatient, warmStartPlanName=stageWarmStartPlanName)
+            print (f' - [main] {newPlanName} status: ', planStatus)
+            return planStatus, (planValue, planTime)
+        return stageFunc
+
+    stages = {}
+    basePlanName, baseDeps, stageWarmStartPlanName = planNameOG, deps, warmStartPlanName
+    for newPlanName, stageParams in zip(planNamesChain, chainParams):
+        stageAfter = [stageWarmStartPlanName] if stageWarmStartPlanName is not None else []
+        stages[newPlanName] = helpers.getStage(getStageFunc(basePlanName, newPlanName, *stageParams, stageWarmStartPlanName), deps=baseDeps, after=stageAfter)
+        basePlanName, baseDeps, stageWarmStartPlanName = newPlanName, [newPlanName], None # only the class-solution stage can warm-start
+    
+    return stages
+
+# Func 4
+def getEvalStages(stageName, pathDVHParams, planNames, pathPatient, contourType, deps=[], after=[]):
+    """
+    Objective values and times of plans made in this run are taken from the results of their stages (else -1)
+
+    Returns
+    -------
+    stages: Dict, {stageName: RStation dose queries, config.KEYNAME_STAGE_REPORT.format(stageName): save/print (usesRS=False)}
+    """
+
+    def stageFunc(stageResults):
+        planValues = {planName: stageResults[planName][0] if stageResults.get(planName, None) is not None else -1 for planName in planNames}
+        planTimes  = {planName: stageResults[planName][1] if stageResults.get(planName, None) is not None else -1 for planName in planNames}
+        planExtras = {}
+        if stageResults.get(config.KEYNAME_STAGE_AUTOCONTOUR, None) is not None:
+            planExtras[config.KEYNAME_AUTOCONTOURING_TIME] = stageResults[config.KEYNAME_STAGE_AUTOCONTOUR]
+        res = helpers.evaluatePlans(pathDVHParams
+                    , planNames=planNames
+                    , planTimes=planTimes
+                    , planValues=planValues
+                    , planExtras=planExtras
+                    , pathPatient=pathPatient
+                    , contourType=contourType
+                    , report=False)
+        planNamesMade = [planName for planName in planNames if planName in stageResults] # plans made in this run need to have results
+        return len(res) > 0, (res, planNamesMade)
+    
+    def reportStageFunc(stageResults):
+        res, planNamesMade = stageResults[stageName]
+        return helpers.reportEvaluatedPlans(res, pathPatient, contourType=contourType, requiredPlanNames=planNamesMade), None
+
+    return {
+        stageName: helpers.getStage(stageFunc, deps=deps, after=after)
+        , config.KEYNAME_STAGE_REPORT.format(stageName): helpers.getStage(reportStageFunc, deps=[stageName], usesRS=False)
+    }
+
 # Func 0
 def main(params):
 
@@ -836,426 +741,79 @@ def main(params):
             except:
                 traceback.print_exc()
 
-        ############## Step 2 - Upload data to RayStation
+        ############## Step 2 - Declare stages
         try:
 
             tTotal = time.time()
+            patientID    = Path(pathPatient).parts[-2]
+            plansForNTCP = [planNameOG, planNameFinal, planNameFinalAuto]
+            planNamesClinical = [planNameCS, planNameDFO, planNameDFO2, planNameEUD, planNameFinal]
+            planNamesAuto     = [planNameCSAuto, planNameDFOAuto, planNameDFO2Auto, planNameEUDAuto, planNameFinalAuto]
+            planNamesAll      = [planNameOG, planNameCS, planNameCSAuto, planNameFinal, planNameFinalAuto]
 
-            if contourTypeNow in [config.KEYNAME_CONTOUR_CLINICAL, config.KEYNAME_CONTOUR_AUTO]:
-                uploadRTAppsStatus = uploadRTAppsDataToRStation(pathPatient, planName=planNameOG, forceUpload=forceUploadPatient, forceCurrentPatient=forceCurrentPatient)
-                print ('\n - [main] uploadRTAppsStatus: ', uploadRTAppsStatus)
-                if contourTypeNow == config.KEYNAME_CONTOUR_CLINICAL:    
-                    print ('\n\n ------------------------- ')
-                    print ('  - Computing dose on clinical contours')
-                    print (' ------------------------- \n\n')
-                    if uploadRTAppsStatus:
-                        classSolPlanStatus, classSolPlanValue, classSolPlanTime = copyPlanAndOptimize(planNameOG, planNameCS
-                                                    , pathKNOObjectivesClassSolution, uploadObjectivesBool=True, updateObjectivesBool=False, forceObjectives=False, objectiveFType=None
-                                                    , optSteps=optStepsRe, optReset=True, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                        print (' - [main] classSolPlanStatus: ', classSolPlanStatus)
-                        if classSolPlanStatus:
-                            dfoPlanStatus, dfoPlanValue, dfoPlanTime = copyPlanAndOptimize(planNameCS, planNameDFO
-                                                    , pathKNOObjectives, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_DOSEFALLOFF
-                                                    , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                            print (' - [main] dfoPlanStatus: ', dfoPlanStatus)
-                            if dfoPlanStatus:
-                                dfo2PlanStatus, dfo2PlanValue, dfo2PlanTime = copyPlanAndOptimize(planNameDFO, planNameDFO2
-                                                        , pathKNOObjectives, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_DOSEFALLOFF
-                                                        , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                                print (' - [main] dfo2PlanStatus: ', dfo2PlanStatus)
-                                if dfo2PlanStatus:
-                                    eudPlanStatus, eudPlanValue, eudPlanTime = copyPlanAndOptimize(planNameDFO2, planNameEUD
-                                                        , pathKNOObjectives, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_MAXEUD
-                                                        , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                                    print (' - [main] eudPlanStatus: ', eudPlanStatus)
-                                    if eudPlanStatus:
-                                        finalPlanStatus, finalPlanValue, finalPlanTime = copyPlanAndOptimize(planNameEUD, planNameFinal
-                                                            , pathKNOObjectives, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=None
-                                                            , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                                        print (' - [main] finalPlanStatus: ', finalPlanStatus)
-                                        if finalPlanStatus:
-                                            res = helpers.evaluatePlans(pathDVHParams
-                                                        , planNames=[planNameOG, planNameCS, planNameDFO, planNameDFO2, planNameEUD, planNameFinal, planNameFinalAuto]
-                                                        , planTimes ={planNameOG:-1, planNameCS:classSolPlanTime, planNameDFO:dfoPlanTime, planNameDFO2:dfo2PlanTime, planNameEUD:eudPlanTime, planNameFinal:finalPlanTime, planNameFinalAuto:-1}
-                                                        , planValues={planNameOG:-1, planNameCS:classSolPlanValue, planNameDFO:dfoPlanValue, planNameDFO2:dfo2PlanValue, planNameEUD:eudPlanValue, planNameFinal:finalPlanValue, planNameFinalAuto:-1}
-                                                        , pathPatient=pathPatient
-                                                        , contourType=config.KEYNAME_CONTOUR_CLINICAL
-                                                        )
-
-                elif contourTypeNow == config.KEYNAME_CONTOUR_AUTO:
-                    print ('\n\n ------------------------- ')
-                    print ('  - Computing dose on auto contours')
-                    print (' ------------------------- \n\n')
-                    if uploadRTAppsStatus:
-                        autoContouringStatus, autoContouringTime = doAutoContouring()
-                        print ('\n - [main] autoContouringStatus: ', autoContouringStatus)
-                        if autoContouringStatus:
-                            classSolPlanStatusAuto, classSolPlanValueAuto, classSolPlanTimeAuto = copyPlanAndOptimize(planNameOG, planNameCSAuto
-                                                        , pathKNOObjectivesClassSolutionAuto, uploadObjectivesBool=True, updateObjectivesBool=False, forceObjectives=False, objectiveFType=None
-                                                        , optSteps=optStepsRe, optReset=True, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                            print (' - [main] classSolPlanStatusAuto: ', classSolPlanStatusAuto)
-                            if classSolPlanStatusAuto:
-                                dfoPlanStatusAuto, dfoPlanValueAuto, dfoPlanTimeAuto = copyPlanAndOptimize(planNameCSAuto, planNameDFOAuto
-                                                        , pathKNOObjectivesAuto, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_DOSEFALLOFF
-                                                        , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                                print (' - [main] dfoPlanStatusAuto: ', dfoPlanStatusAuto)
-                                if dfoPlanStatusAuto:
-                                    dfo2PlanStatusAuto, dfo2PlanValueAuto, dfo2PlanTimeAuto = copyPlanAndOptimize(planNameDFOAuto, planNameDFO2Auto
-                                                            , pathKNOObjectivesAuto, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_DOSEFALLOFF
-                                                            , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                                    print (' - [main] dfo2PlanStatusAuto: ', dfo2PlanStatusAuto)
-                                    if dfo2PlanStatusAuto:
-                                        eudPlanStatusAuto, eudPlanValueAuto, eudPlanTimeAuto = copyPlanAndOptimize(planNameDFO2Auto, planNameEUDAuto
-                                                            , pathKNOObjectivesAuto, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_MAXEUD
-                                                            , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                                        print (' - [main] eudPlanStatusAuto: ', eudPlanStatusAuto)
-                                        if eudPlanStatusAuto:
-                                            finalPlanStatusAuto, finalPlanValueAuto, finalPlanTimeAuto = copyPlanAndOptimize(planNameEUDAuto, planNameFinalAuto
-                                                                , pathKNOObjectivesAuto, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=None
-                                                                , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                                            print (' - [main] finalPlanStatuAutos: ', finalPlanStatusAuto)
-                                            if finalPlanStatusAuto:
-                                                resAuto = helpers.evaluatePlans(pathDVHParams
-                                                            , planNames=[planNameOG, planNameCSAuto, planNameDFOAuto, planNameDFO2Auto, planNameEUDAuto, planNameFinalAuto, planNameFinal]
-                                                            , planTimes  = {planNameOG:-1, planNameCSAuto: classSolPlanTimeAuto , planNameDFOAuto: dfoPlanTimeAuto , planNameDFO2Auto:dfo2PlanTimeAuto , planNameEUDAuto: eudPlanTimeAuto , planNameFinalAuto: finalPlanTimeAuto , planNameFinal:-1}
-                                                            , planValues = {planNameOG:-1, planNameCSAuto: classSolPlanValueAuto, planNameDFOAuto: dfoPlanValueAuto, planNameDFO2Auto:dfo2PlanValueAuto, planNameEUDAuto: eudPlanValueAuto, planNameFinalAuto: finalPlanValueAuto, planNameFinal:-1}
-                                                            , planExtras = {config.KEYNAME_AUTOCONTOURING_TIME:autoContouringTime}
-                                                            , pathPatient=pathPatient
-                                                            , contourType=config.KEYNAME_CONTOUR_AUTO)
-                                                if DEBUG_PDB: pdb.set_trace()
-
-            elif contourTypeNow == config.KEYNAME_CONTOUR_ALL:
-                
+            def uploadStageFunc(stageResults):
                 uploadRTAppsStatus = uploadRTAppsDataToRStation(pathPatient, planName=planNameOG, forceUpload=forceUploadPatient, forceCurrentPatient=forceCurrentPatient)
                 print ('\n - [main] uploadRTAppsStatus: ', uploadRTAppsStatus)
+                return uploadRTAppsStatus, None
+            
+            def autoContouringStageFunc(stageResults):
+                autoContouringStatus, autoContouringTime = doAutoContouring()
+                print ('\n - [main] autoContouringStatus: ', autoContouringStatus)
+                return autoContouringStatus, autoContouringTime
+            
+            def ntcpStageFunc(stageResults):
+                ntcpStatus = getNTCPVals(patientID, plansForNTCP, pathPatient, pathRegistry=params.get(config.KEYNAME_PATH_PATIENT_REGISTRY, None))
+                return ntcpStatus, None
+
+            stageUpload      = helpers.getStage(uploadStageFunc)
+            stageAutoContour = helpers.getStage(autoContouringStageFunc, deps=[config.KEYNAME_STAGE_UPLOAD])
+            stagesClinical   = {}
+            stagesAuto       = {}
+            if contourTypeNow != config.KEYNAME_CONTOUR_EVAL:
+                stagesClinical = getPlanChainStages(planNameOG, planNamesClinical, pathKNOObjectivesClassSolution, pathKNOObjectives, optStepsRe, pathIsoDoseXML, pathPatient, deps=[config.KEYNAME_STAGE_UPLOAD])
+                stagesAuto     = getPlanChainStages(planNameOG, planNamesAuto, pathKNOObjectivesClassSolutionAuto, pathKNOObjectivesAuto, optStepsRe, pathIsoDoseXML, pathPatient, deps=[config.KEYNAME_STAGE_AUTOCONTOUR]
+                                                    , warmStartPlanName=planNameCS if params.get(config.KEYNAME_WARM_START, False) else None)
+
+            # Step 2.1 - Pick stages for the contour type
+            stages = {}
+            if contourTypeNow == config.KEYNAME_CONTOUR_CLINICAL:
+                stages[config.KEYNAME_STAGE_UPLOAD] = stageUpload
+                stages.update(stagesClinical)
+                stages.update(getEvalStages(config.KEYNAME_STAGE_EVAL_CLINICAL, pathDVHParams, [planNameOG] + planNamesClinical + [planNameFinalAuto], pathPatient, config.KEYNAME_CONTOUR_CLINICAL, deps=[planNameFinal]))
+
+            elif contourTypeNow == config.KEYNAME_CONTOUR_AUTO:
+                stages[config.KEYNAME_STAGE_UPLOAD]      = stageUpload
+                stages[config.KEYNAME_STAGE_AUTOCONTOUR] = stageAutoContour
+                stages.update(stagesAuto)
+                stages.update(getEvalStages(config.KEYNAME_STAGE_EVAL_AUTO, pathDVHParams, [planNameOG] + planNamesAuto + [planNameFinal], pathPatient, config.KEYNAME_CONTOUR_AUTO, deps=[planNameFinalAuto]))
+
+            elif contourTypeNow in [config.KEYNAME_CONTOUR_ALL, config.KEYNAME_CONTOUR_DEBUG]:
+                stages[config.KEYNAME_STAGE_UPLOAD] = stageUpload
+                stages.update(stagesClinical)
+                stages.update(getEvalStages(config.KEYNAME_STAGE_EVAL_CLINICAL, pathDVHParams, [planNameOG] + planNamesClinical, pathPatient, config.KEYNAME_CONTOUR_CLINICAL, deps=[planNameFinal]))
+                stages[config.KEYNAME_STAGE_AUTOCONTOUR] = stageAutoContour
+                stages.update(stagesAuto)
+                stages.update(getEvalStages(config.KEYNAME_STAGE_EVAL_AUTO, pathDVHParams, [planNameOG] + planNamesAuto, pathPatient, config.KEYNAME_CONTOUR_AUTO, deps=[planNameFinalAuto]))
+                stagesDone = [config.KEYNAME_STAGE_EVAL_CLINICAL, config.KEYNAME_STAGE_EVAL_AUTO] + planNamesClinical + planNamesAuto
+                stages.update(getEvalStages(config.KEYNAME_STAGE_EVAL_ALL, pathDVHParams, planNamesAll, pathPatient, config.KEYNAME_CONTOUR_ALL, deps=[config.KEYNAME_STAGE_UPLOAD], after=stagesDone))
+                stages[config.KEYNAME_STAGE_NTCP]     = helpers.getStage(ntcpStageFunc, deps=[config.KEYNAME_STAGE_UPLOAD], after=stagesDone)
+
+                # Step 2.2 - For debugging, only run the selected stages (deps outside of these are assumed to be present in RStation)
+                if contourTypeNow == config.KEYNAME_CONTOUR_DEBUG:
+                    debugStages = params.get(config.KEYNAME_DEBUG_STAGES, [])
+                    stages = {stageName: stages[stageName] for stageName in stages if stageName in debugStages or stageName in [config.KEYNAME_STAGE_REPORT.format(each) for each in debugStages]}
 
-                if 1:    
-                    print ('\n\n ------------------------- ')
-                    print ('  - Computing dose on clinical contours')
-                    print (' ------------------------- \n\n')
-                    if uploadRTAppsStatus:
-                        classSolPlanStatus, classSolPlanValue, classSolPlanTime = copyPlanAndOptimize(planNameOG, planNameCS
-                                                    , pathKNOObjectivesClassSolution, uploadObjectivesBool=True, updateObjectivesBool=False, forceObjectives=False, objectiveFType=None
-                                                    , optSteps=optStepsRe, optReset=True, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                        print (' - [main] classSolPlanStatus: ', classSolPlanStatus)
-                        if classSolPlanStatus:
-                            dfoPlanStatus, dfoPlanValue, dfoPlanTime = copyPlanAndOptimize(planNameCS, planNameDFO
-                                                    , pathKNOObjectives, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_DOSEFALLOFF
-                                                    , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                            print (' - [main] dfoPlanStatus: ', dfoPlanStatus)
-                            if dfoPlanStatus:
-                                dfo2PlanStatus, dfo2PlanValue, dfo2PlanTime = copyPlanAndOptimize(planNameDFO, planNameDFO2
-                                                        , pathKNOObjectives, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_DOSEFALLOFF
-                                                        , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                                print (' - [main] dfo2PlanStatus: ', dfo2PlanStatus)
-                                if dfo2PlanStatus:
-                                    eudPlanStatus, eudPlanValue, eudPlanTime = copyPlanAndOptimize(planNameDFO2, planNameEUD
-                                                        , pathKNOObjectives, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_MAXEUD
-                                                        , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                                    print (' - [main] eudPlanStatus: ', eudPlanStatus)
-                                    if eudPlanStatus:
-                                        finalPlanStatus, finalPlanValue, finalPlanTime = copyPlanAndOptimize(planNameEUD, planNameFinal
-                                                            , pathKNOObjectives, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=None
-                                                            , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                                        print (' - [main] finalPlanStatus: ', finalPlanStatus)
-                                        if finalPlanStatus:
-                                            res = helpers.evaluatePlans(pathDVHParams
-                                                        , planNames=[planNameOG, planNameCS, planNameDFO, planNameDFO2, planNameEUD, planNameFinal]
-                                                        , planTimes ={planNameOG:-1, planNameCS:classSolPlanTime, planNameDFO:dfoPlanTime, planNameDFO2:dfo2PlanTime, planNameEUD:eudPlanTime, planNameFinal:finalPlanTime}
-                                                        , planValues={planNameOG:-1, planNameCS:classSolPlanValue, planNameDFO:dfoPlanValue, planNameDFO2:dfo2PlanValue, planNameEUD:eudPlanValue, planNameFinal:finalPlanValue}
-                                                        , pathPatient=pathPatient
-                                                        , contourType=config.KEYNAME_CONTOUR_CLINICAL)
-                                            print ('\n - [main] Total time passed: ', round(time.time()-tTotal, 2), ' seconds')
-                
-                if 1:
-                    print ('\n\n ------------------------- ')
-                    print ('  - Computing dose on auto contours')
-                    print (' ------------------------- \n\n')
-                    if uploadRTAppsStatus:
-                        autoContouringStatus, autoContouringTime = doAutoContouring()
-                        print ('\n - [main] autoContouringStatus: ', autoContouringStatus)
-                        if autoContouringStatus:
-                            classSolPlanStatusAuto, classSolPlanValueAuto, classSolPlanTimeAuto = copyPlanAndOptimize(planNameOG, planNameCSAuto
-                                                        , pathKNOObjectivesClassSolutionAuto, uploadObjectivesBool=True, updateObjectivesBool=False, forceObjectives=False, objectiveFType=None
-                                                        , optSteps=optStepsRe, optReset=True, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                            print (' - [main] classSolPlanStatusAuto: ', classSolPlanStatusAuto)
-                            if classSolPlanStatusAuto:
-                                dfoPlanStatusAuto, dfoPlanValueAuto, dfoPlanTimeAuto = copyPlanAndOptimize(planNameCSAuto, planNameDFOAuto
-                                                        , pathKNOObjectivesAuto, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_DOSEFALLOFF
-                                                        , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                                print (' - [main] dfoPlanStatusAuto: ', dfoPlanStatusAuto)
-                                if dfoPlanStatusAuto:
-                                    dfo2PlanStatusAuto, dfo2PlanValueAuto, dfo2PlanTimeAuto = copyPlanAndOptimize(planNameDFOAuto, planNameDFO2Auto
-                                                            , pathKNOObjectivesAuto, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_DOSEFALLOFF
-                                                            , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                                    print (' - [main] dfo2PlanStatusAuto: ', dfo2PlanStatusAuto)
-                                    if dfo2PlanStatusAuto:
-                                        eudPlanStatusAuto, eudPlanValueAuto, eudPlanTimeAuto = copyPlanAndOptimize(planNameDFO2Auto, planNameEUDAuto
-                                                            , pathKNOObjectivesAuto, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_MAXEUD
-                                                            , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                                        print (' - [main] eudPlanStatusAuto: ', eudPlanStatusAuto)
-                                        if eudPlanStatusAuto:
-                                            finalPlanStatusAuto, finalPlanValueAuto, finalPlanTimeAuto = copyPlanAndOptimize(planNameEUDAuto, planNameFinalAuto
-                                                                , pathKNOObjectivesAuto, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=None
-                                                                , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                                            print (' - [main] finalPlanStatuAutos: ', finalPlanStatusAuto)
-                                            if finalPlanStatusAuto:
-                                                resAuto = helpers.evaluatePlans(pathDVHParams
-                                                            , planNames=[planNameOG, planNameCSAuto, planNameDFOAuto, planNameDFO2Auto, planNameEUDAuto, planNameFinalAuto]
-                                                            , planTimes  = {planNameOG:-1, planNameCSAuto: classSolPlanTimeAuto , planNameDFOAuto: dfoPlanTimeAuto , planNameDFO2Auto:dfo2PlanTimeAuto , planNameEUDAuto: eudPlanTimeAuto , planNameFinalAuto: finalPlanTimeAuto}
-                                                            , planValues = {planNameOG:-1, planNameCSAuto: classSolPlanValueAuto, planNameDFOAuto: dfoPlanValueAuto, planNameDFO2Auto:dfo2PlanValueAuto, planNameEUDAuto: eudPlanValueAuto, planNameFinalAuto: finalPlanValueAuto}
-                                                            , planExtras = {config.KEYNAME_AUTOCONTOURING_TIME:autoContouringTime}
-                                                            , pathPatient=pathPatient
-                                                            , contourType=config.KEYNAME_CONTOUR_AUTO)
-                                                print ('\n - [main] Total time passed: ', round(time.time()-tTotal, 2), ' seconds')
-
-                if 1:
-                    if uploadRTAppsStatus:
-                        print ('\n\n ------------------------- ')
-                        print ('  - Compare clinical stats ')
-                        print (' ------------------------- \n\n')
-                        res = helpers.evaluatePlans(pathDVHParams
-                                , planNames=[planNameOG, planNameCS, planNameCSAuto, planNameFinal, planNameFinalAuto]
-                                , pathPatient=pathPatient
-                                , contourType=config.KEYNAME_CONTOUR_ALL)
-
-                        print ('\n\n ------------------------- ')
-                        print ('  - NTCP Modeling ')
-                        print (' ------------------------- \n\n')
-                        patientID = Path(pathPatient).parts[-2]
-                        plansForNTCP = [planNameOG, planNameFinal, planNameFinalAuto]
-                        getNTCPVals(patientID, plansForNTCP, pathPatient)
-
-                        print ('\n - [main] Total time passed: ', round(time.time()-tTotal, 2), ' seconds')
-                        
             elif contourTypeNow == config.KEYNAME_CONTOUR_EVAL:
-                res = helpers.evaluatePlans(pathDVHParams
-                            , planNames=[planNameOG, planNameCS, planNameCSAuto, planNameFinal, planNameFinalAuto]
-                            , pathPatient=pathPatient
-                            , contourType=config.KEYNAME_CONTOUR_ALL)
-
-                print ('\n\n ------------------------- ')
-                print ('  - NTCP Modeling ')
-                print (' ------------------------- \n\n')
-                patientID = Path(pathPatient).parts[-2]
-                plansForNTCP = [planNameOG, planNameFinal, planNameFinalAuto]
-                getNTCPVals(patientID, plansForNTCP, pathPatient)
+                stages.update(getEvalStages(config.KEYNAME_STAGE_EVAL_ALL, pathDVHParams, planNamesAll, pathPatient, config.KEYNAME_CONTOUR_ALL))
+                stages[config.KEYNAME_STAGE_NTCP]     = helpers.getStage(ntcpStageFunc)
 
-                print ('\n - [main] Total time passed: ', round(time.time()-tTotal, 2), ' seconds')
-
-            elif contourTypeNow == config.KEYNAME_CONTOUR_DEBUG:
-                
-                # upload
-                if 0:
-                    uploadRTAppsStatus = uploadRTAppsDataToRStation(pathPatient, planName=planNameOG, forceUpload=forceUploadPatient, forceCurrentPatient=forceCurrentPatient)
-                    print ('\n - [main] uploadRTAppsStatus: ', uploadRTAppsStatus)
+            ############## Step 3 - Run stages
+            print (f' - [main] Running stages: {list(stages)}')
+            stageStatus, _ = helpers.runStageDAG(stages, maxWorkers=params.get(config.KEYNAME_MAX_WORKERS, 1))
+            print (f' - [main] Stage status: {stageStatus}')
+            print ('\n - [main] Total time passed: ', round(time.time()-tTotal, 2), ' seconds')
 
-                # for R2-R5 updates
-                if 0:
-                    try:
-                        dfoPlanStatus, dfoPlanValue, dfoPlanTime = copyPlanAndOptimize(planNameCS, planNameDFO
-                                                    , pathKNOObjectives, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_DOSEFALLOFF
-                                                    , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=True)
-                        print (' - [main] dfoPlanStatus: ', dfoPlanStatus)
-                        if dfoPlanStatus:
-                            dfo2PlanStatus, dfo2PlanValue, dfo2PlanTime = copyPlanAndOptimize(planNameDFO, planNameDFO2
-                                                    , pathKNOObjectives, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_DOSEFALLOFF
-                                                    , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                            print (' - [main] dfo2PlanStatus: ', dfo2PlanStatus)
-                            if dfo2PlanStatus:
-                                eudPlanStatus, eudPlanValue, eudPlanTime = copyPlanAndOptimize(planNameDFO2, planNameEUD
-                                                    , pathKNOObjectives, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_MAXEUD
-                                                    , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                                print (' - [main] eudPlanStatus: ', eudPlanStatus)
-                                if eudPlanStatus:
-                                    finalPlanStatus, finalPlanValue, finalPlanTime = copyPlanAndOptimize(planNameEUD, planNameFinal
-                                                        , pathKNOObjectives, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=None
-                                                        , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                                    print (' - [main] finalPlanStatus: ', finalPlanStatus)
-                                    if finalPlanStatus:
-                                        res = helpers.evaluatePlans(pathDVHParams
-                                                    , planNames=[planNameOG, planNameCS, planNameDFO, planNameDFO2, planNameEUD, planNameFinal, planNameFinalAuto]
-                                                    , planTimes ={planNameOG:-1, planNameDFO:dfoPlanTime, planNameDFO2:dfo2PlanTime, planNameEUD:eudPlanTime, planNameFinal:finalPlanTime}
-                                                    , planValues={planNameOG:-1, planNameDFO:dfoPlanValue, planNameDFO2:dfo2PlanValue, planNameEUD:eudPlanValue, planNameFinal:finalPlanValue}
-                                                    , pathPatient=pathPatient
-                                                    , contourType=config.KEYNAME_CONTOUR_CLINICAL
-                                                    , save=True
-                                                    )
-                                        print ('\n - [main] Total time passed: ', round(time.time()-tTotal, 2), ' seconds')
-                    except:
-                        traceback.print_exc()
-
-                # upload + auto-contouring
-                if 0:
-                    uploadRTAppsStatus = uploadRTAppsDataToRStation(pathPatient, planName=planNameOG, forceUpload=forceUploadPatient, forceCurrentPatient=forceCurrentPatient)
-                    print ('\n - [main] uploadRTAppsStatus: ', uploadRTAppsStatus)
-                    if uploadRTAppsStatus:
-                        autoContouringStatus, autoContouringTime = doAutoContouring()
-                        print ('\n - [main] autoContouringStatus: ', autoContouringStatus)
-
-                # for A1-A5 updates
-                if 0:
-                    autoContouringStatus, autoContouringTime = doAutoContouring()
-                    print ('\n - [main] autoContouringStatus: ', autoContouringStatus)
-                    if autoContouringStatus:
-                        classSolPlanStatusAuto, classSolPlanValueAuto, classSolPlanTimeAuto = copyPlanAndOptimize(planNameOG, planNameCSAuto
-                                                    , pathKNOObjectivesClassSolutionAuto, uploadObjectivesBool=True, updateObjectivesBool=False, forceObjectives=False, objectiveFType=None
-                                                    , optSteps=optStepsRe, optReset=True, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                        print (' - [main] classSolPlanStatusAuto: ', classSolPlanStatusAuto)
-                        if classSolPlanStatusAuto:
-                            dfoPlanStatusAuto, dfoPlanValueAuto, dfoPlanTimeAuto = copyPlanAndOptimize(planNameCSAuto, planNameDFOAuto
-                                                    , pathKNOObjectivesAuto, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_DOSEFALLOFF
-                                                    , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                            print (' - [main] dfoPlanStatusAuto: ', dfoPlanStatusAuto)
-                            if dfoPlanStatusAuto:
-                                dfo2PlanStatusAuto, dfo2PlanValueAuto, dfo2PlanTimeAuto = copyPlanAndOptimize(planNameDFOAuto, planNameDFO2Auto
-                                                        , pathKNOObjectivesAuto, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_DOSEFALLOFF
-                                                        , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                                print (' - [main] dfo2PlanStatusAuto: ', dfo2PlanStatusAuto)
-                                if dfo2PlanStatusAuto:
-                                    eudPlanStatusAuto, eudPlanValueAuto, eudPlanTimeAuto = copyPlanAndOptimize(planNameDFO2Auto, planNameEUDAuto
-                                                        , pathKNOObjectivesAuto, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_MAXEUD
-                                                        , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                                    print (' - [main] eudPlanStatusAuto: ', eudPlanStatusAuto)
-                                    if eudPlanStatusAuto:
-                                        finalPlanStatusAuto, finalPlanValueAuto, finalPlanTimeAuto = copyPlanAndOptimize(planNameEUDAuto, planNameFinalAuto
-                                                            , pathKNOObjectivesAuto, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=None
-                                                            , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                                        print (' - [main] finalPlanStatuAutos: ', finalPlanStatusAuto)
-                                        if finalPlanStatusAuto:
-                                            resAuto = helpers.evaluatePlans(pathDVHParams
-                                                        , planNames=[planNameOG, planNameCSAuto, planNameDFOAuto, planNameDFO2Auto, planNameEUDAuto, planNameFinalAuto, planNameFinal]
-                                                        , planTimes  = {planNameOG:-1, planNameCSAuto: classSolPlanTimeAuto , planNameDFOAuto: dfoPlanTimeAuto , planNameDFO2Auto:dfo2PlanTimeAuto , planNameEUDAuto: eudPlanTimeAuto , planNameFinalAuto: finalPlanTimeAuto , planNameFinal:-1}
-                                                        , planValues = {planNameOG:-1, planNameCSAuto: classSolPlanValueAuto, planNameDFOAuto: dfoPlanValueAuto, planNameDFO2Auto:dfo2PlanValueAuto, planNameEUDAuto: eudPlanValueAuto, planNameFinalAuto: finalPlanValueAuto, planNameFinal:-1}
-                                                        , planExtras = {config.KEYNAME_AUTOCONTOURING_TIME:autoContouringTime}
-                                                        , pathPatient=pathPatient
-                                                        , contourType=config.KEYNAME_CONTOUR_AUTO)
-                                            if DEBUG_PDB: pdb.set_trace()
-                
-                # For A2/A3/A4/A5 updates
-                if 0:
-                    try:
-                        dfoPlanStatusAuto, dfoPlanValueAuto, dfoPlanTimeAuto = copyPlanAndOptimize(planNameCSAuto, planNameDFOAuto
-                                                    , pathKNOObjectivesAuto, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_DOSEFALLOFF
-                                                    , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                        print (' - [main] dfoPlanStatusAuto: ', dfoPlanStatusAuto)
-                        if dfoPlanStatusAuto:
-                            dfo2PlanStatusAuto, dfo2PlanValueAuto, dfo2PlanTimeAuto = copyPlanAndOptimize(planNameDFOAuto, planNameDFO2Auto
-                                                    , pathKNOObjectivesAuto, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_DOSEFALLOFF
-                                                    , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                            print (' - [main] dfo2PlanStatusAuto: ', dfo2PlanStatusAuto)
-                            if dfo2PlanStatusAuto:
-                                eudPlanStatusAuto, eudPlanValueAuto, eudPlanTimeAuto = copyPlanAndOptimize(planNameDFO2Auto, planNameEUDAuto
-                                                    , pathKNOObjectivesAuto, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_MAXEUD
-                                                    , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                                print (' - [main] eudPlanStatusAuto: ', eudPlanStatusAuto)
-                                if eudPlanStatusAuto:
-                                    finalPlanStatusAuto, finalPlanValueAuto, finalPlanTimeAuto = copyPlanAndOptimize(planNameEUDAuto, planNameFinalAuto
-                                                        , pathKNOObjectivesAuto, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=None
-                                                        , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                                    print (' - [main] finalPlanStatuAutos: ', finalPlanStatusAuto)
-                                    if finalPlanStatusAuto:
-                                        print ('\n\n ------------------------- ')
-                                        print ('  - Compare clinical stats ')
-                                        print (' ------------------------- \n\n')
-                                        res = helpers.evaluatePlans(pathDVHParams
-                                            , planNames=[planNameOG, planNameCS, planNameCSAuto, planNameFinal, planNameFinalAuto]
-                                            , pathPatient=pathPatient
-                                            , contourType=config.KEYNAME_CONTOUR_ALL
-                                        )
-
-                                        print ('\n\n ------------------------- ')
-                                        print ('  - NTCP Modeling ')
-                                        print (' ------------------------- \n\n')
-                                        patientID = Path(pathPatient).parts[-2]
-                                        plansForNTCP = [planNameOG, planNameFinal, planNameFinalAuto]
-                                        getNTCPVals(patientID, plansForNTCP, pathPatient)
-
-                                        print ('\n - [main] Total time passed: ', round(time.time()-tTotal, 2), ' seconds')
-                    except:
-                        traceback.print_exc()
-                
-                # For A3/A4/A5 updates
-                if 0:
-                    try:
-                        dfo2PlanStatusAuto, dfo2PlanValueAuto, dfo2PlanTimeAuto = copyPlanAndOptimize(planNameDFOAuto, planNameDFO2Auto
-                                                , pathKNOObjectivesAuto, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_DOSEFALLOFF
-                                                , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                        print (' - [main] dfo2PlanStatusAuto: ', dfo2PlanStatusAuto)
-                        if dfo2PlanStatusAuto:
-                            eudPlanStatusAuto, eudPlanValueAuto, eudPlanTimeAuto = copyPlanAndOptimize(planNameDFO2Auto, planNameEUDAuto
-                                                , pathKNOObjectivesAuto, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_MAXEUD
-                                                , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                            print (' - [main] eudPlanStatusAuto: ', eudPlanStatusAuto)
-                            if eudPlanStatusAuto:
-                                finalPlanStatusAuto, finalPlanValueAuto, finalPlanTimeAuto = copyPlanAndOptimize(planNameEUDAuto, planNameFinalAuto
-                                                    , pathKNOObjectivesAuto, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=None
-                                                    , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                                print (' - [main] finalPlanStatuAutos: ', finalPlanStatusAuto)
-                                if finalPlanStatusAuto:
-                                    print ('\n\n ------------------------- ')
-                                    print ('  - Compare clinical stats ')
-                                    print (' ------------------------- \n\n')
-                                    res = helpers.evaluatePlans(pathDVHParams
-                                        , planNames=[planNameOG, planNameCS, planNameCSAuto, planNameFinal, planNameFinalAuto]
-                                        , pathPatient=pathPatient
-                                        , contourType=config.KEYNAME_CONTOUR_ALL
-                                    )
-
-                                    print ('\n\n ------------------------- ')
-                                    print ('  - NTCP Modeling ')
-                                    print (' ------------------------- \n\n')
-                                    patientID = Path(pathPatient).parts[-2]
-                                    plansForNTCP = [planNameOG, planNameFinal, planNameFinalAuto]
-                                    getNTCPVals(patientID, plansForNTCP, pathPatient)
-
-                                    print ('\n - [main] Total time passed: ', round(time.time()-tTotal, 2), ' seconds')
-                    except:
-                        traceback.print_exc()
-
-                # for A4/A5 updates
-                if 0:
-                    try:
-                        eudPlanStatusAuto, eudPlanValueAuto, eudPlanTimeAuto = copyPlanAndOptimize(planNameDFO2Auto, planNameEUDAuto
-                                                , pathKNOObjectivesAuto, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_MAXEUD
-                                                , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                        print (' - [main] eudPlanStatusAuto: ', eudPlanStatusAuto)
-                        if eudPlanStatusAuto:
-                            finalPlanStatusAuto, finalPlanValueAuto, finalPlanTimeAuto = copyPlanAndOptimize(planNameEUDAuto, planNameFinalAuto
-                                                , pathKNOObjectivesAuto, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=None
-                                                , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                            print (' - [main] finalPlanStatusAuto: ', finalPlanStatusAuto)
-                            if finalPlanStatusAuto:
-                                print ('\n\n ------------------------- ')
-                                print ('  - Compare clinical stats ')
-                                print (' ------------------------- \n\n')
-                                res = helpers.evaluatePlans(pathDVHParams
-                                    , planNames=[planNameOG, planNameCS, planNameCSAuto, planNameFinal, planNameFinalAuto]
-                                    , pathPatient=pathPatient
-                                    , contourType=config.KEYNAME_CONTOUR_ALL
-                                )
-
-                                print ('\n\n ------------------------- ')
-                                print ('  - NTCP Modeling ')
-                                print (' ------------------------- \n\n')
-                                patientID = Path(pathPatient).parts[-2]
-                                plansForNTCP = [planNameOG, planNameFinal, planNameFinalAuto]
-                                getNTCPVals(patientID, plansForNTCP, pathPatient)
-
-                                print ('\n - [main] Total time passed: ', round(time.time()-tTotal, 2), ' seconds')
-
-                    except:
-                        traceback.print_exc()
-
-                # NTCP
-                if 0:
-                    patientID = Path(pathPatient).parts[-2]
-                    patientRSObj = helpers.loadPatientUsingID(patientID)
-                    if patientRSObj is not None:
-                        plansForNTCP = [planNameOG, planNameFinal, planNameFinalAuto]
-                        getNTCPVals(patientID, plansForNTCP, pathPatient)
-                    else:
-                        print (' - [main] patientRSObj is None')
+            return int(all(stageStatus[stageName] is True for stageName in stageStatus))
 
         except:
             traceback.print_exc()
@@ -1265,6 +823,8 @@ def main(params):
         traceback.print_exc()
         if DEBUG_PDB: pdb.set_trace()
 
+    return 0
+
 if __name__ == "__main__":
 
     ###################################################################################
@@ -1289,6 +849,7 @@ if __name__ == "__main__":
     pathKNOObjectivesClassSolution = Path(DIR_DATA).joinpath('assets', 'objective-template-photon-kno.xml')
     pathDVHParams = Path(DIR_DATA).joinpath('assets', 'eval-template-photon.csv')
     pathIsoDoseXML = Path(DIR_DATA).joinpath('assets', 'isodose.xml'); # pathIsoDoseXML = None
+    pathPatientRegistry = Path(DIR_DATA).joinpath('assets', config.FILENAME_PATIENT_REGISTRY)
 
     ###################################################################################
     # Step 3 -  Specific patient paths (of data extracted from RTPACS)
@@ -1329,6 +890,7 @@ if __name__ == "__main__":
             , config.KEYNAME_PATH_CLASSSOL        : pathKNOObjectivesClassSolution
             , config.KEYNAME_PATH_OBJECTIVES      : pathKNOObjectivesClinical
             , config.KEYNAME_PATH_DVHPARAMS       : pathDVHParams
+            , config.KEYNAME_PATH_PATIENT_REGISTRY: pathPatientRegistry
             , config.KEYNAME_PATH_ISODOSEXML      : pathIsoDoseXML
             
             # Plan parameters
@@ -15,6 +15,7 @@ import connect
 # Import private libraries
 import hnDoseEvalHelpers as helpers
 import hnDoseConfig as config
+import patientRegistry
 
 # Import public libraries
 import re
@@ -37,64 +38,35 @@ def print(*args, **kwargs):
 #                        HELPERS                       #
 ########################################################
 
-def checkIfRoiIgnore(planName, objectiveFType, roiName):
-    
-    # Step 1 - Init
-    roisFullIgnore = []
-    roisPartialIgnore = []
-    roiIgnoreBool = False
-
-    planEUDSuffix      = config.SUFFIX_PLAN_DFO.format(config.PREFIX_CLINICAL_CONTOURS) # R2
-    planEUDAutoSuffix  = config.SUFFIX_PLAN_DFO.format(config.PREFIX_AUTOMATED_CONTOURS)
-    planEUD2Suffix       = config.SUFFIX_PLAN_DFO2.format(config.PREFIX_CLINICAL_CONTOURS) # R3
-    planEUD2AutoSuffix   = config.SUFFIX_PLAN_DFO2.format(config.PREFIX_AUTOMATED_CONTOURS)
-    planFinalSuffix     = config.SUFFIX_PLAN_FINAL.format(config.PREFIX_CLINICAL_CONTOURS)  # R5
-    planFinalAutoSuffix = config.SUFFIX_PLAN_FINAL.format(config.PREFIX_AUTOMATED_CONTOURS)
-
-    # Step 2 - Ignore check on certain ROIs
-    if roiName in [config.KEYNAME_BRAINSTEM, config.KEYNAME_BRAINSTEM + config.KEY_3MM_SUFFIX
-                   , config.KEYNAME_SPINALCORD, config.KEYNAME_SPINALCORD + config.KEY_3MM_SUFFIX
-                   , config.KEYNAME_GHOST_CRANIAL, config.KEYNAME_EAR_L_GHOST, config.KEYNAME_EAR_R_GHOST
-                   ]:
-        return roiIgnoreBool
-
-    # Step 2 - Get ROIs to ignore (while updating objectives)
-    roisPartialIgnoreBasic = [
-                config.REGEX_ROI_HOT, config.REGEX_ROI_HEET
-                , config.REGEX_KOUD, config.REGEX_COLD
-                , config.REGEX_ROI_MINDOSE, config.REGEX_ROI_MAXDOSE
-                , config.REGEX_ONDER, config.REGEX_OVER
-                , config.REGEX_DFO
-                , config.REGEX_ONDERDOSERING
-                , config.REGEX_ROI_HOSTPSOTS
-                , config.REGEX_CAUDAAL, config.REGEX_CAUD
-                ]
-    if (planEUDSuffix in planName or planEUDAutoSuffix in planName) and objectiveFType == config.KEY_FTYPE_MAXEUD:
-        roisFullIgnore = [config.KEYNAME_BODY] # does not matter as it is Opt_Body in protons
-        roisPartialIgnore = roisPartialIgnoreBasic + [config.KEYNAME_3MM] # the extra part compared to EUD2 is KEYNAME_3MM
-    
-    elif (planEUD2Suffix in planName or planEUD2AutoSuffix in planName) and objectiveFType == config.KEY_FTYPE_MAXEUD:
-        roisFullIgnore = [config.KEYNAME_BODY, config.KEYNAME_RING_PTV_DL2, config.KEYNAME_GHOST]
-        roisPartialIgnore = roisPartialIgnoreBasic
-    
-    elif (planFinalSuffix in planName or planFinalAutoSuffix in planName) and objectiveFType == None:
-        roisFullIgnore = [config.KEYNAME_BODY]
-        roisPartialIgnore = []
-
-    # Step 3 - Check if ROI should be ignored
-    for roiFullIgnore in roisFullIgnore:
-        if roiName == roiFullIgnore:
-            roiIgnoreBool = True
-            break
-    
-    for roiPartialIgnore in roisPartialIgnore:
-        if re.search(roiPartialIgnore, str(roiName).lower()) is not None:
-            roiIgnoreBool = True
-            break
+# ROI-ignore rules (while updating objectives) for each plan stage, compiled once (see helpers.RoiIgnoreRuleEngine)
+roisPartialIgnoreBasic = [
+            config.REGEX_ROI_HOT, config.REGEX_ROI_HEET
+            , config.REGEX_KOUD, config.REGEX_COLD
+            , config.REGEX_ROI_MINDOSE, config.REGEX_ROI_MAXDOSE
+            , config.REGEX_ONDER, config.REGEX_OVER
+            , config.REGEX_DFO
+            , config.REGEX_ONDERDOSERING
+            , config.REGEX_ROI_HOSTPSOTS
+            , config.REGEX_CAUDAAL, config.REGEX_CAUD
+            ]
+ROI_IGNORE_RULES = helpers.RoiIgnoreRuleEngine(
+    roisNoIgnore=[config.KEYNAME_BRAINSTEM, config.KEYNAME_BRAINSTEM + config.KEY_3MM_SUFFIX
+                  , config.KEYNAME_SPINALCORD, config.KEYNAME_SPINALCORD + config.KEY_3MM_SUFFIX
+                  , config.KEYNAME_GHOST_CRANIAL, config.KEYNAME_EAR_L_GHOST, config.KEYNAME_EAR_R_GHOST
+                  ]
+    , stageRules=[
+        [[config.SUFFIX_PLAN_DFO.format(config.PREFIX_CLINICAL_CONTOURS), config.SUFFIX_PLAN_DFO.format(config.PREFIX_AUTOMATED_CONTOURS)] # R2
+            , config.KEY_FTYPE_MAXEUD, [config.KEYNAME_BODY], roisPartialIgnoreBasic + [config.KEYNAME_3MM]] # the extra part compared to EUD2 is KEYNAME_3MM
+        , [[config.SUFFIX_PLAN_DFO2.format(config.PREFIX_CLINICAL_CONTOURS), config.SUFFIX_PLAN_DFO2.format(config.PREFIX_AUTOMATED_CONTOURS)] # R3
+            , config.KEY_FTYPE_MAXEUD, [config.KEYNAME_BODY, config.KEYNAME_RING_PTV_DL2, config.KEYNAME_GHOST], roisPartialIgnoreBasic]
+        , [[config.SUFFIX_PLAN_FINAL.format(config.PREFIX_CLINICAL_CONTOURS), config.SUFFIX_PLAN_FINAL.format(config.PREFIX_AUTOMATED_CONTOURS)] # R5
+            , None, [config.KEYNAME_BODY], []]
+    ])
 
-    return roiIgnoreBool
+def checkIfRoiIgnore(planName, objectiveFType, roiName):
+    return ROI_IGNORE_RULES.isIgnored(planName, objectiveFType, roiName)
 
-def updateObjectivesForProton(planName, objectivesFromRS, objectivesFromPath, objectiveFType):
+def updateObjectivesForProton(planName, objectivesFromRS, objectivesFromPath, objectiveFType, pathPatient=None):
     """
     Called from uploadORUpdateObjectives()
 
@@ -104,6 +76,7 @@ def updateObjectivesForProton(planName, objectivesFromRS, objectivesFromPath, ob
     objectivesFromRS: list
     objectivesFromPath: list
     objectiveFType: str, ['DoseFallOff', 'DoseFallOff', 'MaxEUD', None]
+    pathPatient: Path, (optional) folder to save the objective diff (config.FILENAME_OBJECTIVE_DIFF) in
     """
     updateObjectiveStatus = False
 
@@ -116,113 +89,23 @@ def updateObjectivesForProton(planName, objectivesFromRS, objectivesFromPath, ob
         planFinalTermSuffix     = config.SUFFIX_PLAN_FINAL.format(config.PREFIX_CLINICAL_CONTOURS)  # R5
         planFinalAutoTermSuffix = config.SUFFIX_PLAN_FINAL.format(config.PREFIX_AUTOMATED_CONTOURS) # A5
 
-        # Step 2 - Get objectives from file (a.k.a path)
-        updatedFromPathObjectivesStatus = {}
-        for pathIdx, objectiveFromPath in enumerate(objectivesFromPath):
-            newRoiName      = objectiveFromPath.roi_name
-            newFunctionType = objectiveFromPath.function_type
-            newWeight       = objectiveFromPath.weight
-            newRobust       = objectiveFromPath.is_robust
-            if newWeight == 0:
-                continue
-            
-            newKey = f'{newRoiName}-{newFunctionType}-{newRobust}'
-            updatedFromPathObjectivesStatus[newKey] = {'exists': False, 'idx':pathIdx}
-
-        # Step 4 - Get existing objectives and update them
+        # Step 2 - Diff existing objectives with objectives from file (a.k.a path), keyed on roi-name, function-type and robustness
         if len(objectivesFromRS) > 0:
             print ('\n\n - [INFO][updateObjectivesForProton()][Patient={}] Updating Objectives ... '.format(helpers.getPatientIdentifier(patient)))
-            
-            # Step 4.1 - Update weights of existing objectives (based on function-type and roi-name)
-            for rsIdx, objectiveFromRS in enumerate(objectivesFromRS):
-                try:
-
-                    # Step 4.1.1 - Get roiName, weight, fType
-                    existingRoiName      = objectiveFromRS.ForRegionOfInterest.Name
-                    existingWeight       = objectiveFromRS.DoseFunctionParameters.Weight
-                    existingRobust       = objectiveFromRS.UseRobustness 
-                    try   : existingFunctionType = objectiveFromRS.DoseFunctionParameters.FunctionType
-                    except: existingFunctionType = config.KEY_FTYPE_DOSEFALLOFF
-                    if existingRoiName == config.KEYNAME_BODY: continue
-                    # [DEBUG]
-                    if 0:
-                        print (' - [DEBUG][updateObjectivesForProton()] \troi: {}, \tfunctionType: {}, \tweight: {}'.format(existingRoiName, existingFunctionType, existingWeight))
-                    
-                    # Step 4.1.2 - Make note of existing objectives that are in new objectives
-                    existingKey = f'{existingRoiName}-{existingFunctionType}-{existingRobust}'
-                    if existingKey in updatedFromPathObjectivesStatus:
-                        updatedFromPathObjectivesStatus[existingKey]['exists'] = True
-
-                    # Step 4.1.3 - Check if existing objective is in new objectives
-                    for objectiveFromPath in objectivesFromPath:
-                        newRoiName      = objectiveFromPath.roi_name
-                        newFunctionType = objectiveFromPath.function_type
-                        newWeight       = objectiveFromPath.weight
-                        newRobust       = objectiveFromPath.is_robust
-                        if newWeight == 0: 
-                            continue
-                        functionMatchBool = newFunctionType == objectiveFType
-                        if  planFinalTermSuffix in planName or planFinalAutoTermSuffix in planName:
-                            functionMatchBool = True # i.e update all rois
-                        
-                        robustMatchBool = existingRobust == newRobust
-
-                        if functionMatchBool and robustMatchBool:
-                            if not checkIfRoiIgnore(planName, objectiveFType, newRoiName):
-                                if existingRoiName == newRoiName and existingFunctionType == newFunctionType:
-
-                                    # Step 4.1.1 - Update weight 
-                                    objectivesFromRS[rsIdx].DoseFunctionParameters.Weight = newWeight
-                                    print (f'  -- [updateObjectivesForProton()] roi: {existingRoiName}, \tfType: {existingFunctionType}, \tweight: {existingWeight} --> {newWeight}')
-
-                                    # Step 4.1.2 - Update dose level(s)
-                                    if existingFunctionType == config.KEY_FTYPE_MAXEUD:
-                                        existingDoseLevel = objectivesFromRS[rsIdx].DoseFunctionParameters.DoseLevel
-                                        existingEudParameterA = objectivesFromRS[rsIdx].DoseFunctionParameters.EudParameterA
-                                        objectivesFromRS[rsIdx].DoseFunctionParameters.DoseLevel     = objectiveFromPath.doselevel
-                                        objectivesFromRS[rsIdx].DoseFunctionParameters.EudParameterA = objectiveFromPath.eud_parameter_a
-                                        print (f' --- [updateObjectivesForProton()] \tDoseLevel: {existingDoseLevel} --> {objectiveFromPath.doselevel}')
-                                        print (f' --- [updateObjectivesForProton()] \tEudParameterA: {existingEudParameterA} --> {objectiveFromPath.eud_parameter_a}')
-                                    elif existingFunctionType == config.KEY_FTYPE_DOSEFALLOFF:
-                                        if planDFO2TermSuffix in planName or planDFO2AutoTermSuffix in planName: # [Ref: https://iprova.lumc.nl/Portal/#/document/1fc74366-40c1-4b84-a653-0455b6c891f8 (Vervolgens voor beide opties)]
-                                            print (f' --- [updateObjectivesForProton()] \tHighDoseLevel: {objectiveFromRS.DoseFunctionParameters.HighDoseLevel} --> {objectiveFromPath.high_doselevel}')
-                                            print (f' --- [updateObjectivesForProton()] \tLowDoseLevel : {objectiveFromRS.DoseFunctionParameters.LowDoseLevel}  --> {objectiveFromPath.low_doselevel}')
-                                            objectivesFromRS[rsIdx].DoseFunctionParameters.HighDoseLevel = objectiveFromPath.high_doselevel
-                                            objectivesFromRS[rsIdx].DoseFunctionParameters.LowDoseLevel  = objectiveFromPath.low_doselevel
-                                    
-                                    elif existingFunctionType == config.KEY_FTYPE_MAXDOSE:
-                                        pass
-                                
-                                # Step 4.1.3 - For debugging purposes
-                                key = f'{newRoiName}-{newFunctionType}-{newRobust}'
-                                updatedFromPathObjectivesStatus[key]['updated'] = True
-                except:
-                    traceback.print_exc()
-                    if DEBUG_PDB: pdb.set_trace()
-
         else:
             print (f' - [updateKNOObjectivesinRStation()] No objectives found in RS for plan {planName}')
 
-        
-        # Step 5 - Add new objectives [if 1) they dont exist, and if they match 2) function-type and 3) roiName conditions]
-        print ('')
-        for key in updatedFromPathObjectivesStatus:
-            if updatedFromPathObjectivesStatus[key]['exists'] is False:
-                roiName = key.split('-')[0]
-                fType   = key.split('-')[1]
-                isRobust = key.split('-')[2]
-                
-                fTypeCondition     = fType == objectiveFType # only if ftType in [DoseFallOff, MaxEUD]
-                roiIgnoreCondition = checkIfRoiIgnore(planName, objectiveFType, roiName) # this roiName comes from existing objectives of RS
-                if objectiveFType == None: # since this is the last plan, we want to add all (non-existent) objectives
-                    fTypeCondition = True
-
-                if fTypeCondition and not roiIgnoreCondition:
-                    print (f' - [updateObjectivesForProton()] Adding new objective for {roiName} of type {fType}')
-                    newObjective = objectivesFromPath[updatedFromPathObjectivesStatus[key]['idx']]
-                    print (f' --- [updateObjectivesForProton()] newObjective for roi: {newObjective.roi_name} and fType: {newObjective.function_type} with weight: {newObjective.weight}')
-                    if newObjective.weight > 0:
-                        newObjective.apply()
+        objectiveDiff = helpers.getObjectiveDiff(objectivesFromRS, objectivesFromPath, objectiveFType
+                            , roiIgnoreFunc=lambda roiName: checkIfRoiIgnore(planName, objectiveFType, roiName)
+                            , updateAllFunctions=planFinalTermSuffix in planName or planFinalAutoTermSuffix in planName # i.e update all rois
+                            , updateDoseFallOffLevels=planDFO2TermSuffix in planName or planDFO2AutoTermSuffix in planName # [Ref: https://iprova.lumc.nl/Portal/#/document/1fc74366-40c1-4b84-a653-0455b6c891f8 (Vervolgens voor beide opties)]
+                            , useRobust=True
+                            , skipPathFunc=lambda objectiveFromPath: objectiveFromPath.weight == 0
+                            , skipRSFunc=lambda rsIdx, existingRoiName: existingRoiName == config.KEYNAME_BODY)
+
+        # Step 3 - Update existing objectives and add new ones [if 1) they dont exist, and if they match 2) function-type and 3) roiName conditions]
+        helpers.applyObjectiveDiff(objectiveDiff, objectivesFromRS, objectivesFromPath)
+        helpers.saveObjectiveDiff(pathPatient, planName, objectiveDiff)
 
         updateObjectiveStatus = True
 
@@ -233,7 +116,7 @@ def updateObjectivesForProton(planName, objectivesFromRS, objectivesFromPath, ob
 
     return updateObjectiveStatus
 
-def uploadOrUpdateProtonObjectives(planName, pathKNOProtonObjectives, uploadObjectivesBool, updateObjectivesBool, forceObjectives, objectiveFType):
+def uploadOrUpdateProtonObjectives(planName, pathKNOProtonObjectives, uploadObjectivesBool, updateObjectivesBool, forceObjectives, objectiveFType, pathPatient=None):
 
     # Step 1 - Init
     objectiveStatus    = False
@@ -264,7 +147,7 @@ def uploadOrUpdateProtonObjectives(planName, pathKNOProtonObjectives, uploadObje
     
     elif updateObjectivesBool:
         if len(objectivesFromRS) > 0:
-            objectiveStatus = updateObjectivesForProton(planName, objectivesFromRS, objectivesFromPath, objectiveFType)
+            objectiveStatus = updateObjectivesForProton(planName, objectivesFromRS, objectivesFromPath, objectiveFType, pathPatient=pathPatient)
         else:
             print(' - [uploadORUpdateObjectives()] No objectives found, not updating')
     
@@ -307,6 +190,7 @@ def robustEvaluationOld(planName, force=False):
 
             print (f' - [robustEvaluation()] Computing dose using IonMonteCarlo algo')
             beamsetObj.ComputeDose(ComputeBeamDoses=True, DoseAlgorithm="IonMonteCarlo", ForceRecompute=True)
+            helpers.invalidateDoseStatistics(planName)
 
             print (f' - [robustEvaluation()] Computing scenario group dose values: {planName}')
             retval_0.ComputeScenarioGroupDoseValues()
@@ -362,6 +246,7 @@ def robustEvaluationViaUI(planName, force=False):
 
             print (f' - [robustEvaluationViaUI()] Computing dose using IonMonteCarlo algo')
             beamSetObj.ComputeDose(ComputeBeamDoses=True, DoseAlgorithm="IonMonteCarlo", ForceRecompute=True)
+            helpers.invalidateDoseStatistics(planName)
 
             print (f' - [robustEvaluationViaUI()] Computing scenario group dose values: {planName}')
             retval_0.ComputeScenarioGroupDoseValues()
@@ -373,17 +258,29 @@ def robustEvaluationViaUI(planName, force=False):
     except:
         traceback.print_exc()
 
-def robustEvaluationViaSelf(planName, pathRobustTemplate, pathRobustResultsSave, verbose=False):
+def robustEvaluationViaSelf(planName, pathRobustTemplate, pathRobustResultsSave, verbose=False, trackScenarioStats=False, pathScenarioDoses=None, evaluateGoals=True):
+    """
+    pathScenarioDoses: Path, if given, each scenario dose (and the nominal dose and ROI masks) is written to a helpers.ScenarioDoseStore in this folder
+                       and the robust template is evaluated offline from it (helpers.evaluateRobustTemplateFromStore()) instead of via RStation clinical goals
+    evaluateGoals: bool, for pathScenarioDoses, if False only the store is written (i.e. helpers.evaluateRobustTemplateFromStore() is called later, without RStation)
+    
+    Returns
+    -------
+    status: bool, True if the robust template was evaluated and saved (or, for evaluateGoals=False, the store was written)
+    """
 
+    status = False
     try:
         
-        def getClinicalGoalsFromDose(doseEvalObj):
+        def getClinicalGoalsFromDose(doseEvalObj, isNominalDose=False):
             """
             For evalFunc in planObj.TreatmentCourse.EvaluationSetup.EvaluationFunctions:
                 - evalFunc.ForRegionOfInterest.Name    : self-explanatory
                 - evalFunc.PlanningGoal.Type           : 'DoseAtVolume', 'DoseAtAbsoluteVolume', 'DoseAtRelativeVolume', 'VolumeAtDose', 'AbsoluteVolumeAtDose', 'RelativeVolumeAtDose'
                 - evalFunc.PlanningGoal.GoalCriteria   : 'AtMost', 'AtLeast'
                 - evalFunc.PlanningGoal.AcceptanceLevel: float
+            
+            isNominalDose: bool, if True, 'AverageDose' goals are taken from the plan-scoped dose statistics cache (see helpers.getDoseStatistic())
             """
             
             # Step 0 - Init
@@ -398,7 +295,10 @@ def robustEvaluationViaSelf(planName, pathRobustTemplate, pathRobustResultsSave,
                 # Step 2 - Loop over funcs
                 for evalFunc in evalFuncs:
                     try:
-                        value = evalFunc.GetClinicalGoalValueForEvaluationDose(DoseDistribution=doseEvalObj, ScaleFractionDoseToBeamSet=True)
+                        if isNominalDose and evalFunc.PlanningGoal.Type == 'AverageDose':
+                            value = helpers.getDoseStatistic(planName, doseEvalObj, evalFunc.ForRegionOfInterest.Name, 'Average')
+                        else:
+                            value = evalFunc.GetClinicalGoalValueForEvaluationDose(DoseDistribution=doseEvalObj, ScaleFractionDoseToBeamSet=True)
                     except:
                         value = evalFunc.GetClinicalGoalValue()
                     roiGoalkey   = '-'.join([evalFunc.ForRegionOfInterest.Name, evalFunc.PlanningGoal.Type, evalFunc.PlanningGoal.GoalCriteria, str(evalFunc.PlanningGoal.AcceptanceLevel), str(evalFunc.PlanningGoal.ParameterValue)])
@@ -481,8 +381,8 @@ def robustEvaluationViaSelf(planName, pathRobustTemplate, pathRobustResultsSave,
         _, caseObj, planObj, beamSetObj = helpers.getPatientAndPlan(planName, debug=True)
         radiationSetScenarioGroups = caseObj.TreatmentDelivery.RadiationSetScenarioGroups
         res       = {config.KEYNAME_NOMINAL_DOSE: {}, config.KEYNAME_MAX_DOSE: {}, config.KEYNAME_MIN_DOSE: {}, config.KEYNAME_SCENARIO_DOSE: {}}
-        dose3DMin = []
-        dose3DMax = []
+        doseAccumulator = helpers.ScenarioDoseAccumulator(trackArg=trackScenarioStats, trackStats=trackScenarioStats)
+        doseStore       = None
 
         # Step 2 - FInd idx of radiationSetScenarioGroups
         groupIdx = -1
@@ -495,7 +395,8 @@ def robustEvaluationViaSelf(planName, pathRobustTemplate, pathRobustResultsSave,
         
         if groupIdx > -1:
             print (f' - [robustEvaluationViaSelf()] Found scenario group: {planName} and doing robust eval on all scenarios')
-            for scenarioId, scenarioObj in enumerate(caseObj.TreatmentDelivery.RadiationSetScenarioGroups[groupIdx].DiscreteFractionDoseScenarios):
+            scenarioObjs = caseObj.TreatmentDelivery.RadiationSetScenarioGroups[groupIdx].DiscreteFractionDoseScenarios
+            for scenarioId, scenarioObj in enumerate(scenarioObjs):
                 if verbose:
                     print (f' - [robustEvaluationViaSelf()] Computing dose for scenario: {scenarioId}')
                     # print (scenarioId, scenarioObj.PerturbedDoseProperties.IsoCenterShift, scenarioObj.PerturbedDoseProperties.RelativeDensityShift)
@@ -510,29 +411,61 @@ def robustEvaluationViaSelf(planName, pathRobustTemplate, pathRobustResultsSave,
                 doseEvalObj = caseObj.TreatmentDelivery.FractionEvaluations[0].DoseOnExaminations[0].DoseEvaluations[0]
                 dose3Darray = doseEvalObj.DoseValues.DoseData
 
-                # Step 2.4 - Compute min and max dose
-                if len(dose3DMin) == 0: dose3DMin = dose3Darray
-                else                  : dose3DMin = np.minimum(dose3DMin, dose3Darray)
-                if len(dose3DMax) == 0: dose3DMax = dose3Darray
-                else                  : dose3DMax = np.maximum(dose3DMax, dose3Darray)
+                # Step 2.4 - Compute min and max dose (in place)
+                doseAccumulator.update(dose3Darray)
+
+                # Step 2.4.1 - Save scenario dose to disk
+                if pathScenarioDoses is not None:
+                    try:
+                        if doseStore is None:
+                            doseStore = helpers.ScenarioDoseStore(pathScenarioDoses, planName)
+                            doseStore.create(len(scenarioObjs), np.shape(dose3Darray), helpers.getScenarioDoseGridMeta(doseEvalObj))
+                        doseStore.write(scenarioId, dose3Darray
+                                        , isoCenterShift=helpers.getXYZDict(scenarioObj.PerturbedDoseProperties.IsoCenterShift)
+                                        , densityShift=float(scenarioObj.PerturbedDoseProperties.RelativeDensityShift))
+                    except:
+                        traceback.print_exc()
 
                 # Step 2.5 - Compute clinical goals for each perturbed dose
-                res[config.KEYNAME_SCENARIO_DOSE][scenarioId] = getClinicalGoalsFromDose(doseEvalObj)
+                if pathScenarioDoses is None:
+                    res[config.KEYNAME_SCENARIO_DOSE][scenarioId] = getClinicalGoalsFromDose(doseEvalObj)
 
                 # Step 2.99 - Debug
                 # if scenarioId > -1:
                 #     break
 
+            if doseStore is not None:
+                
+                # Step 2.6 - Save nominal dose and ROI masks (on the same dose grid) and evaluate the robust template offline
+                doseNominalObj = planObj.TreatmentCourse.TotalDose
+                doseStore.meta[config.KEYNAME_NUMBER_OF_FRACTIONS] = beamSetObj.FractionationPattern.NumberOfFractions
+                try:
+                    doseStore.writeNominal(doseNominalObj.DoseValues.DoseData)
+                except:
+                    traceback.print_exc()
+                doseStore.writeRoiMasks(helpers.getDoseGridRoiMasks(doseNominalObj, helpers.getRobustTemplateRoiNames(pathRobustTemplate)))
+                doseStore.close()
+                print (f' - [robustEvaluationViaSelf()] Saved scenario doses to: {doseStore.pathDoses}')
+
+                if evaluateGoals:
+                    status = helpers.evaluateRobustTemplateFromStore(pathScenarioDoses, planName, pathRobustTemplate, pathRobustResultsSave) is not None
+                else:
+                    status = doseStore.exists()
+                return status
+
             # Step 3 - Set dose values to min and max dose
-            doseEvalObj.SetDoseValues(Array=dose3DMax.flatten(), CalculationInfo='Voxelwise max', DoseAlgorithm='Undefined')
+            doseEvalObj.SetDoseValues(Array=doseAccumulator.doseMax.ravel(), CalculationInfo='Voxelwise max', DoseAlgorithm='Undefined')
             res[config.KEYNAME_MAX_DOSE] = getClinicalGoalsFromDose(doseEvalObj)
 
-            doseEvalObj.SetDoseValues(Array=dose3DMin.flatten(), CalculationInfo='Voxelwise min', DoseAlgorithm='Undefined')
+            doseEvalObj.SetDoseValues(Array=doseAccumulator.doseMin.ravel(), CalculationInfo='Voxelwise min', DoseAlgorithm='Undefined')
             res[config.KEYNAME_MIN_DOSE] = getClinicalGoalsFromDose(doseEvalObj)
 
+            if trackScenarioStats:
+                print (f' - [robustEvaluationViaSelf()] Scenarios: {doseAccumulator.count}, max voxelwise std: {np.sqrt(np.max(doseAccumulator.getVariance())):.2f}, scenarios giving the min dose: {np.unique(doseAccumulator.argMin)}')
+
             # Step 4 - Get norminal dose
             doseEvalObj = planObj.TreatmentCourse.TotalDose # type=CompositeDose
-            res[config.KEYNAME_NOMINAL_DOSE] = getClinicalGoalsFromDose(doseEvalObj)
+            res[config.KEYNAME_NOMINAL_DOSE] = getClinicalGoalsFromDose(doseEvalObj, isNominalDose=True)
 
             # Step 5 - Compute pass/fail (and save voxelwise-man/max values)
             if Path(pathRobustTemplate).exists():
@@ -577,6 +510,7 @@ def robustEvaluationViaSelf(planName, pathRobustTemplate, pathRobustResultsSave,
                     with open(str(pathRobustResultsSave), 'w') as fp:
                         robustTemplateWrite = {planName: robustTemplate}
                         json.dump(robustTemplateWrite, fp, indent=4)
+                    status = True
             
             else:
                 print (f' - [robustEvaluationViaSelf()] Robust template not found: {pathRobustTemplate}')
@@ -587,9 +521,16 @@ def robustEvaluationViaSelf(planName, pathRobustTemplate, pathRobustResultsSave,
     except:
         traceback.print_exc()
         if DEBUG_PDB: pdb.set_trace()
+    
+    return status
 
-def robustEvaluation(planName, pathRobustTemplate, pathPatient, force=False, verbose=False):
+def robustEvaluation(planName, pathRobustTemplate, pathPatient, force=False, verbose=False, saveScenarioDoses=False, evaluateGoals=True):
+    """
+    saveScenarioDoses: bool, if True the robust template is evaluated offline from a helpers.ScenarioDoseStore in pathPatient (see robustEvaluationViaSelf())
+    evaluateGoals: bool, for saveScenarioDoses, if False only the store is written (see getRobustEvaluationStages())
+    """
 
+    status = False
     try:
         
         t0 = time.time()
@@ -600,135 +541,49 @@ def robustEvaluation(planName, pathRobustTemplate, pathPatient, force=False, ver
         robustEvaluationViaUI(planName, force=force)
         
         # Step 2 - Do self-based robust eval
-        robustEvaluationViaSelf(planName, pathRobustTemplate, pathRobustResultsSave, verbose=verbose)
+        pathScenarioDoses = Path(pathPatient) if saveScenarioDoses else None
+        status = robustEvaluationViaSelf(planName, pathRobustTemplate, pathRobustResultsSave, verbose=verbose, pathScenarioDoses=pathScenarioDoses, evaluateGoals=evaluateGoals)
         print (f' - [robustEvaluation()] Done robust eval for {planName} in {round(time.time() - t0, 2)} s')
 
     except:
         traceback.print_exc()
         pdb.set_trace()
+    
+    return status
 
 ########################################################
 #                          NTCP                        #
 ########################################################
 
-def getNTCPVals(patientID, plans, pathPatient):
+def getNTCPVals(patientID, plans, pathPatient, pathRegistry=None):
+    """
+    Returns
+    -------
+    status: bool, True if the NTCP values of the plans were calculated and saved (False e.g. for patients not in the registry)
+    """
 
+    status = False
     try:
         
         print (f' - [getNTCPVals()] Getting NTCP values for patient: {patientID}')
         
-        # Step 0 - Plans and tumor types
-        patientObjOld = {
-            'HCAI-Dose-P1': ['1F PVFOTONEN', None] # None
-            , 'HCAI-Dose-P2': ['1A HYPOFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.PHARYNX]
-            , 'HCAI-Dose-P3': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.ORAL_CAVITY]
-            , 'HCAI-Dose-P4': ['1A KNOKL', None] # None
-            , 'HCAI-Dose-P5': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.ORAL_CAVITY]
-            , 'HCAI-Dose-P6': ['1A HYPOFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.PHARYNX]
-            , 'HCAI-Dose-P7': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.ORAL_CAVITY]
-            , 'HCAI-Dose-P8': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.ORAL_CAVITY]
-            , 'HCAI-Dose-P9': ['1A HYPOFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.PHARYNX]
-            , 'HCAI-Dose-P10': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.ORAL_CAVITY]
-            , 'HCAI-Dose-P11': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.ORAL_CAVITY]
-            , 'HCAI-Dose-P12': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.ORAL_CAVITY]
-            , 'HCAI-Dose-P13': ['1A LARYNXKL', helpers.NtcpKnoDysphagia.TumorLocationType.LARYNX]
-            , 'HCAI-Dose-P14': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.ORAL_CAVITY]
-            , 'HCAI-Dose-P15': ['1A LARYNXKL', helpers.NtcpKnoDysphagia.TumorLocationType.LARYNX]
-            , 'HCAI-Dose-P16': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.ORAL_CAVITY]
-            , 'HCAI-Dose-P17': ['1A LARYNXKL', helpers.NtcpKnoDysphagia.TumorLocationType.LARYNX]
-            , 'HCAI-Dose-P18': ['1A KNOKL', None] # None
-            , 'HCAI-Dose-P19': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.ORAL_CAVITY]
-            , 'HCAI-Dose-P20': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.ORAL_CAVITY]
-            , 'HCAI-Dose-P21': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.ORAL_CAVITY]
-            , 'HCAI-Dose-P22': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.ORAL_CAVITY]
-            , 'HCAI-Dose-P23': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.ORAL_CAVITY]
-            , 'HCAI-Dose-P24': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.ORAL_CAVITY]
-            , 'HCAI-Dose-P25': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.ORAL_CAVITY]
-            , 'HCAI-Dose-P26': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.ORAL_CAVITY]
-            , 'HCAI-Dose-P27': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.ORAL_CAVITY]
-            , 'HCAI-Dose-P28': ['1A TONGKL', helpers.NtcpKnoDysphagia.TumorLocationType.ORAL_CAVITY]
-            , 'HCAI-Dose-P29': ['1A LARYNXKL', helpers.NtcpKnoDysphagia.TumorLocationType.LARYNX]
-            , 'HCAI-Dose-P30': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.ORAL_CAVITY]
-            , 'HCAI-Dose-P31': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.ORAL_CAVITY]
-            , 'HCAI-Dose-P32': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.ORAL_CAVITY]
-        }
-
-        patientObj = {
-            'HCAI-Dose-P1': ['1F PVFOTONEN', helpers.NtcpKnoDysphagia.TumorLocationType.PHARYNX] # None
-            , 'HCAI-Dose-P2': ['1A HYPOFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.PHARYNX]
-            , 'HCAI-Dose-P3': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.PHARYNX]
-            , 'HCAI-Dose-P4': ['1A KNOKL', helpers.NtcpKnoDysphagia.TumorLocationType.PHARYNX] # None
-            , 'HCAI-Dose-P5': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.PHARYNX]
-            , 'HCAI-Dose-P6': ['1A HYPOFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.PHARYNX]
-            , 'HCAI-Dose-P7': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.PHARYNX]
-            , 'HCAI-Dose-P8': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.PHARYNX]
-            , 'HCAI-Dose-P9': ['1A HYPOFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.PHARYNX]
-            , 'HCAI-Dose-P10': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.PHARYNX]
-            , 'HCAI-Dose-P11': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.PHARYNX]
-            , 'HCAI-Dose-P12': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.PHARYNX]
-            , 'HCAI-Dose-P13': ['1A LARYNXKL', helpers.NtcpKnoDysphagia.TumorLocationType.LARYNX]
-            , 'HCAI-Dose-P14': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.PHARYNX]
-            , 'HCAI-Dose-P15': ['1A LARYNXKL', helpers.NtcpKnoDysphagia.TumorLocationType.LARYNX]
-            , 'HCAI-Dose-P16': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.PHARYNX]
-            , 'HCAI-Dose-P17': ['1A LARYNXKL', helpers.NtcpKnoDysphagia.TumorLocationType.LARYNX]
-            , 'HCAI-Dose-P18': ['1A KNOKL', helpers.NtcpKnoDysphagia.TumorLocationType.PHARYNX] # None
-            , 'HCAI-Dose-P19': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.PHARYNX]
-            , 'HCAI-Dose-P20': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.PHARYNX]
-            , 'HCAI-Dose-P21': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.PHARYNX]
-            , 'HCAI-Dose-P22': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.PHARYNX]
-            , 'HCAI-Dose-P23': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.PHARYNX]
-            , 'HCAI-Dose-P24': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.PHARYNX]
-            , 'HCAI-Dose-P25': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.PHARYNX]
-            , 'HCAI-Dose-P26': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.PHARYNX]
-            , 'HCAI-Dose-P27': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.PHARYNX]
-            , 'HCAI-Dose-P28': ['1A TONGKL', helpers.NtcpKnoDysphagia.TumorLocationType.PHARYNX]
-            , 'HCAI-Dose-P29': ['1A LARYNXKL', helpers.NtcpKnoDysphagia.TumorLocationType.LARYNX]
-            , 'HCAI-Dose-P30': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.PHARYNX]
-            , 'HCAI-Dose-P31': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.PHARYNX]
-            , 'HCAI-Dose-P32': ['1A OROFARKL', helpers.NtcpKnoDysphagia.TumorLocationType.PHARYNX]
-        }
+        # Step 0 - Plans and tumor types (see patientRegistry.py)
+        patientInfo = patientRegistry.getPatientInfo(patientID, pathRegistry)
+        if patientInfo is None:
+            print (f' - [getNTCPVals()] {patientID} not in the patient registry')
         
         # Step 1 - Other params
-        params = {
-            config.KEY_NTCP_PLAN1  : None
-            , config.KEY_NTCP_PLAN2: None
-            , config.KEY_NTCP_TREATMENT_TYPE     : helpers.TreatmentType.PRIMARY
-            , config.KEY_NTCP_TUMOR_LOCATION     : patientObj[patientID][1] # NtcpKnoDysphagia.TumorLocationType.{ORAL_CAVITY, PHARYNX, LARYNX}
-            , config.KEY_NTCP_BASELINE_XEROSTOMIA: helpers.NtcpKnoXerostomia.BaselineType.NONE # NtcpKnoXerostomia.BaselineType.{NONE, LITTLE, SEVERE}
-            , config.KEY_NTCP_BASELINE_DYSPHAGIA : helpers.NtcpKnoDysphagia.BaselineType.GRADE_0_1 # NtcpKnoDysphagia.BaselineType.{GRADE_0_1, GRADE_2, GRADE_3_4}
-            , config.KEY_NTCP_IS_TOTAL_LARYNGECTOMY: False
-            , config.KEY_PAROTIDS_REMOVED          : False
-        }
-
-        # Step 2 - main
+        params = helpers.getNTCPParams(patientInfo)
+
+        # Step 2 - main (ROI bindings are resolved once for all plans, results are saved after every plan)
         res = {}
+        pathPatientNTCP = Path(pathPatient) / config.FILENAME_NTCP_RESULTS
         if params[config.KEY_NTCP_TUMOR_LOCATION] is not None:
-            for plan in plans:
-
-                # Step 2.1 - Init
-                params[config.KEY_NTCP_PLAN1] = plan
-                res[plan] = {}
-                objNTCP = helpers.KNONTCP(params)
-
-                # Step 2.2 - Calculate
-                tmp = objNTCP.ntcp_xerostomia_grade_2_values
-                if config.KEY_NTCP_PLAN_1 in tmp:
-                    res[plan][tmp[config.KEY_NTCP_MODEL_NAME]] = round(tmp[config.KEY_NTCP_PLAN_1][config.KEY_NTCP_PLAN_VALUE], 5)
-
-                tmp = objNTCP.ntcp_xerostomia_grade_3_values
-                if config.KEY_NTCP_PLAN_1 in tmp:
-                    res[plan][tmp[config.KEY_NTCP_MODEL_NAME]] = round(tmp[config.KEY_NTCP_PLAN_1][config.KEY_NTCP_PLAN_VALUE], 5)
-                
-                tmp = objNTCP.ntcp_dysphagia_grade_2_values
-                if config.KEY_NTCP_PLAN_1 in tmp:
-                    res[plan][tmp[config.KEY_NTCP_MODEL_NAME]] = round(tmp[config.KEY_NTCP_PLAN_1][config.KEY_NTCP_PLAN_VALUE], 5)
-                
-                tmp = objNTCP.ntcp_dysphagia_grade_3_values
-                if config.KEY_NTCP_PLAN_1 in tmp:
-                    res[plan][tmp[config.KEY_NTCP_MODEL_NAME]] = round(tmp[config.KEY_NTCP_PLAN_1][config.KEY_NTCP_PLAN_VALUE], 5)
+            objNTCP = helpers.KNONTCPMultiPlan(params, plans)
+            res = objNTCP.evaluate(pathPatientNTCP)
+            status = True
                 
         # Step 3 - Save
-        pathPatientNTCP = Path(pathPatient) / config.FILENAME_NTCP_RESULTS
         with open(str(pathPatientNTCP), 'w') as fp:
             json.dump(res, fp, indent=4)
         
@@ -737,6 +592,9 @@ def getNTCPVals(patientID, plans, pathPatient):
     except:
         traceback.print_exc()
         if DEBUG_PDB: pdb.set_trace()
+        status = False
+    
+    return status
 
 ########################################################
 #                    AUTO-HELPERS                      #
@@ -750,7 +608,7 @@ def doAutoContouringForProton():
         
         # Step 0 - Init
         print (f' \n\n ===================== start autocontouring (for protons) ===================== \n\n')
-        patient = helpers.rayStationSave()
+        patient = helpers.rayStationSave(dirty=False)
         case    = patient.Cases[0]
         examinationName = case.Examinations[0].Name
 
@@ -764,10 +622,11 @@ def doAutoContouringForProton():
                 
         # Step 1.2 - Run OAR segmentation
         if len(oarsToInclude):
-            _ = helpers.rayStationSave()
+            _ = helpers.rayStationSave(commit=True, dirty=False)
             case.SetCurrent() # Why == Potential Error: "The case to which the examination belongs mist be selected"
             examination = case.Examinations[0]
             _ = examination.RunOarSegmentation(ModelName="RSL Head and Neck CT", ExaminationsAndRegistrations={ examinationName: None }, RoisToInclude=oarsToInclude)
+            helpers.resetCaseNameIndex(case)
             helpers.rayStationSave()
         else:
             print (' - [doAutoContouringForProton()] No OARs to auto-contour')
@@ -781,18 +640,21 @@ def doAutoContouringForProton():
                 if oar == config.KEYNAME_CAVITY_ORAL:
                     newName                                            = config.KEYNAME_ORAL_CAVITY + config.KEY_AUTOCONTOUR_SUFFIX
                     case.PatientModel.RegionsOfInterest[oar].Name      = newName
+                    helpers.getCaseNameIndex(case).renameRoi(oar, newName)
                     case.PatientModel.RegionsOfInterest[newName].Color = config.OAR_DUPLICATE_COLOR_RGB_STRING 
                     print (' - [doAutoContouringForProton()] Renamed OAR: ', oar, ' --> ', newName)
                 elif oar == config.KEYNAME_ESOPHAGUS_S:
                     try:
                         newName                                            = config.KEYNAME_ESOPHAGUS + config.KEY_AUTOCONTOUR_SUFFIX
                         case.PatientModel.RegionsOfInterest[oar].Name      = newName
+                        helpers.getCaseNameIndex(case).renameRoi(oar, newName)
                         case.PatientModel.RegionsOfInterest[newName].Color = config.OAR_DUPLICATE_COLOR_RGB_STRING 
                         print (' - [doAutoContouringForProton()] Renamed OAR: ', oar, ' --> ', newName)
                     except:
                         traceback.print_exc()
                 else:
                     case.PatientModel.RegionsOfInterest[oar].Name = oar + config.KEY_AUTOCONTOUR_SUFFIX
+                    helpers.getCaseNameIndex(case).renameRoi(oar, oar + config.KEY_AUTOCONTOUR_SUFFIX)
 
         # Step 1.4 - Do ROI Algebra
         helpers.doROIAlgebraForProtonAutoContours(case)
@@ -832,7 +694,7 @@ def uploadRTAppsDataToRStation(pathPatient, planName, forceUpload=False, forceCu
     
     # Step 0 - Init
     assert forceUpload + forceCurrentPatient < 2, ' - [uploadRTAppsDataToRStation] forceUpload and forceCurrentPatient cannot be both True!'
-    helpers.rayStationSave()
+    helpers.rayStationSave(commit=True, dirty=False)
     db = connect.get_current(config.KEYNAME_RS_PATIENTDB)
     patientCTBool, patientRTStructBool, patientRTPlanBool, patientRTDoseBool = False, False, False, False
     
@@ -863,6 +725,7 @@ def uploadRTAppsDataToRStation(pathPatient, planName, forceUpload=False, forceCu
                             patientID, studyUID, seriesUID = helpers.updateCTDicoms(pathPatientCTFolder)
                             print ('\n - [uploadRTAppsDataToRStation()] --------------------- Step 1.1: Uploading CT data for {} ... \n\n'.format(patientID))
                             warnings = db.ImportPatientFromPath(Path=str(pathPatientCTFolder), SeriesOrInstances=[{'PatientID': patientID, 'StudyInstanceUID': str(studyUID), 'SeriesInstanceUID': str(seriesUID)}], ImportFilter='', BrachyPlanImportOverrides={})
+                            helpers.resetCaseNameIndex()
                             patient = helpers.rayStationSave()
                             # patient.Cases[0].SetCurrent()
                             print ('\n - [uploadRTAppsDataToRStation()] --------------------- Step 1.1: Uploaded CT data for {} \n\n'.format(helpers.getPatientIdentifier(patient)))
@@ -883,7 +746,7 @@ def uploadRTAppsDataToRStation(pathPatient, planName, forceUpload=False, forceCu
             print ('\n ---------------------------------------------------------- ')
 
             # Step 1.2 - Upload (existing) RTStruct/RTPLAN/RTDOSE
-            patient = helpers.rayStationSave()
+            patient = helpers.rayStationSave(commit=True, dirty=False)
             if patient is not None and patientCTBool:
                 case      = patient.Cases[0]
                 casename  = case.CaseName
@@ -898,6 +761,7 @@ def uploadRTAppsDataToRStation(pathPatient, planName, forceUpload=False, forceCu
                             studyUIDRTStruct, seriesUIDRTStruct = helpers.updateRTStructDicoms(pathPatientRTStructFile)
                             print ('\n\n [uploadRTAppsDataToRStation()][Patient={}] --------------------- Step 1.2: Uploading RTStruct data ... \n\n'.format(helpers.getPatientIdentifier(patient)))
                             warningsRTStruct  = patient.ImportDataFromPath(Path=str(pathPatientRTStructFolder), CaseName=casename, SeriesOrInstances=[{'PatientID': patientID, 'StudyInstanceUID': str(studyUIDRTStruct), 'SeriesInstanceUID': str(seriesUIDRTStruct)}], ImportFilter='', BrachyPlanImportOverrides={}, AllowMismatchingPatientID=True)
+                            helpers.resetCaseNameIndex(case)
                             print ('\n\n [uploadRTAppsDataToRStation()][Patient={}] --------------------- Step 1.2: Uploaded RTStruct data \n\n'.format(helpers.getPatientIdentifier(patient)))
                             patientRTStructBool = True
                             helpers.rayStationSave()
@@ -935,6 +799,7 @@ def uploadRTAppsDataToRStation(pathPatient, planName, forceUpload=False, forceCu
                                 {'PatientID': patientID, 'StudyInstanceUID': str(studyUIDRTPlan), 'SeriesInstanceUID': str(seriesUIDRTPlan)}    
                                 , {'PatientID': patientID, 'StudyInstanceUID': str(studyUIDRTDose), 'SeriesInstanceUID': str(seriesUIDRTDose)}
                                 ], ImportFilter='', BrachyPlanImportOverrides={}, AllowMismatchingPatientID=True)
+                            helpers.resetCaseNameIndex(case)
                             shutil.rmtree(pathTempRTDoseAndRTPlanFolder)
                             patientRTPlanBool = True
                             patientRTDoseBool = True
@@ -976,13 +841,33 @@ def uploadRTAppsDataToRStation(pathPatient, planName, forceUpload=False, forceCu
 def copyProtonPlanAndOptimize(basePlanName, newPlanName
                         , pathKNOProtonObjectives, uploadObjectivesBool, updateObjectivesBool, forceObjectives, objectiveFType
                         , optSteps, optReset, pathIsoDoseXML=None
-                        , debug=False):
+                        , debug=False, pathPatient=None, warmStartPlanName=None):
+    """
+    pathPatient: Path, if given, the stage is recorded in (and resumed from) config.FILENAME_STAGE_LEDGER in this folder
+    warmStartPlanName: String, if given (and its contours are near-identical, see helpers.getWarmStartBasePlan()), the plan is copied from this one and not reset
+    """
 
     t0 = time.time()
     optimizeValue = -1
     timeTaken = -1
+    inputsHash = None
     try:
 
+        # Step 0 - Warm-start from another plan (e.g. clinical class-solution for the auto-contour chain)
+        basePlanName, warmStartBool = helpers.getWarmStartBasePlan(pathPatient, basePlanName, warmStartPlanName, newPlanName, config.PROTON_POTENTIAL_ROIS_TO_RENAME_FOR_AUTO)
+        if warmStartBool:
+            optReset, forceObjectives = False, True # keep segments/spots, but replace objectives
+
+        # Step 0 - Check if this stage was already done in a previous (crashed/interrupted) run
+        stageParams = {'uploadObjectivesBool': uploadObjectivesBool, 'updateObjectivesBool': updateObjectivesBool, 'forceObjectives': forceObjectives
+                       , 'objectiveFType': objectiveFType, 'optSteps': optSteps, 'optReset': optReset}
+        if warmStartPlanName is not None:
+            stageParams['warmStart'] = warmStartBool
+        inputsHash, stageEntry = helpers.resumeStage(pathPatient, basePlanName, newPlanName, pathKNOProtonObjectives, stageParams)
+        if stageEntry is not None:
+            return True, stageEntry[config.KEYNAME_OBJ_VALUE], stageEntry[config.KEYNAME_TIME]
+        helpers.updateStageLedger(pathPatient, newPlanName, inputsHash, config.KEYNAME_STAGE_RUNNING)
+
         # Step 0 - for console printing (while debugging across multiple consoles)
         try:
             patient, _, _, _  = helpers.getPatientAndPlan(basePlanName)
@@ -994,22 +879,25 @@ def copyProtonPlanAndOptimize(basePlanName, newPlanName
         print (f' \n\n ===================== start for {newPlanName} ===================== \n')
         copyPlanStatus = helpers.copyPlan(basePlanName, newPlanName, createArcBeam=False, debug=debug)
         if not copyPlanStatus:
+            helpers.updateStageLedger(pathPatient, newPlanName, inputsHash, config.KEYNAME_STAGE_FAILED)
             return False, optimizeValue, timeTaken
         
         # Step 2 - Upload/update objectives
-        objectiveStatus = uploadOrUpdateProtonObjectives(newPlanName, pathKNOProtonObjectives, uploadObjectivesBool, updateObjectivesBool, forceObjectives, objectiveFType)
+        objectiveStatus = uploadOrUpdateProtonObjectives(newPlanName, pathKNOProtonObjectives, uploadObjectivesBool, updateObjectivesBool, forceObjectives, objectiveFType, pathPatient=pathPatient)
         if not objectiveStatus:
+            helpers.updateStageLedger(pathPatient, newPlanName, inputsHash, config.KEYNAME_STAGE_FAILED)
             return False, optimizeValue, timeTaken
         
         # Step 3 - Optimize
         if optSteps:
             optimizeStatus, optimizeValue = helpers.optimizePlan(newPlanName, optSteps, reset=optReset, pathIsoDoseXML=pathIsoDoseXML)
             if optimizeStatus:
-                _ = helpers.rayStationSave()
+                _ = helpers.rayStationSave(commit=True)
         else:
             optimizeStatus, optimizeValue = True, -1
 
         timeTaken = round(time.time() - t0, 2)
+        helpers.updateStageLedger(pathPatient, newPlanName, inputsHash, config.KEYNAME_STAGE_DONE if optimizeStatus else config.KEYNAME_STAGE_FAILED, optimizeValue, timeTaken, objTrajectory=helpers.getOptimizationTrajectory(newPlanName))
         print (f' \n\n ===================== end for {newPlanName} (in {timeTaken} s) ===================== \n\n')
         return optimizeStatus, optimizeValue, timeTaken
     
@@ -1018,11 +906,77 @@ def copyProtonPlanAndOptimize(basePlanName, newPlanName
         if DEBUG_PDB: pdb.set_trace()
 
     timeTaken = round(time.time() - t0, 2)
+    helpers.updateStageLedger(pathPatient, newPlanName, inputsHash, config.KEYNAME_STAGE_FAILED, optimizeValue, timeTaken)
     return False, optimizeValue, timeTaken
 
+# Func 3
+def getProtonPlanChainStages(planNameOG, planNamesChain, pathKNOObjectivesClassSolution, pathKNOObjectives, optStepsRe, pathIsoDoseXML, pathPatient, deps, debug=False, warmStartPlanName=None):
+    """
+    Params
+    ------
+    planNamesChain: List, plan names for the [class-solution, EUD, EUD2, final] stages (e.g. -R1, -R2, -R3, -R5)
+    deps: List, stage names that the class-solution stage depends on (e.g. auto-contouring)
+    warmStartPlanName: String, (optional) plan the class-solution stage may warm-start from (e.g. the clinical class-solution plan), see helpers.getWarmStartBasePlan()
+
+    Returns
+    -------
+    stages: Dict, {planName: helpers.getStage(...)}
+    """
+
+    # Step 1 - [pathObjectives, uploadObjectivesBool, updateObjectivesBool, forceObjectives, objectiveFType, optReset] for each stage
+    chainParams = [
+        [pathKNOObjectivesClassSolution, True, False, True, None, True]
+        , [pathKNOObjectives, False, True, False, config.KEY_FTYPE_MAXEUD, False]
+        , [pathKNOObjectives, False, True, False, config.KEY_FTYPE_MAXEUD, False]
+        , [pathKNOObjectives, False, True, False, None, False]
+    ]
+
+    # Step 2 - Make stages
+    def getStageFunc(basePlanName, newPlanName, pathObjectives, uploadObjectivesBool, updateObjectivesBool, forceObjectives, objectiveFType, optReset, stageWarmStartPlanName):
+        def stageFunc(stageResults):
+            planStatus, planValue, planTime = copyProtonPlanAndOptimize(basePlanName, newPlanName
+                                                , pathObjectives, uploadObjectivesBool=uploadObjectivesBool, updateObjectivesBool=updateObjectivesBool, forceObjectives=forceObjectives, objectiveFType=objectiveFType
+                                                , optSteps=optStepsRe, optReset=optReset, pathIsoDoseXML=pathIsoDoseXML, debug=debug, pathPatient=pathPatient, warmStartPlanName=stageWarmStartPlanName)
+            print (f' - [main] {newPlanName} status: ', planStatus)
+            return planStatus, (planValue, planTime)
+        return stageFunc
+
+    stages = {}
+    basePlanName, baseDeps, stageWarmStartPlanName = planNameOG, deps, warmStartPlanName
+    for newPlanName, stageParams in zip(planNamesChain, chainParams):
+        stageAfter = [stageWarmStartPlanName] if stageWarmStartPlanName is not None else []
+        stages[newPlanName] = helpers.getStage(getStageFunc(basePlanName, newPlanName, *stageParams, stageWarmStartPlanName), deps=baseDeps, after=stageAfter)
+        basePlanName, baseDeps, stageWarmStartPlanName = newPlanName, [newPlanName], None # only the class-solution stage can warm-start
+    
+    return stages
+
+# Func 4
+def getRobustEvaluationStages(stageName, planName, pathRobustTemplate, pathPatient, force, verbose=False, deps=[], after=[], saveScenarioDoses=False):
+    """
+    Returns
+    -------
+    stages: Dict, {stageName: RStation robust evaluation}, and for saveScenarioDoses, also {config.KEYNAME_STAGE_REPORT.format(stageName): robust template evaluation from the scenario dose store (usesRS=False)}
+    """
+
+    def stageFunc(stageResults):
+        robustStatus = robustEvaluation(planName, pathRobustTemplate, pathPatient, force=force, verbose=verbose, saveScenarioDoses=saveScenarioDoses, evaluateGoals=not saveScenarioDoses)
+        return robustStatus, None
+    
+    def reportStageFunc(stageResults):
+        pathRobustResultsSave = Path(pathPatient) / config.FILENAME_ROBUST_EVAL_RESULTS.format(planName)
+        robustTemplate = helpers.evaluateRobustTemplateFromStore(pathPatient, planName, pathRobustTemplate, pathRobustResultsSave)
+        return robustTemplate is not None, None
+
+    stages = {stageName: helpers.getStage(stageFunc, deps=deps, after=after)}
+    if saveScenarioDoses:
+        stages[config.KEYNAME_STAGE_REPORT.format(stageName)] = helpers.getStage(reportStageFunc, deps=[stageName], usesRS=False)
+    
+    return stages
+
 # Func 0
 def main(params):
 
+    mainStatus = 0
     try:
         tPatient = time.time()
         # Step 1.1 - Init patient details
@@ -1098,222 +1052,83 @@ def main(params):
                 print (f' - [main()] Patient {patientID} not found in RayStation')
                 return 0
 
-            ###################################
-            if contourTypeNow in [config.KEYNAME_CONTOUR_CLINICAL, config.KEYNAME_CONTOUR_AUTO]:
-                if contourTypeNow == config.KEYNAME_CONTOUR_CLINICAL:    
-                    print ('\n\n ------------------------- ')
-                    print ('  - Computing dose on clinical contours')
-                    print (' ------------------------- \n\n')
-                    classSolPlanStatus, classSolPlanValue, classSolPlanTime = copyProtonPlanAndOptimize(planNameOG, planNameCS
-                                                , pathKNOObjectivesClassSolution, uploadObjectivesBool=True, updateObjectivesBool=False, forceObjectives=True, objectiveFType=None
-                                                , optSteps=optStepsRe, optReset=True, pathIsoDoseXML=pathIsoDoseXML, debug=True)
-                    print (' - [main] classSolPlanStatus: ', classSolPlanStatus)
-                    if classSolPlanStatus:
-                        eudPlanStatus, eudPlanValue, eudPlanTime = copyProtonPlanAndOptimize(planNameCS, planNameEUD
-                                        , pathKNOObjectives, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_MAXEUD
-                                        , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=True)
-                        print (' - [main] eudPlanStatus: ', eudPlanStatus)
-                        if eudPlanStatus:
-                            eud2PlanStatus, eud2PlanValue, eud2PlanTime = copyProtonPlanAndOptimize(planNameEUD, planNameEUD2
-                                                , pathKNOObjectives, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_MAXEUD
-                                                , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=True)
-                            print (' - [main] eud2PlanStatus: ', eud2PlanStatus)
-                            if eud2PlanStatus:
-                                finalPlanStatus, finalPlanValue, finalPlanTime = copyProtonPlanAndOptimize(planNameEUD2, planNameFinal
-                                                    , pathKNOObjectives, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=None
-                                                    , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=True)
-                                print (' - [main] finalPlanStatus: ', finalPlanStatus)
-                                if finalPlanStatus:
-                                    robustEvaluation(planNameFinal, pathRobustTemplate, pathPatient, force=True)
-
-                elif contourTypeNow == config.KEYNAME_CONTOUR_AUTO:
-                    print ('\n\n ------------------------- ')
-                    print ('  - Computing dose on auto contours')
-                    print (' ------------------------- \n\n')
-                    autoContouringStatus, autoContouringTime = doAutoContouringForProton()
-                    print ('\n - [main] autoContouringStatus: ', autoContouringStatus)
-                    if autoContouringStatus:
-                        classSolPlanStatus, classSolPlanValue, classSolPlanTime = copyProtonPlanAndOptimize(planNameOG, planNameCSAuto
-                                                    , pathKNOObjectivesClassSolutionAuto, uploadObjectivesBool=True, updateObjectivesBool=False, forceObjectives=True, objectiveFType=None
-                                                    , optSteps=optStepsRe, optReset=True, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                        print (' - [main] classSolPlanStatus: ', classSolPlanStatus)
-                        if classSolPlanStatus:
-                            eudPlanStatus, eudPlanValue, eudPlanTime = copyProtonPlanAndOptimize(planNameCSAuto, planNameEUDAuto
-                                                , pathKNOObjectivesAuto, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_MAXEUD
-                                                , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                            print (' - [main] eudPlanStatus: ', eudPlanStatus)
-                            if eudPlanStatus:
-                                eud2PlanStatus, eud2PlanValue, eud2PlanTime = copyProtonPlanAndOptimize(planNameEUDAuto, planNameEUD2Auto
-                                                , pathKNOObjectivesAuto, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_MAXEUD
-                                                , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=True)
-                                print (' - [main] eud2PlanStatus: ', eud2PlanStatus)
-                                if eud2PlanStatus:
-                                    finalPlanStatus, finalPlanValue, finalPlanTime = copyProtonPlanAndOptimize(planNameEUD2Auto, planNameFinalAuto
-                                                        , pathKNOObjectivesAuto, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=None
-                                                        , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                                    print (' - [main] finalPlanStatus: ', finalPlanStatus)
-                                    if finalPlanStatus:
-                                        robustEvaluation(planNameFinalAuto, pathRobustTemplate, pathPatient, force=True)
+            ############## Step 3 - Declare stages
+            planNamesClinical = [planNameCS, planNameEUD, planNameEUD2, planNameFinal]
+            planNamesAuto     = [planNameCSAuto, planNameEUDAuto, planNameEUD2Auto, planNameFinalAuto]
+            plansForNTCP      = [planNameOG, planNameFinal, planNameFinalAuto]
+            stageRobustFinal     = config.KEYNAME_STAGE_ROBUST.format(planNameFinal)
+            stageRobustFinalAuto = config.KEYNAME_STAGE_ROBUST.format(planNameFinalAuto)
+            stageRobustOG        = config.KEYNAME_STAGE_ROBUST.format(planNameOG)
+            saveScenarioDoses    = params.get(config.KEYNAME_SAVE_SCENARIO_DOSES, False)
+
+            def autoContouringStageFunc(stageResults):
+                autoContouringStatus, autoContouringTime = doAutoContouringForProton()
+                print ('\n - [main] autoContouringStatus: ', autoContouringStatus)
+                return autoContouringStatus, autoContouringTime
             
-            elif contourTypeNow == config.KEYNAME_CONTOUR_ALL:
-                if 1:    
-                    print ('\n\n ------------------------- ')
-                    print ('  - Computing dose on clinical contours')
-                    print (' ------------------------- \n\n')
-                    classSolPlanStatus, classSolPlanValue, classSolPlanTime = copyProtonPlanAndOptimize(planNameOG, planNameCS
-                                                , pathKNOObjectivesClassSolution, uploadObjectivesBool=True, updateObjectivesBool=False, forceObjectives=True, objectiveFType=None
-                                                , optSteps=optStepsRe, optReset=True, pathIsoDoseXML=pathIsoDoseXML, debug=True)
-                    print (' - [main] classSolPlanStatus: ', classSolPlanStatus)
-                    if classSolPlanStatus:
-                        eudPlanStatus, eudPlanValue, eudPlanTime = copyProtonPlanAndOptimize(planNameCS, planNameEUD
-                                        , pathKNOObjectives, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_MAXEUD
-                                        , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=True)
-                        print (' - [main] eudPlanStatus: ', eudPlanStatus)
-                        if eudPlanStatus:
-                            eud2PlanStatus, eud2PlanValue, eud2PlanTime = copyProtonPlanAndOptimize(planNameEUD, planNameEUD2
-                                                , pathKNOObjectives, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_MAXEUD
-                                                , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=True)
-                            print (' - [main] eud2PlanStatus: ', eud2PlanStatus)
-                            if eud2PlanStatus:
-                                finalPlanStatus, finalPlanValue, finalPlanTime = copyProtonPlanAndOptimize(planNameEUD2, planNameFinal
-                                                    , pathKNOObjectives, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=None
-                                                    , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=True)
-                                print (' - [main] finalPlanStatus: ', finalPlanStatus)
-                                if finalPlanStatus:
-                                    robustEvaluation(planNameFinal, pathRobustTemplate, pathPatient, force=True)
-                                    robustEvaluation(planNameOG, pathRobustTemplate, pathPatient, force=False, verbose=True)
-                
-                if 1:
-                    print ('\n\n ------------------------- ')
-                    print ('  - Computing dose on auto contours')
-                    print (' ------------------------- \n\n')
-                    autoContouringStatus, autoContouringTime = doAutoContouringForProton()
-                    print ('\n - [main] autoContouringStatus: ', autoContouringStatus)
-                    if autoContouringStatus:
-                        classSolPlanStatus, classSolPlanValue, classSolPlanTime = copyProtonPlanAndOptimize(planNameOG, planNameCSAuto
-                                                    , pathKNOObjectivesClassSolutionAuto, uploadObjectivesBool=True, updateObjectivesBool=False, forceObjectives=True, objectiveFType=None
-                                                    , optSteps=optStepsRe, optReset=True, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                        print (' - [main] classSolPlanStatus: ', classSolPlanStatus)
-                        if classSolPlanStatus:
-                            eudPlanStatus, eudPlanValue, eudPlanTime = copyProtonPlanAndOptimize(planNameCSAuto, planNameEUDAuto
-                                                , pathKNOObjectivesAuto, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_MAXEUD
-                                                , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                            print (' - [main] eudPlanStatus: ', eudPlanStatus)
-                            if eudPlanStatus:
-                                eud2PlanStatus, eud2PlanValue, eud2PlanTime = copyProtonPlanAndOptimize(planNameEUDAuto, planNameEUD2Auto
-                                                , pathKNOObjectivesAuto, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_MAXEUD
-                                                , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=True)
-                                print (' - [main] eud2PlanStatus: ', eud2PlanStatus)
-                                if eud2PlanStatus:
-                                    finalPlanStatus, finalPlanValue, finalPlanTime = copyProtonPlanAndOptimize(planNameEUD2Auto, planNameFinalAuto
-                                                        , pathKNOObjectivesAuto, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=None
-                                                        , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                                    print (' - [main] finalPlanStatus: ', finalPlanStatus)
-                                    if finalPlanStatus:
-                                        robustEvaluation(planNameFinalAuto, pathRobustTemplate, pathPatient, force=True)
-
-                if 1:
-                    plansForNTCP = [planNameOG, planNameFinal, planNameFinalAuto]
-                    getNTCPVals(patientID, plansForNTCP, pathPatient)
+            def ntcpStageFunc(stageResults):
+                ntcpStatus = getNTCPVals(patientID, plansForNTCP, pathPatient, pathRegistry=params.get(config.KEYNAME_PATH_PATIENT_REGISTRY, None))
+                return ntcpStatus, None
+
+            stageAutoContour = helpers.getStage(autoContouringStageFunc)
+            stagesClinical   = {}
+            stagesAuto       = {}
+            if contourTypeNow != config.KEYNAME_CONTOUR_EVAL:
+                stagesClinical = getProtonPlanChainStages(planNameOG, planNamesClinical, pathKNOObjectivesClassSolution, pathKNOObjectives, optStepsRe, pathIsoDoseXML, pathPatient, deps=[], debug=True)
+                stagesAuto     = getProtonPlanChainStages(planNameOG, planNamesAuto, pathKNOObjectivesClassSolutionAuto, pathKNOObjectivesAuto, optStepsRe, pathIsoDoseXML, pathPatient, deps=[config.KEYNAME_STAGE_AUTOCONTOUR], debug=False
+                                                    , warmStartPlanName=planNamesClinical[0] if params.get(config.KEYNAME_WARM_START, False) else None)
+
+            # Step 3.1 - Pick stages for the contour type
+            stages = {}
+            if contourTypeNow == config.KEYNAME_CONTOUR_CLINICAL:
+                stages.update(stagesClinical)
+                stages.update(getRobustEvaluationStages(stageRobustFinal, planNameFinal, pathRobustTemplate, pathPatient, force=True, deps=[planNameFinal], saveScenarioDoses=saveScenarioDoses))
+
+            elif contourTypeNow == config.KEYNAME_CONTOUR_AUTO:
+                stages[config.KEYNAME_STAGE_AUTOCONTOUR] = stageAutoContour
+                stages.update(stagesAuto)
+                stages.update(getRobustEvaluationStages(stageRobustFinalAuto, planNameFinalAuto, pathRobustTemplate, pathPatient, force=True, deps=[planNameFinalAuto], saveScenarioDoses=saveScenarioDoses))
+
+            elif contourTypeNow in [config.KEYNAME_CONTOUR_ALL, config.KEYNAME_CONTOUR_DEBUG]:
+                stages.update(stagesClinical)
+                stages.update(getRobustEvaluationStages(stageRobustFinal, planNameFinal, pathRobustTemplate, pathPatient, force=True, deps=[planNameFinal], saveScenarioDoses=saveScenarioDoses))
+                stages.update(getRobustEvaluationStages(stageRobustOG, planNameOG, pathRobustTemplate, pathPatient, force=False, verbose=True, deps=[planNameFinal], after=[stageRobustFinal], saveScenarioDoses=saveScenarioDoses))
+                stages[config.KEYNAME_STAGE_AUTOCONTOUR] = stageAutoContour
+                stages.update(stagesAuto)
+                stages.update(getRobustEvaluationStages(stageRobustFinalAuto, planNameFinalAuto, pathRobustTemplate, pathPatient, force=True, deps=[planNameFinalAuto], saveScenarioDoses=saveScenarioDoses))
+                stagesDone = [stageRobustFinal, stageRobustOG, stageRobustFinalAuto] + planNamesClinical + planNamesAuto
+                stages[config.KEYNAME_STAGE_NTCP] = helpers.getStage(ntcpStageFunc, after=stagesDone)
+
+                # Step 3.2 - For debugging, only run the selected stages (deps outside of these are assumed to be present in RStation)
+                if contourTypeNow == config.KEYNAME_CONTOUR_DEBUG:
+                    debugStages = params.get(config.KEYNAME_DEBUG_STAGES, [config.KEYNAME_STAGE_AUTOCONTOUR])
+                    stages = {stageName: stages[stageName] for stageName in stages if stageName in debugStages or stageName in [config.KEYNAME_STAGE_REPORT.format(each) for each in debugStages]}
 
             elif contourTypeNow == config.KEYNAME_CONTOUR_EVAL:
-                robustEvaluation(planNameFinal, pathRobustTemplate, pathPatient, force=True, verbose=True)
-                robustEvaluation(planNameFinalAuto, pathRobustTemplate, pathPatient, force=True, verbose=True)
-                robustEvaluation(planNameOG, pathRobustTemplate, pathPatient, force=False, verbose=True)
+                stages.update(getRobustEvaluationStages(stageRobustFinal, planNameFinal, pathRobustTemplate, pathPatient, force=True, verbose=True, saveScenarioDoses=saveScenarioDoses))
+                stages.update(getRobustEvaluationStages(stageRobustFinalAuto, planNameFinalAuto, pathRobustTemplate, pathPatient, force=True, verbose=True, saveScenarioDoses=saveScenarioDoses))
+                stages.update(getRobustEvaluationStages(stageRobustOG, planNameOG, pathRobustTemplate, pathPatient, force=False, verbose=True, saveScenarioDoses=saveScenarioDoses))
 
-            elif contourTypeNow == config.KEYNAME_CONTOUR_DEBUG:
-                
-                # upload + auto-contouring
-                if 1:
-                    autoContouringStatus, autoContouringTime = doAutoContouringForProton()
-                    print ('\n - [main] autoContouringStatus: ', autoContouringStatus)
-
-                # From -R2 onwards
-                if 0:
-                    eudPlanStatus, eudPlanValue, eudPlanTime = copyProtonPlanAndOptimize(planNameCS, planNameEUD
-                                            , pathKNOObjectives, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_MAXEUD
-                                            , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=True)
-                    print (' - [main] eudPlanStatus: ', eudPlanStatus)
-                    if eudPlanStatus:
-                        eud2PlanStatus, eud2PlanValue, eud2PlanTime = copyProtonPlanAndOptimize(planNameEUD, planNameEUD2
-                                            , pathKNOObjectives, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_MAXEUD
-                                            , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=True)
-                        print (' - [main] eud2PlanStatus: ', eud2PlanStatus)
-                        if eud2PlanStatus:
-                            finalPlanStatus, finalPlanValue, finalPlanTime = copyProtonPlanAndOptimize(planNameEUD2, planNameFinal
-                                                , pathKNOObjectives, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=None
-                                                , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=True)
-                            print (' - [main] finalPlanStatus: ', finalPlanStatus)
-                            if finalPlanStatus:
-                                robustEvaluation(planNameFinal, pathRobustTemplate, pathPatient, force=True, verbose=True)
-
-                # From -R3 onwards
-                if 0:
-                    eud2PlanStatus, eud2PlanValue, eud2PlanTime = copyProtonPlanAndOptimize(planNameEUD, planNameEUD2
-                                            , pathKNOObjectives, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_MAXEUD
-                                            , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=True)
-                    print (' - [main] eud2PlanStatus: ', eud2PlanStatus)
-                    if eud2PlanStatus:
-                        finalPlanStatus, finalPlanValue, finalPlanTime = copyProtonPlanAndOptimize(planNameEUD2, planNameFinal
-                                            , pathKNOObjectives, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=None
-                                            , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=True)
-                        print (' - [main] finalPlanStatus: ', finalPlanStatus)
-                        if finalPlanStatus:
-                            robustEvaluation(planNameFinal, pathRobustTemplate, pathPatient, force=True, verbose=True)
-                
-                # From -R5 onwards
-                if 0:
-                    finalPlanStatus, finalPlanValue, finalPlanTime = copyProtonPlanAndOptimize(planNameEUD2, planNameFinal
-                                        , pathKNOObjectives, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=None
-                                        , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=True)
-                    print (' - [main] finalPlanStatus: ', finalPlanStatus)
-                    if finalPlanStatus:
-                        robustEvaluation(planNameFinal, pathRobustTemplate, pathPatient, force=True, verbose=True)
-                
-                # From -R3 onwards
-                if 0:
-                    eud2PlanStatus, eud2PlanValue, eud2PlanTime = copyProtonPlanAndOptimize(planNameEUDAuto, planNameEUD2Auto
-                                                , pathKNOObjectivesAuto, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=config.KEY_FTYPE_MAXEUD
-                                                , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=True)
-                    print (' - [main] eud2PlanStatus: ', eud2PlanStatus)
-                    if eud2PlanStatus:
-                        finalPlanStatus, finalPlanValue, finalPlanTime = copyProtonPlanAndOptimize(planNameEUD2Auto, planNameFinalAuto
-                                            , pathKNOObjectivesAuto, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=None
-                                            , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                        print (' - [main] finalPlanStatus: ', finalPlanStatus)
-                        if finalPlanStatus:
-                            robustEvaluation(planNameFinalAuto, pathRobustTemplate, pathPatient, force=True, verbose=True)
-
-                # From -A5 onwards
-                if 0:
-                    finalPlanStatus, finalPlanValue, finalPlanTime = copyProtonPlanAndOptimize(planNameEUD2Auto, planNameFinalAuto
-                                        , pathKNOObjectivesAuto, uploadObjectivesBool=False, updateObjectivesBool=True, forceObjectives=False, objectiveFType=None
-                                        , optSteps=optStepsRe, optReset=False, pathIsoDoseXML=pathIsoDoseXML, debug=False)
-                    print (' - [main] finalPlanStatus: ', finalPlanStatus)
-                    if finalPlanStatus:
-                        robustEvaluation(planNameFinalAuto, pathRobustTemplate, pathPatient, force=True, verbose=True)
-                
-                # For evaluation
-                if 0:
-                    # robustEvaluation(planNameFinal, force=True)
-                    # robustEvaluation(planNameFinalAuto, force=True)
-                    robustEvaluation(planNameOG, pathRobustTemplate, pathPatient, force=False, verbose=True)
-                
-                # For NTCP evaluation
-                if 0:
-                    plansForNTCP = [planNameOG, planNameFinal, planNameFinalAuto]
-                    getNTCPVals(patientID, plansForNTCP, pathPatient)
+            ############## Step 4 - Run stages
+            print (f' - [main] Running stages: {list(stages)}')
+            stageStatus, _ = helpers.runStageDAG(stages, maxWorkers=params.get(config.KEYNAME_MAX_WORKERS, 1))
+            print (f' - [main] Stage status: {stageStatus}')
+
+            mainStatus = int(all(stageStatus[stageName] is True for stageName in stageStatus))
 
         except:
             traceback.print_exc()
             if DEBUG_PDB: pdb.set_trace()
 
         print (f' \n\n ===================== end for {pathPatient} [{planNameOG}] (in {round(time.time() - tPatient, 2)} s) ===================== \n\n')
+        return mainStatus
 
     except:
         traceback.print_exc()
         if DEBUG_PDB: pdb.set_trace()
 
+    return 0
+
 ########################################################
 #                       PARAMS(S)                      #
 ########################################################
@@ -1341,6 +1156,7 @@ if __name__ == "__main__":
     pathKNOProtonsObjectivesClassSolution = Path(DIR_DATA).joinpath('assets', 'objective-template-proton-kno.xml')
     pathRobustEvalTemplate = Path(DIR_DATA).joinpath('assets', 'eval-template-proton-robust.json')
     pathIsoDoseXML = Path(DIR_DATA).joinpath('LUMC-Dose', '_tmp', 'isodose.xml'); # pathIsoDoseXML = None
+    pathPatientRegistry = Path(DIR_DATA).joinpath('assets', config.FILENAME_PATIENT_REGISTRY)
 
     ###################################################################################
     # Step 3 -  Specific patient paths (of data extracted from RTPACS)
@@ -1366,6 +1182,7 @@ if __name__ == "__main__":
         , config.KEYNAME_PATH_OBJECTIVES      : pathKNOProtonsbjectivesClinical
         , config.KEYNAME_PATH_ROBUST_TEMPLATE : pathRobustEvalTemplate
         , config.KEYNAME_PATH_ISODOSEXML      : pathIsoDoseXML
+        , config.KEYNAME_PATH_PATIENT_REGISTRY: pathPatientRegistry
         
         # Plan parameters
         , config.KEYNAME_CANCER_TYPE            : keynameCancerType
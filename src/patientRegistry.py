@@ -0,0 +1,115 @@
+"""
+Patient metadata registry (no RStation/pydicom needed), shared by hnDosePhotons.py, hnDoseProtons.py and hnDoseCohort.py
+It expects a .csv (e.g. assets/patient-registry.csv) with one row per patient and the columns
+    - PatientID          : e.g. HCAI-Dose-P1
+    - cancerType         : e.g. 1A OROFARKL (i.e. name of the clinical plan in RStation)
+    - tumorLocation      : ORAL_CAVITY / PHARYNX / LARYNX, empty = no NTCP (protons only, photon NTCP always uses PHARYNX, see hnDosePhotons.getNTCPVals())
+    - the optional columns of the PATIENT REGISTRY KEYS in config.py (treatmentType, baselineXerostomia, ...)
+
+The file is read once per process (and again only if it changes on disk), after which lookups by PatientID are dict lookups.
+"""
+
+# Import private modules
+import hnDoseConfig as config
+
+# Import public modules
+import os
+import csv
+import logging
+import threading
+import traceback
+from pathlib import Path
+from distutils.util import strtobool
+
+def print(*args, **kwargs):
+    logging.info(" ".join(map(str, args)), **kwargs)
+
+##########################################################################################
+#                                    PATIENT REGISTRY                                    #
+##########################################################################################
+
+PATH_PATIENT_REGISTRY_DEFAULT = Path(__file__).parent.parent.joinpath('assets', config.FILENAME_PATIENT_REGISTRY)
+PATIENT_REGISTRIES = {} # {str(pathRegistry): (mtime, {patientID: row})}
+LOCK_PATIENT_REGISTRY = threading.Lock()
+
+def getPatientRegistryRow(row):
+    """
+    Validates a registry row and fills in the defaults of the optional columns
+
+    Returns
+    -------
+    row: Dict, or None if a value is not valid
+    """
+
+    patientID = row[config.KEY_PATIENTID]
+    for keyname, default in config.PATIENT_REGISTRY_DEFAULTS.items():
+        value = row.get(keyname, '')
+        if not len(value):
+            row[keyname] = default
+        elif keyname in config.PATIENT_REGISTRY_BOOLS:
+            try:
+                row[keyname] = bool(strtobool(value))
+            except ValueError:
+                print (f' - [getPatientRegistryRow()] Invalid {keyname}={value} for {patientID}')
+                return None
+        elif value.upper() in config.PATIENT_REGISTRY_ENUMS[keyname]:
+            row[keyname] = value.upper()
+        else:
+            print (f' - [getPatientRegistryRow()] Invalid {keyname}={value} for {patientID} (expected one of {config.PATIENT_REGISTRY_ENUMS[keyname]})')
+            return None
+    
+    return row
+
+def getPatientRegistry(pathRegistry=None):
+    """
+    Params
+    ------
+    pathRegistry: Path, .csv file with the columns mentioned in the docstring of this script (defaults to assets/patient-registry.csv)
+
+    Returns
+    -------
+    registry: Dict, {patientID: row}
+    """
+
+    registry = {}
+    try:
+
+        pathRegistry = Path(pathRegistry or PATH_PATIENT_REGISTRY_DEFAULT)
+        if not pathRegistry.exists():
+            print (f' - [getPatientRegistry()] No patient registry at {pathRegistry}')
+            return registry
+        
+        with LOCK_PATIENT_REGISTRY:
+
+            # Step 1 - Reuse the registry already read by this process
+            mtime = os.stat(str(pathRegistry)).st_mtime
+            if str(pathRegistry) in PATIENT_REGISTRIES and PATIENT_REGISTRIES[str(pathRegistry)][0] == mtime:
+                return PATIENT_REGISTRIES[str(pathRegistry)][1]
+
+            # Step 2 - Read and validate rows
+            with open(str(pathRegistry), 'r', newline='') as fp:
+                reader = csv.DictReader(fp)
+                for row in reader:
+                    row = {key.strip(): str(val).strip() for key, val in row.items() if key is not None and val is not None}
+                    if not len(row.get(config.KEY_PATIENTID, '')):
+                        continue
+                    if row[config.KEY_PATIENTID] in registry:
+                        print (f' - [getPatientRegistry()] Duplicate {row[config.KEY_PATIENTID]} in {pathRegistry.name}, keeping the first row')
+                        continue
+                    row = getPatientRegistryRow(row)
+                    if row is not None:
+                        registry[row[config.KEY_PATIENTID]] = row
+            
+            PATIENT_REGISTRIES[str(pathRegistry)] = (mtime, registry)
+            print (f' - [getPatientRegistry()] Found {len(registry)} patients in {pathRegistry}')
+
+    except:
+        traceback.print_exc()
+
+    return registry
+
+def getPatientInfo(patientID, pathRegistry=None):
+    """
+    Returns the registry row of a patient, or None if the patient is not in the registry
+    """
+    return getPatientRegistry(pathRegistry).get(patientID, None)